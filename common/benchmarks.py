@@ -0,0 +1,135 @@
+"""Micro-benchmarks for the hot paths in common.
+
+Run with `python -m common.benchmarks`. Each benchmark prints the time per call of the
+current implementation next to the one it replaced.
+"""
+
+import timeit
+from dataclasses import asdict, dataclass
+
+import numpy as np
+
+from . import codec, utils
+
+
+@dataclass
+class LegacyVelocityVector:
+    """VelocityVector as it was before it was backed by an array, for comparison"""
+
+    x: float = 0.0
+    y: float = 0.0
+    z: float = 0.0
+    yaw: float = 0.0
+    pitch: float = 0.0
+    roll: float = 0.0
+
+    def __init__(self, vals: dict[str, float] | None = None):
+        if vals is not None:
+            for key, value in vals.items():
+                setattr(self, key, value)
+
+    def __getitem__(self, key):
+        return asdict(self)[key]
+
+    def keys(self):
+        """Return keys."""
+        return asdict(self).keys()
+
+    def to_dict(self):
+        """Return dict representation. Rounds values to 3 decimal places."""
+        return {k: round(v, 3) for k, v in asdict(self).items()}
+
+
+def time_per_call(stmt, number: int = 20000) -> float:
+    """best time (us) per call of stmt over 5 runs"""
+    return min(timeit.repeat(stmt, number=number, repeat=5)) / number * 1e6
+
+
+def report(name: str, legacy: float, current: float):
+    """print one comparison line"""
+    print(f"{name:<40} {legacy:9.3f} us {current:9.3f} us {legacy / current:7.1f}x")
+
+
+def bench_velocity_vector():
+    """indexing, the control loop's PID pass, construction from a message and encoding"""
+    msg = dict(zip(utils.VelocityVector.FIELDS, [0.1, 0.2, 0.3, 0.4, 0.5, 0.6]))
+    legacy = LegacyVelocityVector(msg)
+    current = utils.VelocityVector(msg)
+
+    def pid_pass(vector_cls, target):
+        # what the control loop does per tick: one read per axis of the target and current
+        # velocity and one write per axis of the output
+        measured = vector_cls()
+        output = vector_cls()
+        for axis in target.keys():
+            setattr(output, axis, target[axis] - measured[axis])
+        return output
+
+    report("getitem", time_per_call(lambda: legacy["yaw"]), time_per_call(lambda: current["yaw"]))
+    report(
+        "pid pass (12 reads, 6 writes)",
+        time_per_call(lambda: pid_pass(LegacyVelocityVector, legacy)),
+        time_per_call(lambda: pid_pass(utils.VelocityVector, current)),
+    )
+    report(
+        "construct from decoded message",
+        time_per_call(lambda: LegacyVelocityVector(msg)),
+        time_per_call(lambda: utils.VelocityVector(msg)),
+    )
+    report(
+        "encode target_velocity frame",
+        time_per_call(lambda: codec.encode(codec.TARGET_VELOCITY, legacy)),
+        time_per_call(lambda: codec.encode(codec.TARGET_VELOCITY, current)),
+    )
+    report("to_dict", time_per_call(legacy.to_dict), time_per_call(current.to_dict))
+
+
+def bench_pid():
+    """one control loop tick of PID on the six velocity axes, and on more for hold loops"""
+    for n in (6, 12, 48):
+        controllers = [utils.PIDController(kp=1.0, ki=0.1, kd=0.01) for _ in range(n)]
+        bank = utils.PIDBank(n, kp=1.0, ki=0.1, kd=0.01)
+        error = np.linspace(-0.5, 0.5, n)
+        errors = error.tolist()
+
+        def update_each():
+            return [c.update(e, 0.01) for c, e in zip(controllers, errors)]
+
+        report(
+            f"pid update, {n} axes",
+            time_per_call(update_each),
+            time_per_call(lambda: bank.update(error, 0.01)),
+        )
+
+
+def bench_slew():
+    """slew limiting the allocator output with 8 and with 16 thrusters"""
+    for n in (8, 16):
+        names = [f"thruster_{i}" for i in range(n)]
+        limiters = {name: utils.SlewRateLimiter(max_rate=1.5, initial_value=0.0) for name in names}
+        bank = utils.SlewRateLimiterBank(n, max_rate_up=1.5)
+        thrust = np.linspace(-1, 1, n)
+        mix = dict(zip(names, thrust.tolist()))
+
+        def update_each():
+            # as the control loop did: one dict lookup and update per thruster
+            return {name: limiters[name].update(value, 0.01) for name, value in mix.items()}
+
+        report(
+            f"slew limit, {n} thrusters",
+            time_per_call(update_each),
+            time_per_call(lambda: bank.update(thrust, 0.01)),
+        )
+
+
+BENCHMARKS = {
+    "velocity_vector": bench_velocity_vector,
+    "pid": bench_pid,
+    "slew": bench_slew,
+}
+
+
+if __name__ == "__main__":
+    print(f"{'benchmark':<40} {'before':>12} {'after':>12} {'speedup':>8}")
+    for benchmark in BENCHMARKS.values():
+        benchmark()
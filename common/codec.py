@@ -0,0 +1,357 @@
+"""Binary wire format shared by the pi server, the pi sensor scripts and the surface clients.
+
+Every message on a socket is one frame: a 3 byte header holding the payload length (uint16)
+and the topic id (uint8), followed by the payload. Each topic has a fixed little-endian
+layout, so a message can never be split or merged with its neighbours by the stream, and a
+100 Hz command costs a single struct.pack instead of two json.dumps calls.
+"""
+
+import asyncio
+import struct
+
+TARGET_VELOCITY = "target_velocity"
+CLAW_MOVEMENT = "claw_movement"
+STATUS_FLAGS = "status_flags"
+IMU_DATA = "imu_data"
+DEPTH = "depth"
+ESTOP = "estop"
+HELLO = "hello"
+DELTA = "delta"
+WELCOME = "welcome"
+
+PROTOCOL_VERSION = 3  # bump on any incompatible change to the layouts below
+
+HEADER = struct.Struct("<HB")  # payload length, topic id
+DATAGRAM_HEADER = struct.Struct("<Id")  # sequence number, send time (time.time())
+
+
+class CodecError(ValueError):
+    """Raised when a frame or payload cannot be encoded or decoded."""
+
+
+class Layout:
+    """Fixed binary layout of a topic's payload.
+
+    Fields are key paths into the (possibly nested) dict that represents the message, e.g.
+    ("acceleration", "x") for imu_data. A layout without fields packs a single scalar.
+    Objects whose FIELDS attribute lists the layout's field names in order, such as
+    VelocityVector, are packed straight from their values() without a lookup per field.
+    """
+
+    def __init__(self, topic_id: int, fmt: str, fields: tuple[tuple[str, ...], ...] = ()):
+        """
+        Args:
+            topic_id (int): id written in the frame header
+            fmt (str): struct format of the payload, without byte order
+            fields (tuple): key path of every value in fmt, in order
+        """
+        self.topic_id = topic_id
+        self.struct = struct.Struct("<" + fmt)
+        self.fields = fields
+        self.field_formats = _expand(fmt)  # one struct code per field
+        # field names of a flat layout, for the values() fast path
+        self.names = tuple(path[0] for path in fields) if all(
+            len(path) == 1 for path in fields
+        ) else None
+
+    def flatten(self, value) -> list:
+        """Return the values of a message in field order."""
+        if not self.fields:
+            return [value]
+        if self.names is not None and getattr(value, "FIELDS", None) == self.names:
+            return value.values()
+        values = []
+        for path in self.fields:
+            item = value
+            for key in path:
+                item = item[key]
+            values.append(item)
+        return values
+
+    def unflatten(self, values) -> object:
+        """Build a message from its values in field order."""
+        if not self.fields:
+            return values[0]
+        msg = {}
+        for path, item in zip(self.fields, values):
+            node = msg
+            for key in path[:-1]:
+                node = node.setdefault(key, {})
+            node[path[-1]] = item
+        return msg
+
+    def pack(self, value) -> bytes:
+        """Pack a message into its payload."""
+        return self.struct.pack(*self.flatten(value))
+
+    def unpack(self, payload: bytes):
+        """Unpack a payload back into a message."""
+        return self.unflatten(self.struct.unpack(payload))
+
+
+def _expand(fmt: str) -> list[str]:
+    """expand a struct format such as "3f?" into one code per field: ["f", "f", "f", "?"]"""
+    codes = []
+    count = ""
+    for char in fmt:
+        if char.isdigit():
+            count += char
+        else:
+            codes.extend([char] * int(count or 1))
+            count = ""
+    return codes
+
+
+class HelloLayout:
+    """Variable layout of the hello message a client sends after the server's welcome.
+
+    The message is a dict with "version", the client's protocol version, "publish_rate", the
+    rate (Hz) the client decided to publish at, "publishes", the list of topics the client
+    sends, "subscribes", a dict of topic: rate (Hz) the client wants to receive, and
+    optionally "delta", the subscribed topics the client wants as keyframes plus deltas. On
+    the wire it is the version and rate, a count followed by topic ids, then a count followed
+    by (topic id, float32 rate, flags) triples.
+    """
+
+    _head = struct.Struct("<Hf")  # protocol version, publish rate
+    _count = struct.Struct("<B")
+    _subscription = struct.Struct("<BfB")
+    _FLAG_DELTA = 0x01
+
+    def __init__(self, topic_id: int):
+        self.topic_id = topic_id
+
+    def pack(self, value: dict) -> bytes:
+        """Pack a hello message into its payload."""
+        publishes = value.get("publishes", ())
+        subscribes = value.get("subscribes", {})
+        delta = value.get("delta", ())
+        version = value.get("version", PROTOCOL_VERSION)
+        parts = [
+            self._head.pack(version, value.get("publish_rate", 0.0)),
+            self._count.pack(len(publishes)),
+        ]
+        parts.extend(self._count.pack(LAYOUTS[topic].topic_id) for topic in publishes)
+        parts.append(self._count.pack(len(subscribes)))
+        parts.extend(
+            self._subscription.pack(
+                LAYOUTS[topic].topic_id, rate, self._FLAG_DELTA if topic in delta else 0
+            )
+            for topic, rate in subscribes.items()
+        )
+        return b"".join(parts)
+
+    def unpack(self, payload: bytes) -> dict:
+        """Unpack a payload back into a hello message."""
+        version, publish_rate = self._head.unpack_from(payload)
+        offset = self._head.size
+        (num_publishes,) = self._count.unpack_from(payload, offset)
+        offset += self._count.size
+        topic_ids = payload[offset:offset + num_publishes]
+        publishes = [_TOPICS_BY_ID[topic_id] for topic_id in topic_ids]
+        offset += num_publishes
+        (num_subscribes,) = self._count.unpack_from(payload, offset)
+        offset += self._count.size
+        subscribes = {}
+        delta = []
+        for _ in range(num_subscribes):
+            topic_id, rate, flags = self._subscription.unpack_from(payload, offset)
+            offset += self._subscription.size
+            subscribes[_TOPICS_BY_ID[topic_id]] = rate
+            if flags & self._FLAG_DELTA:
+                delta.append(_TOPICS_BY_ID[topic_id])
+        if offset != len(payload):
+            raise struct.error("trailing bytes")
+        return {
+            "version": version,
+            "publish_rate": publish_rate,
+            "publishes": publishes,
+            "subscribes": subscribes,
+            "delta": delta,
+        }
+
+
+class DeltaLayout:
+    """Variable layout of a delta: the fields of a topic that changed since the last frame.
+
+    The message is a tuple of (topic, {field index: value}). On the wire it is the topic id, a
+    uint32 bit mask of the changed fields, then the changed values in that topic's field
+    formats. A delta only makes sense on top of a full frame of the same topic.
+    """
+
+    _head = struct.Struct("<BI")  # topic id, changed field mask
+
+    def __init__(self, topic_id: int):
+        self.topic_id = topic_id
+
+    def pack(self, value: tuple) -> bytes:
+        """Pack a delta into its payload."""
+        topic, changes = value
+        layout = LAYOUTS[topic]
+        indices = sorted(changes)
+        mask = 0
+        for i in indices:
+            mask |= 1 << i
+        fmt = "<" + "".join(layout.field_formats[i] for i in indices)
+        return self._head.pack(layout.topic_id, mask) + struct.pack(
+            fmt, *(changes[i] for i in indices)
+        )
+
+    def unpack(self, payload: bytes) -> tuple:
+        """Unpack a payload back into a delta."""
+        topic_id, mask = self._head.unpack_from(payload)
+        topic = _TOPICS_BY_ID[topic_id]
+        layout = LAYOUTS[topic]
+        indices = [i for i in range(len(layout.field_formats)) if mask & (1 << i)]
+        fmt = "<" + "".join(layout.field_formats[i] for i in indices)
+        values = struct.unpack(fmt, payload[self._head.size:])
+        return topic, dict(zip(indices, values))
+
+
+def _xyz(name: str) -> tuple[tuple[str, str], ...]:
+    return ((name, "x"), (name, "y"), (name, "z"))
+
+
+LAYOUTS: dict[str, Layout] = {
+    TARGET_VELOCITY: Layout(
+        1, "6f", (("x",), ("y",), ("z",), ("yaw",), ("pitch",), ("roll",))
+    ),
+    CLAW_MOVEMENT: Layout(
+        2,
+        "6f",
+        (
+            ("extend",),
+            ("rotate",),
+            ("close_main",),
+            ("close_side",),
+            ("sample",),
+            ("camera_servo",),
+        ),
+    ),
+    STATUS_FLAGS: Layout(3, "?f?", (("agnes_mode",), ("agnes_factor",), ("auto_depth",))),
+    IMU_DATA: Layout(
+        4,
+        "13f",
+        _xyz("acceleration")
+        + _xyz("velocity")
+        + _xyz("magnetometer")
+        + (
+            ("game_quaternion", "i"),
+            ("game_quaternion", "j"),
+            ("game_quaternion", "k"),
+            ("game_quaternion", "real"),
+        ),
+    ),
+    # filtered depth (m, positive down) and its rate (m/s, positive going deeper)
+    DEPTH: Layout(5, "2f", (("depth",), ("rate",))),
+    # True stops every thruster and linear actuator until a False is received
+    ESTOP: Layout(6, "?"),
+    # handshake and control messages
+    HELLO: HelloLayout(16),
+    DELTA: DeltaLayout(17),
+    # sent by the server as soon as a client connects
+    WELCOME: Layout(
+        18, "Hff", (("version",), ("control_loop_freq",), ("command_timeout",))
+    ),
+}
+
+_TOPICS_BY_ID = {layout.topic_id: topic for topic, layout in LAYOUTS.items()}
+
+
+def encode(topic: str, value) -> bytes:
+    """Encode a message into a complete frame.
+
+    Args:
+        topic (str): one of the topic names in LAYOUTS
+        value: message; a dict (or anything indexable by key) for structured topics
+    Returns:
+        bytes: header and payload, ready to be written to a socket
+    """
+    try:
+        layout = LAYOUTS[topic]
+    except KeyError as e:
+        raise CodecError(f"unknown topic: {topic}") from e
+    try:
+        payload = layout.pack(value)
+    except (KeyError, TypeError, ValueError, AttributeError, struct.error) as e:
+        raise CodecError(f"cannot encode {topic}: {e}") from e
+    return HEADER.pack(len(payload), layout.topic_id) + payload
+
+
+def decode(topic_id: int, payload: bytes) -> tuple[str, object]:
+    """Decode the payload of a frame.
+
+    Args:
+        topic_id (int): topic id from the frame header
+        payload (bytes): payload of the frame
+    Returns:
+        tuple[str, object]: topic name and message
+    """
+    if topic_id not in _TOPICS_BY_ID:
+        raise CodecError(f"unknown topic id: {topic_id}")
+    topic = _TOPICS_BY_ID[topic_id]
+    try:
+        return topic, LAYOUTS[topic].unpack(payload)
+    except (KeyError, IndexError, struct.error) as e:
+        raise CodecError(f"bad {topic} payload of {len(payload)} bytes") from e
+
+
+async def read_frame(reader: asyncio.StreamReader) -> tuple[str, object]:
+    """Read and decode exactly one frame from a stream.
+
+    The whole frame is consumed before decoding, so a CodecError leaves the stream aligned on
+    the next frame. Raises asyncio.IncompleteReadError when the peer disconnects.
+    """
+    length, topic_id = HEADER.unpack(await reader.readexactly(HEADER.size))
+    payload = await reader.readexactly(length)
+    return decode(topic_id, payload)
+
+
+def recv_frame(sock) -> tuple[str, object]:
+    """Blocking counterpart of read_frame for plain sockets.
+
+    Raises ConnectionError when the peer disconnects.
+    """
+
+    def recv_exactly(size: int) -> bytes:
+        data = b""
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("connection closed")
+            data += chunk
+        return data
+
+    length, topic_id = HEADER.unpack(recv_exactly(HEADER.size))
+    return decode(topic_id, recv_exactly(length))
+
+
+def encode_datagram(topic: str, value, seq: int, sent_at: float) -> bytes:
+    """Encode a message into a datagram: a sequence number and send time, then one frame.
+
+    Args:
+        topic (str): one of the topic names in LAYOUTS
+        value: message
+        seq (int): sequence number, wraps at 2**32
+        sent_at (float): time.time() when the message was sent
+    Returns:
+        bytes: datagram, ready to be sent over UDP
+    """
+    return DATAGRAM_HEADER.pack(seq & 0xFFFFFFFF, sent_at) + encode(topic, value)
+
+
+def decode_datagram(data: bytes) -> tuple[int, float, str, object]:
+    """Decode a datagram made by encode_datagram.
+
+    Returns:
+        tuple[int, float, str, object]: sequence number, send time, topic and message
+    """
+    if len(data) < DATAGRAM_HEADER.size + HEADER.size:
+        raise CodecError(f"datagram too short: {len(data)} bytes")
+    seq, sent_at = DATAGRAM_HEADER.unpack_from(data)
+    length, topic_id = HEADER.unpack_from(data, DATAGRAM_HEADER.size)
+    payload = data[DATAGRAM_HEADER.size + HEADER.size:]
+    if len(payload) != length:
+        raise CodecError(f"datagram payload is {len(payload)} bytes, header says {length}")
+    topic, msg = decode(topic_id, payload)
+    return seq, sent_at, topic, msg
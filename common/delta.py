@@ -0,0 +1,109 @@
+"""Keyframe plus delta encoding of telemetry topics.
+
+A DeltaEncoder sends a full frame of its topic periodically (a keyframe) and, in between,
+only the fields that moved by more than their threshold since they were last sent. A
+DeltaDecoder on the receiving side rebuilds the full message from keyframes and deltas.
+"""
+
+from . import codec
+
+
+class DeltaEncoder:
+    """Encodes one topic as keyframes and deltas."""
+
+    def __init__(self, topic: str, thresholds: float | dict[str, float] = 0.0,
+                 keyframe_period: float = 1.0):
+        """
+        Args:
+            topic (str): topic name
+            thresholds (float | dict[str, float]): minimum change for a float field to be
+                resent. Either one value for every field, or a dict keyed by field path
+                ("acceleration.x") or by group ("acceleration"). Missing fields use 0.
+            keyframe_period (float): seconds between full frames
+        """
+        self.topic = topic
+        self.layout = codec.LAYOUTS[topic]
+        self.keyframe_period = keyframe_period
+        self._thresholds = [
+            self._threshold(thresholds, i) for i in range(len(self.layout.field_formats))
+        ]
+        self._sent: list | None = None  # values as last sent to the receiver
+        self._last_keyframe = 0.0
+        self.keyframes = 0
+        self.deltas = 0
+        self.unchanged = 0
+
+    def _threshold(self, thresholds: float | dict[str, float], index: int) -> float:
+        if not isinstance(thresholds, dict):
+            return thresholds
+        if not self.layout.fields:
+            return thresholds.get("", 0.0)
+        path = self.layout.fields[index]
+        return thresholds.get(".".join(path), thresholds.get(path[0], 0.0))
+
+    def force_keyframe(self):
+        """make the next encode() send a full frame, e.g. for a new subscriber"""
+        self._sent = None
+
+    def encode(self, value, now: float) -> bytes | None:
+        """Encode the current value of the topic.
+        Args:
+            value: current message
+            now (float): current time (s)
+        Returns:
+            bytes | None: a keyframe, a delta, or None if nothing moved past its threshold
+        """
+        values = self.layout.flatten(value)
+        if self._sent is None or now - self._last_keyframe >= self.keyframe_period:
+            self._sent = values
+            self._last_keyframe = now
+            self.keyframes += 1
+            return codec.encode(self.topic, value)
+
+        changes = {}
+        for i, (new, old) in enumerate(zip(values, self._sent)):
+            if isinstance(new, bool) or isinstance(old, bool):
+                moved = new != old
+            else:
+                moved = abs(new - old) > self._thresholds[i]
+            if moved:
+                changes[i] = new
+        if not changes:
+            self.unchanged += 1
+            return None
+        for i, new in changes.items():
+            self._sent[i] = new
+        self.deltas += 1
+        return codec.encode(codec.DELTA, (self.topic, changes))
+
+
+class DeltaDecoder:
+    """Rebuilds full messages from keyframes and deltas of any number of topics."""
+
+    def __init__(self):
+        self._state: dict[str, list] = {}  # topic: values in field order
+
+    def apply(self, topic: str, msg) -> tuple[str, object, bool] | None:
+        """Apply a received frame.
+        Args:
+            topic (str): topic of the frame, possibly codec.DELTA
+            msg: decoded message of the frame
+        Returns:
+            tuple[str, object, bool] | None: topic, full message and whether any value
+                changed, or None for a delta that arrived before its first keyframe
+        """
+        if topic == codec.DELTA:
+            topic, changes = msg
+            values = self._state.get(topic)
+            if values is None:
+                return None
+            changed = False
+            for i, new in changes.items():
+                changed = changed or values[i] != new
+                values[i] = new
+            return topic, codec.LAYOUTS[topic].unflatten(values), changed
+
+        values = codec.LAYOUTS[topic].flatten(msg)
+        changed = values != self._state.get(topic)
+        self._state[topic] = values
+        return topic, msg, changed
@@ -0,0 +1,161 @@
+"""Non-blocking logging shared by the pi and the surface.
+
+Log calls made from the event loop only filter the record and put it on a queue. A
+background thread formats and writes it, so slow stdout never stalls the control or I/O
+loops. Only a record with an argument that the caller could change after the call (a dict,
+list or other object) is formatted on the calling thread, so that it logs the value at the
+time of the call. High rate messages opt in to rate limiting or sampling per call:
+
+    logger = logging.getLogger(__name__)
+    logger.debug("thruster mix %s", mix, extra=log.sample(10))  # 1 in 10
+    logger.warning("loop took too long", extra=log.every(1.0))  # at most once a second
+
+Per-subsystem levels are set with setup(levels=...) or the ROV_LOG_LEVELS environment
+variable, e.g. ROV_LOG_LEVELS="pi.rov_state=DEBUG,surface.xgui=WARNING".
+"""
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+
+FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+# argument types that can be formatted later on the writer thread, as they cannot change
+IMMUTABLE = (str, int, float, bytes, type(None))
+
+logger = logging.getLogger(__name__)
+_listener: logging.handlers.QueueListener | None = None
+_queue_handler: logging.Handler | None = None
+
+
+def every(period: float) -> dict:
+    """extra= for a log call that is emitted at most once per period (s)"""
+    return {"rate_limit": period}
+
+
+def sample(n: int) -> dict:
+    """extra= for a log call that is emitted once every n calls"""
+    return {"sample": n}
+
+
+class ThrottleFilter(logging.Filter):
+    """Drops records that ask for rate limiting or sampling and are not due.
+
+    Records are grouped by logger and call site format string, so messages that differ only
+    in their arguments share a budget. The number of records dropped since the last emitted
+    one is appended to its message.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._last_emit: dict[tuple[str, str], float] = {}  # key: time.monotonic()
+        self._calls: dict[tuple[str, str], int] = {}  # key: calls since the last emit
+        self.suppressed = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        period = getattr(record, "rate_limit", None)
+        n = getattr(record, "sample", None)
+        if period is None and n is None:
+            return True
+        key = (record.name, str(record.msg))
+        calls = self._calls.get(key, 0) + 1
+        if period is not None:
+            now = time.monotonic()
+            due = now - self._last_emit.get(key, -period) >= period
+            if due:
+                self._last_emit[key] = now
+        else:
+            due = calls >= n or key not in self._calls
+        if not due:
+            self._calls[key] = calls
+            self.suppressed += 1
+            return False
+        self._calls[key] = 0
+        if calls > 1:
+            record.msg = f"{record.msg} ({calls - 1} suppressed)"
+        return True
+
+
+def _immutable(value) -> bool:
+    """whether a log argument is safe to format later, on another thread"""
+    if isinstance(value, tuple):
+        return all(_immutable(item) for item in value)
+    return isinstance(value, IMMUTABLE)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """queue handler that leaves formatting to the listener thread"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if not isinstance(record.msg, str) or not _immutable(record.args or ()):
+            # resolve the arguments now, they may be mutated by the caller after it returns
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+def parse_levels(spec: str) -> dict[str, int]:
+    """Parse "name=LEVEL,name=LEVEL" into {name: level}. A pair that is not a logger name
+    and a level name is skipped with a warning, so a typo does not stop the process.
+    Args:
+        spec (str): comma separated logger=level pairs
+    Returns:
+        dict[str, int]: logging level per logger name
+    """
+    levels = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, level = item.partition("=")
+        value = logging.getLevelName(level.strip().upper())
+        if not name.strip() or not isinstance(value, int):
+            logger.warning("ignoring log level %r: expected logger=LEVEL", item.strip())
+            continue
+        levels[name.strip()] = value
+    return levels
+
+
+def setup(level: int = logging.INFO, levels: dict[str, int] | None = None, stream=None):
+    """Route all logging through a queue to a background writer thread.
+    Safe to call more than once; later calls only update the levels.
+    Args:
+        level (int): root level
+        levels (dict[str, int]): level per subsystem (logger name), overridden by the
+            ROV_LOG_LEVELS environment variable
+        stream: where to write, stdout by default
+    """
+    global _listener, _queue_handler  # pylint: disable=global-statement
+    root = logging.getLogger()
+    root.setLevel(level)
+    levels = dict(levels or {})
+    levels.update(parse_levels(os.environ.get("ROV_LOG_LEVELS", "")))
+    for name, subsystem_level in levels.items():
+        logging.getLogger(name).setLevel(subsystem_level)
+    if _listener is not None:
+        return
+
+    log_queue = queue.SimpleQueue()
+    _queue_handler = _QueueHandler(log_queue)
+    _queue_handler.addFilter(ThrottleFilter())
+    stream_handler = logging.StreamHandler(stream or sys.stdout)
+    stream_handler.setFormatter(logging.Formatter(FORMAT))
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    _listener.start()
+    atexit.register(shutdown)
+
+
+def shutdown():
+    """Write out every queued record and stop the writer thread."""
+    global _listener, _queue_handler  # pylint: disable=global-statement
+    if _listener is None:
+        return
+    logging.getLogger().removeHandler(_queue_handler)
+    _listener.stop()
+    _listener = None
+    _queue_handler = None
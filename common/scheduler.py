@@ -0,0 +1,166 @@
+"""Deadline-driven periodic scheduling for the control, send and GUI loops.
+
+Deadlines are kept on a fixed grid of time.monotonic() values, so the loop rate never drifts
+with the time spent in the loop body. When the body overruns, the policy decides what
+happens to the deadlines that have passed: SKIP drops them and waits for the next grid
+point, CATCH_UP runs them back to back (up to max_catch_up of them, then restarts the grid).
+Wake-up jitter, execution time and overruns are kept in histograms that can be read at any
+time with stats().
+"""
+
+import asyncio
+import bisect
+import logging
+import time
+from typing import Callable
+
+from . import log
+
+SKIP = "skip"
+CATCH_UP = "catch_up"
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    """Counts of values (ms) in fixed buckets, cheap enough to update every tick."""
+
+    EDGES = (0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)  # ms, bucket upper edges
+
+    def __init__(self, edges: tuple[float, ...] = EDGES):
+        self.edges = edges
+        self.counts = [0] * (len(edges) + 1)  # the last bucket holds everything above edges
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value: float):
+        """add a value (ms)"""
+        self.counts[bisect.bisect_left(self.edges, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, q: float) -> float:
+        """Upper bound of the q-th percentile.
+        Args:
+            q (float): percentile in [0, 100]
+        Returns:
+            float: upper edge of the bucket holding the percentile, or the max if it is in
+                the last bucket. 0 if nothing was recorded.
+        """
+        if self.count == 0:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(self.edges[i], self.max) if i < len(self.edges) else self.max
+        return self.max
+
+    def stats(self) -> dict:
+        """Return count, mean, p50, p99 and max, plus the non-empty buckets by upper edge."""
+        buckets = {}
+        for i, count in enumerate(self.counts):
+            if count:
+                buckets[f"<={self.edges[i]:g}" if i < len(self.edges) else "more"] = count
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+            "max": self.max,
+            "buckets": buckets,
+        }
+
+
+class PeriodicScheduler:
+    """Runs a loop body at a fixed rate against monotonic deadlines.
+
+    Usage:
+        async for dt in scheduler.ticks():
+            ...  # dt is the time (s) since the previous tick started
+    """
+
+    def __init__(
+        self,
+        freq: float,
+        policy: str = SKIP,
+        max_catch_up: int = 5,
+        name: str = "loop",
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            freq (float): rate (Hz)
+            policy (str): SKIP or CATCH_UP, what to do with deadlines missed by an overrun
+            max_catch_up (int): with CATCH_UP, most missed ticks run back to back before the
+                grid is restarted from the current time
+            name (str): name used in log messages
+            clock (Callable): monotonic time source (s)
+        """
+        if policy not in (SKIP, CATCH_UP):
+            raise ValueError(f"unknown policy {policy}")
+        self.freq = freq
+        self.period = 1.0 / freq
+        self.policy = policy
+        self.max_catch_up = max_catch_up
+        self.name = name
+        self.clock = clock
+        self.ticks_run = 0
+        self.missed = 0  # ticks that ended after the next deadline
+        self.skipped = 0  # deadlines dropped instead of run
+        self.jitter = Histogram()  # ms between a deadline and the tick actually starting
+        self.exec_time = Histogram()  # ms spent in the loop body
+        self.overrun = Histogram()  # ms by which a tick ended past the next deadline
+
+    async def ticks(self):
+        """Yield once per period.
+        Yields:
+            float: time (s) since the previous tick started, one period for the first tick
+        """
+        clock = self.clock
+        deadline = clock()
+        last_start = deadline - self.period
+        while True:
+            start = clock()
+            self.jitter.record(max(0.0, start - deadline) * 1000)
+            dt = start - last_start
+            last_start = start
+            yield dt
+            end = clock()
+            self.ticks_run += 1
+            self.exec_time.record((end - start) * 1000)
+            deadline += self.period
+            if end > deadline:
+                self._on_overrun(end - deadline)
+                passed = int((end - deadline) / self.period)  # further deadlines already gone
+                if self.policy == SKIP:
+                    deadline += (passed + 1) * self.period
+                    self.skipped += passed + 1
+                elif passed >= self.max_catch_up:
+                    deadline = end
+                    self.skipped += passed
+            delay = deadline - clock()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    def _on_overrun(self, late: float):
+        self.missed += 1
+        self.overrun.record(late * 1000)
+        logger.warning("%s overran its %g ms period by %.1f ms", self.name,
+                       self.period * 1000, late * 1000, extra=log.every(1.0))
+
+    def stats(self) -> dict:
+        """Return tick counters and the jitter, execution time and overrun histograms (ms)."""
+        return {
+            "freq": self.freq,
+            "policy": self.policy,
+            "ticks": self.ticks_run,
+            "missed": self.missed,
+            "skipped": self.skipped,
+            "jitter_ms": self.jitter.stats(),
+            "exec_ms": self.exec_time.stats(),
+            "overrun_ms": self.overrun.stats(),
+        }
@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+from .. import codec, utils
+
+
+def _roundtrip(topic, value):
+    """Encodes the value into a frame and decodes it back.
+
+    Returns: (str, object)
+    """
+    frame = codec.encode(topic, value)
+    length, topic_id = codec.HEADER.unpack(frame[:codec.HEADER.size])
+    assert length == len(frame) - codec.HEADER.size
+    return codec.decode(topic_id, frame[codec.HEADER.size:])
+
+
+def test_target_velocity_roundtrip():
+    vals = {"x": 0.5, "y": -0.25, "z": 1.0, "yaw": 0.0, "pitch": -1.0, "roll": 0.5}
+    topic, msg = _roundtrip(codec.TARGET_VELOCITY, utils.VelocityVector(vals))
+    assert topic == codec.TARGET_VELOCITY
+    assert msg == vals
+
+
+def test_status_flags_roundtrip():
+    flags = {"agnes_mode": True, "agnes_factor": 0.3, "auto_depth": False}
+    _, msg = _roundtrip(codec.STATUS_FLAGS, flags)
+    assert msg["agnes_mode"] is True
+    assert msg["auto_depth"] is False
+    assert msg["agnes_factor"] == pytest.approx(0.3)
+
+
+def test_imu_data_roundtrip_keeps_nesting():
+    imu = utils.init_imu_data()
+    imu["acceleration"]["z"] = -9.75
+    imu["game_quaternion"]["real"] = 1.0
+    _, msg = _roundtrip(codec.IMU_DATA, imu)
+    assert msg == imu
+
+
+def test_depth_carries_depth_and_rate():
+    _, msg = _roundtrip(codec.DEPTH, {"depth": 1.5, "rate": -0.25})
+    assert msg == {"depth": 1.5, "rate": -0.25}
+
+
+def test_encode_missing_field_raises():
+    with pytest.raises(codec.CodecError):
+        codec.encode(codec.STATUS_FLAGS, {"agnes_mode": True})
+
+
+def test_decode_unknown_topic_raises():
+    with pytest.raises(codec.CodecError):
+        codec.decode(255, b"")
+
+
+def test_read_frame_reassembles_split_frames():
+    flags = {"agnes_mode": False, "agnes_factor": 0.5, "auto_depth": True}
+    frames = codec.encode(codec.DEPTH, {"depth": 2.0, "rate": 0.0})
+    frames += codec.encode(codec.STATUS_FLAGS, flags)
+
+    async def read_all():
+        reader = asyncio.StreamReader()
+        # feed one byte at a time to simulate a message split across many reads
+        for i in range(len(frames)):
+            reader.feed_data(frames[i:i + 1])
+        reader.feed_eof()
+        first = await codec.read_frame(reader)
+        second = await codec.read_frame(reader)
+        with pytest.raises(asyncio.IncompleteReadError):
+            await codec.read_frame(reader)
+        return first, second
+
+    first, second = asyncio.run(read_all())
+    assert first == (codec.DEPTH, {"depth": 2.0, "rate": 0.0})
+    assert second[0] == codec.STATUS_FLAGS
+    assert second[1]["auto_depth"] is True
+
+
+def test_hello_roundtrip():
+    hello = {
+        "version": codec.PROTOCOL_VERSION,
+        "publish_rate": 10.0,
+        "publishes": [codec.TARGET_VELOCITY, codec.STATUS_FLAGS],
+        "subscribes": {codec.IMU_DATA: 10.0, codec.DEPTH: 20.0},
+        "delta": [codec.IMU_DATA],
+    }
+    topic, msg = _roundtrip(codec.HELLO, hello)
+    assert topic == codec.HELLO
+    assert msg == hello
+
+
+def test_delta_roundtrip_only_carries_changed_fields():
+    frame = codec.encode(codec.DELTA, (codec.IMU_DATA, {2: -9.5, 12: 1.0}))
+    assert len(frame) == codec.HEADER.size + 5 + 2 * 4
+    _, msg = _roundtrip(codec.DELTA, (codec.IMU_DATA, {2: -9.5, 12: 1.0}))
+    assert msg == (codec.IMU_DATA, {2: -9.5, 12: 1.0})
+
+
+def test_datagram_roundtrip():
+    claw = {"extend": 0.0, "rotate": 90.0, "close_main": 92.0, "close_side": 92.0,
+            "sample": 0.0, "camera_servo": 90.0}
+    data = codec.encode_datagram(codec.CLAW_MOVEMENT, claw, seq=2**32 + 5, sent_at=12.5)
+    assert codec.decode_datagram(data) == (5, 12.5, codec.CLAW_MOVEMENT, claw)
+    with pytest.raises(codec.CodecError):
+        codec.decode_datagram(data[:-1])
+
+
+def test_welcome_roundtrip():
+    welcome = {"version": codec.PROTOCOL_VERSION, "control_loop_freq": 10.0,
+               "command_timeout": 0.25}
+    assert _roundtrip(codec.WELCOME, welcome) == (codec.WELCOME, welcome)
@@ -0,0 +1,76 @@
+from .. import codec, utils
+from ..delta import DeltaDecoder, DeltaEncoder
+
+
+def _decode(frame):
+    """Decodes a complete frame.
+
+    Returns: (str, object)
+    """
+    length, topic_id = codec.HEADER.unpack(frame[:codec.HEADER.size])
+    assert length == len(frame) - codec.HEADER.size
+    return codec.decode(topic_id, frame[codec.HEADER.size:])
+
+
+def _depth(depth, rate=0.0):
+    return {"depth": depth, "rate": rate}
+
+
+def test_keyframe_then_deltas_then_keyframe():
+    encoder = DeltaEncoder(codec.DEPTH, thresholds=0.01, keyframe_period=1.0)
+    assert _decode(encoder.encode(_depth(1.0), now=0.0)) == (codec.DEPTH, _depth(1.0))
+    # below threshold, nothing is sent
+    assert encoder.encode(_depth(1.005), now=0.1) is None
+    assert _decode(encoder.encode(_depth(1.5), now=0.2)) == (codec.DELTA, (codec.DEPTH, {0: 1.5}))
+    # keyframe period elapsed, full frame even though nothing moved
+    assert _decode(encoder.encode(_depth(1.5), now=1.2)) == (codec.DEPTH, _depth(1.5))
+
+
+def test_small_changes_accumulate_against_last_sent_value():
+    encoder = DeltaEncoder(codec.DEPTH, thresholds=0.01, keyframe_period=10.0)
+    encoder.encode(_depth(1.0), now=0.0)
+    assert encoder.encode(_depth(1.006), now=0.1) is None
+    assert encoder.encode(_depth(1.012), now=0.2) is not None
+
+
+def test_delta_only_carries_moved_fields():
+    imu = utils.init_imu_data()
+    encoder = DeltaEncoder(codec.IMU_DATA, thresholds={"acceleration": 0.05, "velocity.z": 0.5})
+    keyframe = encoder.encode(imu, now=0.0)
+
+    imu["acceleration"]["x"] = 0.01  # below threshold
+    imu["acceleration"]["y"] = 0.25
+    imu["velocity"]["z"] = 0.4  # below its own threshold
+    imu["game_quaternion"]["real"] = 1.0  # no threshold configured
+    delta = encoder.encode(imu, now=0.1)
+
+    assert len(delta) < len(keyframe)
+    assert _decode(delta) == (codec.DELTA, (codec.IMU_DATA, {1: 0.25, 12: 1.0}))
+
+
+def test_bool_fields_are_sent_on_any_change():
+    flags = {"agnes_mode": False, "agnes_factor": 0.3, "auto_depth": False}
+    encoder = DeltaEncoder(codec.STATUS_FLAGS, thresholds=0.5)
+    encoder.encode(flags, now=0.0)
+    flags["auto_depth"] = True
+    assert _decode(encoder.encode(flags, now=0.1))[1] == (codec.STATUS_FLAGS, {2: True})
+
+
+def test_decoder_rebuilds_state():
+    imu = utils.init_imu_data()
+    encoder = DeltaEncoder(codec.IMU_DATA)
+    decoder = DeltaDecoder()
+
+    delta_before_keyframe = (codec.DELTA, (codec.IMU_DATA, {0: 1.0}))
+    assert decoder.apply(*delta_before_keyframe) is None
+
+    assert decoder.apply(*_decode(encoder.encode(imu, now=0.0)))[2] is True
+    imu["magnetometer"]["y"] = 3.0
+    topic, msg, changed = decoder.apply(*_decode(encoder.encode(imu, now=0.1)))
+    assert topic == codec.IMU_DATA
+    assert changed
+    assert msg == imu
+
+    # a keyframe with the same values does not count as a change
+    encoder.force_keyframe()
+    assert decoder.apply(*_decode(encoder.encode(imu, now=0.2)))[2] is False
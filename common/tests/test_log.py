@@ -0,0 +1,77 @@
+import io
+import logging
+import threading
+
+from .. import log
+
+
+def make_record(msg: str, **extra) -> logging.LogRecord:
+    record = logging.LogRecord("pi.test", logging.INFO, __file__, 1, msg, None, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_sample_passes_one_in_n():
+    throttle = log.ThrottleFilter()
+    passed = [throttle.filter(make_record("mix", **log.sample(5))) for _ in range(11)]
+    assert passed == [True, False, False, False, False, True,
+                      False, False, False, False, True]
+    assert throttle.suppressed == 8
+    # unthrottled records are never dropped
+    assert all(throttle.filter(make_record("mix")) for _ in range(3))
+
+
+def test_rate_limit_reports_suppressed_count():
+    throttle = log.ThrottleFilter()
+    assert throttle.filter(make_record("slow", **log.every(60)))
+    assert not throttle.filter(make_record("slow", **log.every(60)))
+    assert not throttle.filter(make_record("slow", **log.every(60)))
+    # a different call site has its own budget
+    assert throttle.filter(make_record("other", **log.every(60)))
+    record = make_record("slow", **log.every(0))
+    assert throttle.filter(record)
+    assert record.msg == "slow (2 suppressed)"
+
+
+def test_only_mutable_arguments_are_formatted_by_the_caller():
+    handler = log._QueueHandler(None)
+    record = logging.LogRecord("pi.test", logging.INFO, __file__, 1, "tick %d took %.1f ms",
+                               (3, 1.25), None)
+    assert handler.prepare(record).args == (3, 1.25)  # formatted by the writer thread
+    record = logging.LogRecord("pi.test", logging.INFO, __file__, 1, "mix %s", ([1, 2],), None)
+    record = handler.prepare(record)
+    assert record.msg == "mix [1, 2]" and record.args is None
+
+
+def test_parse_levels_skips_invalid_levels(caplog):
+    levels = log.parse_levels("pi.rov_state=debug, surface.xgui=DEBG,=INFO,pi.imu")
+    assert levels == {"pi.rov_state": logging.DEBUG}
+    assert len(caplog.records) == 3
+
+
+def test_setup_writes_from_background_thread():
+    stream = io.StringIO()
+    threads = []
+
+    class Stream:
+        def write(self, s):
+            threads.append(threading.current_thread())
+            stream.write(s)
+
+        def flush(self):
+            pass
+
+    log.setup(levels={"pi.quiet": logging.WARNING}, stream=Stream())
+    try:
+        values = {"x": 1}
+        logging.getLogger("pi.loud").info("value %s", values)
+        values["x"] = 2  # mutated after the call, the logged value must not change
+        logging.getLogger("pi.quiet").info("hidden")
+        logging.getLogger("pi.quiet").warning("shown")
+    finally:
+        log.shutdown()
+        logging.getLogger("pi.quiet").setLevel(logging.NOTSET)
+    assert "value {'x': 1}" in stream.getvalue()
+    assert "hidden" not in stream.getvalue()
+    assert "shown" in stream.getvalue()
+    assert threads and threading.main_thread() not in threads
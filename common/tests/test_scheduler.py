@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+from .. import scheduler as scheduler_module
+from ..scheduler import CATCH_UP, SKIP, Histogram, PeriodicScheduler
+
+
+class FakeClock:
+    """time that only moves when the loop body works or the scheduler sleeps"""
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture(name="clock")
+def fixture_clock(monkeypatch):
+    clock = FakeClock()
+    real_sleep = asyncio.sleep
+
+    async def sleep(delay):
+        clock.now += delay
+        await real_sleep(0)
+
+    monkeypatch.setattr(scheduler_module.asyncio, "sleep", sleep)
+    return clock
+
+
+def test_histogram_buckets_and_percentiles():
+    histogram = Histogram(edges=(1, 10, 100))
+    for value in [0.5] * 90 + [5] * 9 + [500]:
+        histogram.record(value)
+    stats = histogram.stats()
+    assert stats["count"] == 100
+    assert stats["buckets"] == {"<=1": 90, "<=10": 9, "more": 1}
+    assert stats["p50"] == 1
+    assert stats["p99"] == 10
+    assert histogram.percentile(100) == stats["max"] == 500
+
+
+def run_ticks(scheduler: PeriodicScheduler, n: int, work=lambda i: 0.0) -> list[float]:
+    """run n ticks, spending work(i) seconds in tick i; returns tick start times"""
+
+    async def scenario():
+        starts = []
+        async for _ in scheduler.ticks():
+            starts.append(scheduler.clock())
+            scheduler.clock.now += work(len(starts) - 1)
+            if len(starts) == n:
+                return starts
+
+    return asyncio.run(scenario())
+
+
+def test_ticks_follow_the_deadline_grid(clock):
+    scheduler = PeriodicScheduler(100, clock=clock)
+    starts = run_ticks(scheduler, 20, work=lambda i: 0.003 * (i % 3))
+    # the rate does not drift with the time spent in the loop
+    assert starts[-1] - starts[0] == pytest.approx(19 * 0.01)
+    assert scheduler.missed == 0
+    assert scheduler.stats()["exec_ms"]["count"] == 19  # the last tick never finished
+
+
+def test_skip_drops_missed_deadlines(clock):
+    scheduler = PeriodicScheduler(100, policy=SKIP, clock=clock)
+    starts = run_ticks(scheduler, 3, work=lambda i: 0.025 if i == 0 else 0.0)
+    assert scheduler.missed == 1
+    assert scheduler.skipped == 2
+    # the next tick waits for the grid point after the overrun
+    assert starts[1] - starts[0] == pytest.approx(0.03)
+    assert scheduler.stats()["overrun_ms"]["max"] == pytest.approx(15)
+
+
+def test_catch_up_runs_missed_deadlines_back_to_back(clock):
+    scheduler = PeriodicScheduler(100, policy=CATCH_UP, clock=clock)
+    starts = run_ticks(scheduler, 5, work=lambda i: 0.025 if i == 0 else 0.0)
+    assert scheduler.skipped == 0
+    # two missed deadlines run immediately, then the grid resumes
+    assert starts[2] == starts[1]
+    assert starts[4] - starts[0] == pytest.approx(0.04)
+
+
+def test_catch_up_restarts_the_grid_when_far_behind(clock):
+    scheduler = PeriodicScheduler(100, policy=CATCH_UP, max_catch_up=2, clock=clock)
+    starts = run_ticks(scheduler, 3, work=lambda i: 0.105 if i == 0 else 0.0)
+    assert scheduler.skipped == 9
+    assert starts[2] - starts[1] == pytest.approx(0.01)
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        PeriodicScheduler(10, policy="burst")
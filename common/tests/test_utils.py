@@ -0,0 +1,175 @@
+import copy
+
+import numpy as np
+import pytest
+
+from .. import codec
+from ..utils import (
+    PIDBank,
+    PIDController,
+    SequenceFilter,
+    SlewRateLimiter,
+    SlewRateLimiterBank,
+    VelocityVector,
+)
+
+
+def test_sequence_filter_drops_out_of_order():
+    seq_filter = SequenceFilter(max_age=0.1)
+    assert seq_filter.accept(1)
+    assert seq_filter.accept(3)
+    assert not seq_filter.accept(2)
+    assert not seq_filter.accept(3)
+    assert seq_filter.out_of_order == 2
+
+
+def test_sequence_filter_wraps_around():
+    seq_filter = SequenceFilter(max_age=0.1)
+    assert seq_filter.accept(0xFFFFFFFF)
+    assert seq_filter.accept(0)
+
+
+def test_sequence_filter_accepts_sender_restart():
+    seq_filter = SequenceFilter(max_age=0.1, restart_window=100)
+    assert seq_filter.accept(5000)
+    assert seq_filter.accept(0)
+
+
+def test_sequence_filter_accepts_surface_restart_at_a_small_seq():
+    seq_filter = SequenceFilter(max_age=0.1)
+    for seq in range(600):
+        assert seq_filter.accept(seq, sent_at=seq * 0.1, now=seq * 0.1 + 0.01)
+    # the surface client restarts 5 s later and counts from 0 again
+    for seq in range(5):
+        sent_at = 65.0 + seq * 0.1
+        assert seq_filter.accept(seq, sent_at=sent_at, now=sent_at + 0.01)
+    # a late packet of the new run is still dropped
+    assert not seq_filter.accept(3, sent_at=65.3, now=65.45)
+    assert seq_filter.out_of_order == 1
+
+
+def test_sequence_filter_drops_stale_without_synchronized_clocks():
+    seq_filter = SequenceFilter(max_age=0.1)
+    # the sender's clock is 50 s behind, transit normally takes 10 ms
+    assert seq_filter.accept(1, sent_at=0.0, now=50.01)
+    assert seq_filter.accept(2, sent_at=0.01, now=50.03)
+    # held up for 200 ms on the way
+    assert not seq_filter.accept(3, sent_at=0.02, now=50.23)
+    assert seq_filter.stale == 1
+    # the late packet still counts as the newest seen
+    assert not seq_filter.accept(3, sent_at=0.02, now=50.03)
+
+
+def test_sequence_filter_follows_a_clock_step():
+    seq_filter = SequenceFilter(max_age=0.1, stale_reset=5)
+    for seq in range(100):
+        assert seq_filter.accept(seq, sent_at=seq * 0.1, now=seq * 0.1 + 0.01)
+    # the Pi syncs NTP and its clock jumps 0.5 s forward
+    accepted = [
+        seq_filter.accept(seq, sent_at=seq * 0.1, now=seq * 0.1 + 0.51) for seq in range(100, 120)
+    ]
+    assert accepted == [False] * 4 + [True] * 16
+    assert seq_filter.stale == 4 and seq_filter.clock_steps == 1
+    # and a packet held up on the way is still stale on the new clock
+    assert not seq_filter.accept(120, sent_at=12.0, now=12.71)
+
+
+def test_sequence_filter_follows_a_slow_clock_drift():
+    seq_filter = SequenceFilter(max_age=0.1)
+    # 50 ppm apart for an hour at 10 Hz, 0.18 s in all
+    for seq in range(36000):
+        now = seq * 0.1
+        assert seq_filter.accept(seq, sent_at=now * (1 - 50e-6), now=now + 0.01)
+    assert seq_filter.clock_steps == 0
+
+
+def test_velocity_vector_get_set_by_name_and_index():
+    vector = VelocityVector({"x": 1.0, "yaw": -0.5})
+    assert vector["x"] == vector[0] == vector.x == 1.0
+    assert vector["y"] == 0.0  # missing components are 0
+    vector["pitch"] = 0.25
+    vector[5] = 0.75
+    assert vector.pitch == 0.25 and vector.roll == 0.75
+    assert dict(vector) == {"x": 1.0, "y": 0.0, "z": 0.0, "yaw": -0.5, "pitch": 0.25, "roll": 0.75}
+    assert vector == VelocityVector.from_values([1.0, 0.0, 0.0, -0.5, 0.25, 0.75])
+    with pytest.raises(AttributeError):
+        vector.surge = 1.0  # fixed layout
+    with pytest.raises(ValueError):
+        VelocityVector.from_values([1.0, 2.0])
+
+
+def test_velocity_vector_copies_and_iterates_its_components():
+    vector = VelocityVector({"x": 1.0, "roll": 0.5})
+    for duplicate in (copy.copy(vector), copy.deepcopy(vector)):
+        duplicate.x = 2.0
+        assert vector.x == 1.0 and duplicate.roll == 0.5
+    assert list(vector) == [1.0, 0.0, 0.0, 0.0, 0.0, 0.5]
+    assert tuple(vector) == tuple(vector.values())
+
+
+def test_velocity_vector_numpy_view_shares_memory():
+    vector = VelocityVector()
+    view = vector.as_array()
+    view[2] = 0.5
+    assert vector.z == 0.5
+    vector.y = -1.0
+    assert view[1] == -1.0
+
+
+def test_velocity_vector_fast_encode_matches_dict_encode():
+    vals = {"x": 0.5, "y": -0.25, "z": 1.0, "yaw": 0.0, "pitch": 0.125, "roll": -1.0}
+    assert codec.encode(codec.TARGET_VELOCITY, VelocityVector(vals)) == codec.encode(
+        codec.TARGET_VELOCITY, vals
+    )
+
+
+def test_pid_bank_matches_pid_controller():
+    gains = [(1.0, 0.1, 0.01), (2.0, 0.0, 0.5), (0.5, 1.0, 0.0)]
+    controllers = [PIDController(kp, ki, kd) for kp, ki, kd in gains]
+    bank = PIDBank(3, *(np.array(column) for column in zip(*gains)))
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        error = rng.uniform(-1, 1, 3)
+        expected = [c.update(e, 0.1) for c, e in zip(controllers, error)]
+        np.testing.assert_allclose(bank.update(error, 0.1), expected)
+
+
+def test_pid_bank_anti_windup():
+    bank = PIDBank(2, kp=0.0, ki=1.0, kd=0.0, max_output=1.0, max_rate_of_change=np.inf)
+    for _ in range(100):
+        output = bank.update([5.0, 0.001], 0.1)
+    assert output[0] == 1.0
+    # the saturated axis stopped integrating once its output hit the limit
+    assert bank.integral[0] == pytest.approx(1.0, abs=0.5)
+    assert bank.integral[1] == pytest.approx(0.01)
+    # so it comes off the limit as soon as the error changes sign
+    assert bank.update([-1.0, 0.0], 0.1)[0] < 1.0
+
+
+def test_pid_bank_filters_derivative_and_resets():
+    raw = PIDBank(1, kp=0.0, ki=0.0, kd=1.0, max_rate_of_change=np.inf)
+    filtered = PIDBank(1, kp=0.0, ki=0.0, kd=1.0, max_rate_of_change=np.inf, derivative_tau=0.9)
+    # a step in the error kicks the derivative
+    assert raw.update([1.0], 0.1)[0] == pytest.approx(10.0)
+    assert filtered.update([1.0], 0.1)[0] == pytest.approx(1.0)
+    filtered.update([1.0], 0.1)
+    filtered.reset()
+    assert not filtered.derivative.any() and not filtered.last_output.any()
+
+
+def test_slew_rate_limiter_bank_matches_scalar_limiters():
+    limiters = [SlewRateLimiter(max_rate=1.5, initial_value=0.0) for _ in range(8)]
+    bank = SlewRateLimiterBank(8, max_rate_up=1.5)
+    rng = np.random.default_rng(0)
+    for _ in range(30):
+        target = rng.uniform(-1, 1, 8)
+        expected = [limiter.update(t, 0.1) for limiter, t in zip(limiters, target)]
+        np.testing.assert_allclose(bank.update(target, 0.1), expected)
+
+
+def test_slew_rate_limiter_bank_separate_up_and_down_rates():
+    bank = SlewRateLimiterBank(2, max_rate_up=[1.0, 2.0], max_rate_down=[4.0, 0.5])
+    np.testing.assert_allclose(bank.update([1.0, 1.0], 0.1), [0.1, 0.2])
+    np.testing.assert_allclose(bank.update([-1.0, -1.0], 0.1), [-0.3, 0.15])
+    bank.reset(0.5)
+    np.testing.assert_allclose(bank.value, [0.5, 0.5])
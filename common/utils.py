@@ -1,7 +1,10 @@
-from dataclasses import asdict, dataclass
+from array import array
+from operator import itemgetter
 from time import time_ns
 import math
 
+import numpy as np
+
 def time_ms():
     """Returns the current time in milliseconds."""
     return int(time_ns() / 1000000)  # time in ms
@@ -96,38 +99,105 @@ def euler_from_quaternion(x, y, z, w):
      
         return roll_x, pitch_y, yaw_z # in degrees
 
-@dataclass
+
+_ZEROS = [0.0] * 6
+_get_fields = itemgetter("x", "y", "z", "yaw", "pitch", "roll")
+
+
+def _axis_property(index: int) -> property:
+    def get(self) -> float:
+        return self._values[index]
+
+    def set(self, value: float):
+        self._values[index] = value
+
+    return property(get, set)
+
+
 class VelocityVector:
     """Represents a velocity vector in 3D space. Standard 3D right handed coordinate system.
     The vehicle is parallel to the xy plane, pointed to +y.
     yaw is about the z axis, pitch is about the x axis, roll is about the y axis.
+
+    The six components live in one array of doubles, so they can be read and written by
+    name or index in O(1), viewed as a NumPy array without copying, and packed straight
+    into a frame.
     """
 
-    x: float = 0.0
-    y: float = 0.0
-    z: float = 0.0
-    yaw: float = 0.0
-    pitch: float = 0.0
-    roll: float = 0.0
+    __slots__ = ("_values",)
+
+    FIELDS = ("x", "y", "z", "yaw", "pitch", "roll")
+    _INDEX = {**{name: i for i, name in enumerate(FIELDS)}, **{i: i for i in range(6)}}
+
+    x = _axis_property(0)
+    y = _axis_property(1)
+    z = _axis_property(2)
+    yaw = _axis_property(3)
+    pitch = _axis_property(4)
+    roll = _axis_property(5)
 
     def __init__(self, vals: dict[str, float] | None = None):
-        if vals is not None:
-            for key, value in vals.items():
-                setattr(self, key, value)
+        if vals is None:
+            self._values = array("d", _ZEROS)
+            return
+        try:
+            self._values = array("d", _get_fields(vals))
+        except KeyError:
+            # missing components are 0
+            self._values = array("d", [vals.get(name, 0.0) for name in self.FIELDS])
+
+    @classmethod
+    def from_values(cls, values) -> "VelocityVector":
+        """Build a vector from its six components in FIELDS order."""
+        vector = cls()
+        vector._values = array("d", values)
+        if len(vector._values) != 6:
+            raise ValueError(f"expected 6 components, got {len(vector._values)}")
+        return vector
 
     def __getitem__(self, key):
-        return asdict(self)[key]
+        return self._values[self._INDEX[key]]
 
     def __setitem__(self, key, value):
-        asdict(self)[key] = value
+        self._values[self._INDEX[key]] = value
+
+    def __len__(self):
+        return 6
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __copy__(self):
+        # the backing array is not shared, as with the dataclass this replaced
+        return type(self).from_values(self._values)
+
+    def __deepcopy__(self, memo):
+        return self.__copy__()
+
+    def __eq__(self, other):
+        if not isinstance(other, VelocityVector):
+            return NotImplemented
+        return self._values == other._values
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={value}" for name, value in zip(self.FIELDS, self._values))
+        return f"VelocityVector({fields})"
 
     def keys(self):
         """Return keys."""
-        return asdict(self).keys()
+        return self.FIELDS
+
+    def values(self) -> array:
+        """Return the components in FIELDS order. This is the backing array, not a copy."""
+        return self._values
+
+    def as_array(self) -> np.ndarray:
+        """Return a float64 NumPy view of the components. Writes to it change the vector."""
+        return np.frombuffer(self._values, dtype=np.float64)
 
     def to_dict(self):
         """Return dict representation. Rounds values to 3 decimal places."""
-        return {k: round(v, 3) for k, v in asdict(self).items()}
+        return {k: round(v, 3) for k, v in zip(self.FIELDS, self._values)}
 
 
 class PIDController:
@@ -183,6 +253,98 @@ class PIDController:
         self.last_output = output
         return output
 
+
+class PIDBank:
+    """PID controllers for N axes, updated together with NumPy.
+
+    Each gain and limit may be a scalar shared by all axes or one value per axis. Compared to
+    PIDController it adds integral anti-windup (the integral stops growing on an axis whose
+    output is saturated in the direction of its error, and is optionally clamped) and a first
+    order low-pass filter on the derivative.
+    """
+
+    def __init__(
+        self,
+        n: int,
+        kp: float | np.ndarray,
+        ki: float | np.ndarray,
+        kd: float | np.ndarray,
+        max_output: float | np.ndarray = 90,
+        max_rate_of_change: float | np.ndarray = 180,
+        max_integral: float | np.ndarray = np.inf,
+        derivative_tau: float | np.ndarray = 0.0,
+    ):
+        """
+        Args:
+            n (int): number of axes
+            kp (float | np.ndarray): proportional gains
+            ki (float | np.ndarray): integral gains
+            kd (float | np.ndarray): derivative gains
+            max_output (float | np.ndarray): output is limited to [-max_output, max_output]
+            max_rate_of_change (float | np.ndarray): maximum rate of change of output (output/s)
+            max_integral (float | np.ndarray): integral is limited to [-max_integral, max_integral]
+            derivative_tau (float | np.ndarray): time constant (s) of the derivative low-pass
+                filter, 0 for no filtering
+        """
+        self.n = n
+        self.kp = self._per_axis(kp)
+        self.ki = self._per_axis(ki)
+        self.kd = self._per_axis(kd)
+        self.max_output = self._per_axis(max_output)
+        self.max_rate_of_change = self._per_axis(max_rate_of_change)
+        self.max_integral = self._per_axis(max_integral)
+        self.derivative_tau = self._per_axis(derivative_tau)
+        self.integral = np.zeros(n)
+        self.last_error = np.zeros(n)
+        self.derivative = np.zeros(n)
+        self.last_output = np.zeros(n)
+
+    def _per_axis(self, value) -> np.ndarray:
+        """broadcast a gain or limit to one float per axis"""
+        return np.broadcast_to(np.asarray(value, dtype=float), (self.n,)).copy()
+
+    def update(self, error: np.ndarray, dt: float) -> np.ndarray:
+        """Update all axes.
+        Args:
+            error (np.ndarray): error of each axis, shape (n,)
+            dt (float): time since last update (seconds)
+        Returns:
+            np.ndarray: output of each axis, shape (n,)
+        """
+        error = np.array(error, dtype=float)  # kept as last_error, so copy
+        # np.minimum / np.maximum instead of np.clip, which costs several times more
+        integral = np.minimum(np.maximum(self.integral + error * dt, -self.max_integral),
+                              self.max_integral)
+        alpha = dt / (self.derivative_tau + dt)
+        self.derivative += alpha * ((error - self.last_error) / dt - self.derivative)
+        unlimited = self.kp * error + self.ki * integral + self.kd * self.derivative
+
+        # limit rate of change of output, then the output itself
+        max_change = self.max_rate_of_change * dt
+        output = np.maximum(unlimited, self.last_output - max_change)
+        np.minimum(output, self.last_output + max_change, out=output)
+        np.maximum(output, -self.max_output, out=output)
+        np.minimum(output, self.max_output, out=output)
+
+        # anti-windup: keep the old integral where the output is held back and the error
+        # would push it further the same way
+        winding = (unlimited - output) * error > 0
+        self.integral = np.where(winding, self.integral, integral)
+        self.last_error = error
+        self.last_output = output
+        return output
+
+    def reset(self, axes=None):
+        """Clear the state of some or all axes.
+        Args:
+            axes: index, slice, boolean mask or list of indices of the axes; all if None
+        """
+        if axes is None:
+            axes = slice(None)
+        for state in (self.integral, self.last_error, self.derivative, self.last_output):
+            state[axes] = 0.0
+
+
 class SlewRateLimiter:
     def __init__(self, max_rate: float, initial_value: float):
         self.max_rate = max_rate   # Maximum rate of change
@@ -204,6 +366,144 @@ class SlewRateLimiter:
         
         return self.last_value
 
+class SlewRateLimiterBank:
+    """Slew rate limiters for N channels, such as thruster outputs, updated together with NumPy.
+
+    Rising and falling values have separate rate limits, each a scalar shared by all
+    channels or one value per channel.
+    """
+
+    def __init__(
+        self,
+        n: int,
+        max_rate_up: float | np.ndarray,
+        max_rate_down: float | np.ndarray | None = None,
+        initial_value: float | np.ndarray = 0.0,
+    ):
+        """
+        Args:
+            n (int): number of channels
+            max_rate_up (float | np.ndarray): maximum rate of increase (units/s)
+            max_rate_down (float | np.ndarray): maximum rate of decrease (units/s), the same
+                as max_rate_up if None
+            initial_value (float | np.ndarray): starting value of the channels
+        """
+        self.n = n
+        self.max_rate_up = np.broadcast_to(np.asarray(max_rate_up, dtype=float), (n,)).copy()
+        self.max_rate_down = (
+            self.max_rate_up.copy() if max_rate_down is None
+            else np.broadcast_to(np.asarray(max_rate_down, dtype=float), (n,)).copy()
+        )
+        self.value = np.broadcast_to(np.asarray(initial_value, dtype=float), (n,)).copy()
+
+    def update(self, target: np.ndarray, dt: float) -> np.ndarray:
+        """Move every channel towards its target.
+        Args:
+            target (np.ndarray): target value of each channel, shape (n,)
+            dt (float): time since last update (seconds)
+        Returns:
+            np.ndarray: limited values, shape (n,)
+        """
+        step = np.subtract(target, self.value)
+        np.minimum(step, self.max_rate_up * dt, out=step)
+        np.maximum(step, self.max_rate_down * -dt, out=step)
+        self.value = self.value + step
+        return self.value
+
+    def reset(self, value: float | np.ndarray = 0.0):
+        """Set every channel to a value without limiting."""
+        self.value = np.broadcast_to(np.asarray(value, dtype=float), (self.n,)).copy()
+
+
+class SequenceFilter:
+    """Drops out-of-order and stale messages of a sequenced stream, such as commands over UDP.
+
+    Sequence numbers are uint32 and compared with wrap-around. A message behind the newest
+    one but sent after it, or far behind it, is taken as the sender restarting its sequence,
+    not as a late packet. Staleness is
+    judged from the transit time (receive time - send time) above the smallest transit time
+    seen so far, so the sender's and receiver's clocks do not need to be synchronized. That
+    minimum creeps up by drift seconds per second to follow the clocks drifting apart, and is
+    measured again after stale_reset stale messages in a row, which only a step of one of the
+    clocks (e.g. the Pi syncing NTP after boot) explains.
+    """
+
+    def __init__(
+        self,
+        max_age: float,
+        restart_window: int = 1000,
+        drift: float = 1e-4,
+        stale_reset: int = 10,
+    ):
+        """
+        Args:
+            max_age (float): largest extra delay (s) over the fastest transit seen
+            restart_window (int): messages further than this behind the newest one reset
+                the filter instead of being dropped
+            drift (float): rate (s/s) the smallest transit creeps up at, above the drift
+                between the two clocks
+            stale_reset (int): stale messages in a row after which the smallest transit is
+                measured again
+        """
+        self.max_age = max_age
+        self.restart_window = restart_window
+        self.drift = drift
+        self.stale_reset = stale_reset
+        self.last_seq = None
+        self.last_sent_at = None  # send time of the newest message, if known
+        self.min_transit = math.inf
+        self._last_received = None  # receive time of the last stamped message
+        self._stale_run = 0  # stale messages in a row
+        self.accepted = 0
+        self.out_of_order = 0
+        self.stale = 0
+        self.clock_steps = 0  # times the smallest transit was measured again
+
+    def accept(self, seq: int, sent_at: float | None = None, now: float | None = None) -> bool:
+        """Check a message and remember it if it is accepted.
+        Args:
+            seq (int): sequence number of the message
+            sent_at (float): time.time() when the message was sent, if known
+            now (float): time.time() when the message was received, defaults to now
+        Returns:
+            bool: True if the message is newer than every accepted one and not stale
+        """
+        if self.last_seq is not None:
+            ahead = (seq - self.last_seq) & 0xFFFFFFFF
+            if ahead == 0 or ahead >= 0x80000000:
+                behind = (self.last_seq - seq) & 0xFFFFFFFF
+                sent_later = (
+                    sent_at is not None
+                    and self.last_sent_at is not None
+                    and sent_at > self.last_sent_at
+                )
+                if behind <= self.restart_window and not sent_later:
+                    self.out_of_order += 1
+                    return False
+                # sender restarted, start over
+                self.min_transit = math.inf
+        # a stale message is still the newest, anything older than it is late too
+        self.last_seq = seq
+        self.last_sent_at = sent_at
+        if sent_at is not None:
+            now = time_ns() / 1e9 if now is None else now
+            if self._last_received is not None:
+                self.min_transit += self.drift * max(now - self._last_received, 0.0)
+            self._last_received = now
+            transit = now - sent_at
+            self.min_transit = min(self.min_transit, transit)
+            if transit - self.min_transit > self.max_age:
+                self._stale_run += 1
+                if self._stale_run < self.stale_reset:
+                    self.stale += 1
+                    return False
+                # no link holds every message back: one of the clocks stepped
+                self.min_transit = transit
+                self.clock_steps += 1
+            self._stale_run = 0
+        self.accepted += 1
+        return True
+
 # TODO: make deadzone value configurable somewhere
 def deadzone_retrict(val: float) -> float:
     if abs(val) < 0.07:
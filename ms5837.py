@@ -5,6 +5,8 @@ except:
     
 from time import sleep
 
+import numpy as np
+
 # Models
 MODEL_02BA = 0
 MODEL_30BA = 1
@@ -123,6 +125,13 @@ class MS5837(object):
         
         return True
     
+    # Raw ADC counts of the last read, for logging and reprocessing with compensate()
+    def raw(self):
+        return self._D1, self._D2
+    
+    def prom(self):
+        return list(self._C)
+    
     def setFluidDensity(self, denisty):
         self._fluidDensity = denisty
         
@@ -223,6 +232,57 @@ class MS5837(object):
     
         return n_rem ^ 0x00
     
+# Vectorized _calculate() for arrays of raw D1/D2 counts, e.g. logged raw() values
+# reprocessed offline with another fluid density or calibration
+# Same operations in the same order as _calculate(), so the results are bit for bit
+# the same as reading the samples one at a time
+# Returns pressure (mbar), temperature (degrees C) and depth (m) arrays
+def compensate(D1, D2, C, model=MODEL_30BA, fluidDensity=DENSITY_FRESHWATER):
+    D1 = np.asarray(D1, dtype=np.int64)
+    D2 = np.asarray(D2, dtype=np.int64)
+    C = [int(c) for c in C]
+    
+    dT = D2-C[5]*256
+    if model == MODEL_02BA:
+        SENS = C[1]*65536+(C[3]*dT)/128
+        OFF = C[2]*131072+(C[4]*dT)/64
+    else:
+        SENS = C[1]*32768+(C[3]*dT)/256
+        OFF = C[2]*65536+(C[4]*dT)/128
+    
+    temperature = 2000+dT*C[6]/8388608
+    
+    # Second order compensation
+    # Products are written out as in _calculate(): 3*t*t is (3*t)*t, and rounds
+    # differently from 3*(t*t)
+    low = (temperature/100) < 20
+    t = temperature-2000
+    zero = np.zeros(dT.shape)
+    if model == MODEL_02BA:
+        Ti = np.where(low, (11*dT*dT)/(34359738368), zero)
+        OFFi = np.where(low, (31*t*t)/8, zero)
+        SENSi = np.where(low, (63*t*t)/32, zero)
+    else:
+        veryLow = (temperature/100) < -15
+        u = temperature+1500
+        OFFiLow = (3*t*t)/2
+        SENSiLow = (5*t*t)/8
+        Ti = np.where(low, (3*dT*dT)/(8589934592), 2*(dT*dT)/(137438953472))
+        OFFi = np.where(low, np.where(veryLow, OFFiLow+7*u*u, OFFiLow), (1*t*t)/16)
+        SENSi = np.where(low, np.where(veryLow, SENSiLow+4*u*u, SENSiLow), zero)
+    
+    OFF2 = OFF-OFFi
+    SENS2 = SENS-SENSi
+    
+    temperature = (temperature-Ti)
+    if model == MODEL_02BA:
+        pressure = (((D1*SENS2)/2097152-OFF2)/32768)/100.0
+    else:
+        pressure = (((D1*SENS2)/2097152-OFF2)/8192)/10.0
+    
+    depth = (pressure*UNITS_Pa-101300)/(fluidDensity*9.80665)
+    return pressure, temperature/100.0, depth
+    
 class MS5837_30BA(MS5837):
     def __init__(self, bus=1):
         MS5837.__init__(self, MODEL_30BA, bus)
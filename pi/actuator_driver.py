@@ -0,0 +1,97 @@
+"""One coordinated tick for the pin writes of every actuator.
+
+The outputs of all actuators live in one flat array, one slot per actuator. The control loop
+fills it in with set_thrust() and set_val(), which only check and map the values, and then
+calls tick(), which writes every slot to its pins in one pass. There are no per-actuator
+tasks or locks: everything runs on the event loop between two awaits.
+"""
+
+import time
+from typing import Callable, Mapping, Sequence
+
+import numpy as np
+
+from common.scheduler import Histogram
+
+from .hardware import DrivenActuator, ThrusterTable
+from .output_link import OutputLink
+
+TICK_EDGES = (0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10)  # ms, tick time histogram buckets
+
+
+class ActuatorDriver:
+    """Owns the outputs of a set of actuators and writes them to the pins on tick()."""
+
+    def __init__(
+        self,
+        actuators: Mapping[str, DrivenActuator],
+        thrusters: Sequence[str] = (),
+        link: OutputLink | None = None,
+        clock: Callable[[], float] = time.perf_counter,
+    ):
+        """
+        Args:
+            actuators (Mapping[str, DrivenActuator]): name: actuator
+            thrusters (Sequence[str]): names of the Thrusters set together by set_thrust(),
+                in the order of its commands
+            link (OutputLink): link the actuators' pins write through, flushed after each
+                tick and sync
+            clock (Callable): time source (s) for the tick time
+        """
+        self.names = tuple(actuators)
+        self._actuators = list(actuators.values())
+        self._index = {name: i for i, name in enumerate(self.names)}
+        self.outputs = np.array([actuator.output for actuator in self._actuators], dtype=float)
+        self._live = np.ones(len(self.names), dtype=bool)  # False while stopped
+        self._table = ThrusterTable([actuators[name] for name in thrusters]) if thrusters else None
+        self._thruster_slots = np.array([self._index[name] for name in thrusters], dtype=int)
+        self.link = link
+        self.clock = clock
+        self.ticks = 0
+        self.tick_time = Histogram(TICK_EDGES)  # ms spent writing every output
+
+    def set_thrust(self, thrust: np.ndarray):
+        """Set every thruster's output from commands in [-1, 1], in one lookup.
+        Stopped thrusters keep their output."""
+        slots = self._thruster_slots
+        self.outputs[slots] = np.where(
+            self._live[slots], self._table.map(thrust), self.outputs[slots]
+        )
+
+    def set_val(self, name: str, val: float):
+        """Set one actuator's output, as its set_val() would. Ignored while it is stopped.
+        Raises:
+            ValueError: if val is out of range for the actuator
+        """
+        i = self._index[name]
+        actuator = self._actuators[i]
+        if not actuator.stopped:
+            self.outputs[i] = actuator.command(val)
+
+    def sync(self):
+        """Pick up stop() and release() of the actuators: a stopped actuator's slot takes the
+        safe value it was driven to and is no longer changed by set_thrust() or set_val()."""
+        for i, actuator in enumerate(self._actuators):
+            self._live[i] = not actuator.stopped
+            if actuator.stopped:
+                self.outputs[i] = actuator.output
+        if self.link is not None:
+            self.link.flush(urgent=True)  # the safe values stop() wrote go out now
+
+    def tick(self):
+        """Write every output to its pins, and flush the link."""
+        start = self.clock()
+        for actuator, value in zip(self._actuators, self.outputs.tolist()):
+            actuator.write(value)
+        if self.link is not None:
+            self.link.flush()
+        self.ticks += 1
+        self.tick_time.record((self.clock() - start) * 1000)
+
+    def stats(self) -> dict:
+        """Return the number of actuators and ticks, and the time per tick (ms)."""
+        return {
+            "actuators": len(self.names),
+            "ticks": self.ticks,
+            "tick_ms": self.tick_time.stats(),
+        }
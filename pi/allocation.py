@@ -0,0 +1,94 @@
+from typing import Mapping, Sequence
+
+import numpy as np
+
+from common import utils
+
+AXES = utils.VelocityVector.FIELDS  # order of the allocation matrix's columns
+
+# thruster: coefficient of each axis, as tuned on the ROV (includes the wiring of the
+# reversed thrusters, so it is not derived from the geometry)
+DEFAULT_MIX = {
+    "front_left_horizontal": {"x": 1, "y": 1, "yaw": 1},
+    "front_right_horizontal": {"x": -1, "y": 1, "yaw": -1},
+    "back_left_horizontal": {"x": -1, "y": 1, "yaw": 1},
+    "back_right_horizontal": {"x": 1, "y": 1, "yaw": 1},
+    "front_left_vertical": {"z": 1, "pitch": 1, "roll": 1},
+    "front_right_vertical": {"z": 1, "pitch": 1, "roll": -1},
+    "back_left_vertical": {"z": 1, "pitch": -1, "roll": 1},
+    "back_right_vertical": {"z": 1, "pitch": -1, "roll": -1},
+}
+
+
+class ThrusterAllocator:
+    """Maps velocity commands to thruster outputs with one matrix-vector product.
+
+    The allocation matrix has one row per thruster and one column per axis in AXES. It is
+    built once, from a mix table or from the thrusters' geometry. Outputs are desaturated by
+    scaling the whole command down until no thruster exceeds [-1, 1], so the direction the
+    pilot commanded is kept when a thruster saturates.
+    """
+
+    def __init__(self, names: Sequence[str], matrix: np.ndarray):
+        """
+        Args:
+            names (Sequence[str]): thruster names, in the order of the matrix's rows
+            matrix (np.ndarray): allocation matrix, shape (len(names), len(AXES))
+        """
+        matrix = np.asarray(matrix, dtype=float)
+        if matrix.shape != (len(names), len(AXES)):
+            raise ValueError(f"allocation matrix must be {len(names)}x{len(AXES)}, "
+                             f"got {matrix.shape}")
+        self.names = tuple(names)
+        self.matrix = matrix
+
+    @classmethod
+    def from_mix(cls, mix: Mapping[str, Mapping[str, float]]) -> "ThrusterAllocator":
+        """Build an allocator from a table of per-axis coefficients.
+        Args:
+            mix (Mapping): thruster name: {axis: coefficient}, missing axes are 0
+        """
+        matrix = [[coefficients.get(axis, 0.0) for axis in AXES] for coefficients in mix.values()]
+        return cls(list(mix), np.array(matrix))
+
+    @classmethod
+    def from_geometry(
+        cls, geometry: Mapping[str, tuple[Sequence[float], Sequence[float]]]
+    ) -> "ThrusterAllocator":
+        """Build an allocator from where each thruster is and which way it pushes.
+
+        The wrench of the thrusters (forces and torques, in AXES order: yaw about z, pitch
+        about x, roll about y) is inverted with a pseudo-inverse, and each axis is scaled so
+        a full command on it drives the most loaded thruster to full.
+        Args:
+            geometry (Mapping): thruster name: (position (m), thrust direction), both x, y, z
+                with the ROV heading along +y
+        """
+        columns = []
+        for position, direction in geometry.values():
+            direction = np.asarray(direction, dtype=float)
+            direction = direction / np.linalg.norm(direction)
+            torque = np.cross(np.asarray(position, dtype=float), direction)
+            columns.append([*direction, torque[2], torque[0], torque[1]])
+        matrix = np.linalg.pinv(np.array(columns).T)
+        peak = np.abs(matrix).max(axis=0)
+        matrix = matrix / np.where(peak > 1e-9, peak, 1.0)
+        return cls(list(geometry), matrix)
+
+    def allocate(self, velocity: np.ndarray, gains: np.ndarray | None = None) -> np.ndarray:
+        """Compute thruster outputs.
+        Args:
+            velocity (np.ndarray): command(s) in AXES order, shape (6,) or (n, 6)
+            gains (np.ndarray): per-thruster gain applied before desaturation, shape (8,)
+        Returns:
+            np.ndarray: outputs in [-1, 1], shape (8,) or (n, 8)
+        """
+        thrust = np.asarray(velocity, dtype=float) @ self.matrix.T
+        if gains is not None:
+            thrust = thrust * gains
+        peak = np.abs(thrust).max(axis=-1, keepdims=True)
+        return thrust / np.maximum(peak, 1.0)
+
+    def to_dict(self, thrust: np.ndarray) -> dict[str, float]:
+        """Return one allocate() output as {thruster name: output}."""
+        return dict(zip(self.names, thrust.tolist()))
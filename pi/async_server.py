@@ -1,23 +1,54 @@
 import asyncio
-import json
+import logging
 import os
-import time
 
 import pyfirmata
 from pyfirmata import Pin
 
-from common import utils
+from common import codec, log, utils
 
-from .hardware import Servo, Thruster, LinActuator
+from .command_channel import CommandProtocol
+from .connection import Connection
+from .dispatcher import Dispatcher
+from .hardware import DepthSensor, IMUSensor, Servo, Thruster, LinActuator
+from .output_link import ACTUATOR, CAMERA, THRUSTER, OutputLink, OutputPin
+from .publisher import Publisher
 from .rov_state import ROVState
+from .serial_writer import SerialWriter
+from .shared_sample import DEPTH_NAME, IMU_NAME, SharedSample
+from .thrust_curve import ThrustCurve
 
 SERVER_IP = "192.168.0.102"  # raspberry pi ip
 PORT = 2049
 ARDUINO_PORT = "/dev/ttyUSB0"
-RESPONSE_LOOP_FREQ = 10 # Hz
+# thrust against pulse width of the thrusters, for equal thrust forwards and in reverse
+THRUST_CURVE = os.path.join(os.path.dirname(__file__), "thrust_curves", "t200_16v.csv")
+# curve the real thrusters' commands are mapped through, e.g. THRUST_CURVE. Linear over
+# active_range if unset: THRUST_CURVE is read off the published chart, and would lower
+# full forward to 1700/1740 us until it is replaced with bench measurements
+THRUSTER_CALIBRATION = os.environ.get("THRUSTER_CALIBRATION")
+# with SENSOR_SHM set, the IMU and depth sensor are read by pi.imu and pi.depth-sensor
+# running as their own processes, which write every sample to shared memory
+SENSOR_SHM = bool(os.environ.get("SENSOR_SHM"))
+MAX_PUBLISH_FREQ = 50  # Hz, highest rate a client may subscribe to a topic at
+KEYFRAME_PERIOD = 1.0  # s, time between full frames for clients subscribed to deltas
+# smallest change of a field that is sent to delta subscribers
+DELTA_THRESHOLDS = {
+    "imu_data": {
+        "acceleration": 0.05,  # m/s^2
+        "velocity": 0.01,  # m/s
+        "magnetometer": 0.5,  # uT
+        "game_quaternion": 0.001,
+    },
+    "depth": {"depth": 0.005, "rate": 0.005},  # m, m/s
+    "status_flags": 0.001,
+}
+
+logger = logging.getLogger("pi.async_server")
 
 if os.environ.get("SIM"):
-    from .sim_hardware import SimThruster
+    from .allocation import ThrusterAllocator
+    from .sim_hardware import SIM_GEOMETRY, ROVSim, SimPin
 
     SERVER_IP = "127.0.0.1"
 
@@ -27,40 +58,61 @@ class Server:
 
     def __init__(self):
         self.loop = asyncio.get_event_loop()
-        self.lock = asyncio.Lock()
         self.tasks = []
-        self.incoming = []
-        self.last_update = utils.time_ms()
+        # shared by all connections
+        self.dispatcher = Dispatcher()
+        self.publisher = Publisher(MAX_PUBLISH_FREQ, KEYFRAME_PERIOD)
+        self.connections: set[Connection] = set()
+        self.command_protocol = None  # udp command channel, created in run()
+        self.link = None  # firmata output, created with the board
+        self.writer = None  # thread doing the serial writes, created with the board
+        self.sim = None  # simulated ROV, in SIM mode
         if not os.environ.get("SIM"):
             self._init_firmata()
+            # pin writes go out on change, thrusters first, within the serial link's budget,
+            # and are written to the port from a thread of their own
+            self.writer = SerialWriter(self.board)
+            self.writer.start()
+            self.link = OutputLink(writer=self.writer)
+            curve = ThrustCurve.from_csv(THRUSTER_CALIBRATION) if THRUSTER_CALIBRATION else None
+            if SENSOR_SHM:
+                sensors = {}
+                shared = [SharedSample(codec.IMU_DATA, IMU_NAME),
+                          SharedSample(codec.DEPTH, DEPTH_NAME)]
+            else:
+                sensors = {
+                    "imu": IMUSensor(bus=8, freq=100),
+                    "depth": DepthSensor(bus=1, freq=20),
+                }
+                shared = ()
             self.rov_state = ROVState(
                 actuators={
                     "rotate": Servo(self._get_pin(10, "s")),
                     "close_main": Servo(self._get_pin(11, "s")),
                     "close_side": Servo(self._get_pin(12, "s")),
-                    "camera_servo": Servo(self._get_pin(13, "s")),
+                    "camera_servo": Servo(self._get_pin(13, "s", CAMERA)),
                     "extend": LinActuator(self._get_pin(15, "o"), self._get_pin(14, "o")),
                     "sample": LinActuator(self._get_pin(18, "o"), self._get_pin(19, "o")),
                 },
                 thrusters={
                     #remove to isolate claw
-                    "front_left_horizontal": Thruster(self._get_pin(2, "s"), active_range=(1250, 1750), reverse=True),
-                    "front_right_horizontal": Thruster(self._get_pin(4, "s"), active_range=(1250, 1750), reverse=True),
-                    "back_left_horizontal": Thruster(self._get_pin(6, "s"), active_range=(1250, 1750)),
-                    "back_right_horizontal": Thruster(self._get_pin(8, "s"), active_range=(1250, 1750)),
-                    "front_left_vertical": Thruster(self._get_pin(3, "s"), reverse=True),
-                    "front_right_vertical": Thruster(self._get_pin(25, "s"), reverse=True),
-                    "back_left_vertical": Thruster(self._get_pin(27, "s"), reverse=True),
-                    "back_right_vertical": Thruster(self._get_pin(9, "s"), reverse=True),
-                },
-                sensors={
-
+                    "front_left_horizontal": Thruster(self._get_pin(2, "s", THRUSTER), active_range=(1250, 1750), reverse=True, curve=curve),
+                    "front_right_horizontal": Thruster(self._get_pin(4, "s", THRUSTER), active_range=(1250, 1750), reverse=True, curve=curve),
+                    "back_left_horizontal": Thruster(self._get_pin(6, "s", THRUSTER), active_range=(1250, 1750), curve=curve),
+                    "back_right_horizontal": Thruster(self._get_pin(8, "s", THRUSTER), active_range=(1250, 1750), curve=curve),
+                    "front_left_vertical": Thruster(self._get_pin(3, "s", THRUSTER), reverse=True, curve=curve),
+                    "front_right_vertical": Thruster(self._get_pin(25, "s", THRUSTER), reverse=True, curve=curve),
+                    "back_left_vertical": Thruster(self._get_pin(27, "s", THRUSTER), reverse=True, curve=curve),
+                    "back_right_vertical": Thruster(self._get_pin(9, "s", THRUSTER), reverse=True, curve=curve),
                 },
+                sensors=sensors,
                 status_flags={
                     "agnes_mode": False,
                     "agnes_factor": 0.3,
                     "auto_depth": False,
-                }
+                },
+                link=self.link,
+                shared=shared,
             )
             self.board.servo_config(3, 1100, 1900, 1500)
             self.board.servo_config(5, 1100, 1900, 1500)
@@ -72,20 +124,33 @@ class Server:
             print(f"{'='*10} SIMULATION MODE. Type YES to continue {'='*10}")
             if input() != "YES":
                 raise RuntimeError("Simulation mode not confirmed")
+            curve = ThrustCurve.from_csv(THRUST_CURVE)
+            thrusters = {name: Thruster(SimPin(), curve=curve) for name in SIM_GEOMETRY}
+            # thrust on the pins moves the simulated ROV, which posts IMU and depth readings
+            self.sim = ROVSim(thrusters, curve, depth_noise=0.002)
             self.rov_state = ROVState(
-                actuators={},
-                thrusters={
-                    "front_left_horizontal": SimThruster(4),
-                    "front_right_horizontal": SimThruster(5),
-                    "back_left_horizontal": SimThruster(6),
-                    "back_right_horizontal": SimThruster(7),
-                    "front_left_vertical": SimThruster(8),
-                    "front_right_vertical": SimThruster(9),
-                    "back_left_vertical": SimThruster(10),
-                    "back_right_vertical": SimThruster(11),
+                actuators={
+                    "rotate": Servo(SimPin()),
+                    "close_main": Servo(SimPin()),
+                    "close_side": Servo(SimPin()),
+                    "camera_servo": Servo(SimPin()),
+                    "extend": LinActuator(SimPin(), SimPin()),
+                    "sample": LinActuator(SimPin(), SimPin()),
                 },
+                thrusters=thrusters,
                 sensors={},
+                status_flags={
+                    "agnes_mode": False,
+                    "agnes_factor": 0.3,
+                    "auto_depth": False,
+                },
+                allocator=ThrusterAllocator.from_geometry(SIM_GEOMETRY),
             )
+            self.tasks.append(self.sim.run(self.dispatcher))
+        self._register_handlers()
+        self._register_topics()
+        self.tasks.append(self.dispatcher.run())
+        self.tasks.append(self.publisher.run())
         self.tasks.append(self.rov_state.control_loop())
         self.tasks.extend(self.rov_state.get_tasks())
 
@@ -93,127 +158,113 @@ class Server:
         try:
             for task in self.tasks:
                 task.cancel()
+            self.rov_state.poller.close()
         except:  # pylint: disable=bare-except
             pass
         self.loop.close()
 
     def _init_firmata(self):
         self.board = pyfirmata.ArduinoMega(ARDUINO_PORT)
-        print("Successfully connected to Arduino")
+        logger.info("Successfully connected to Arduino")
         it = pyfirmata.util.Iterator(self.board)
         it.start()
 
-    def _get_pin(self, pin: int, mode: str = "o") -> Pin:
-        """get a pin from the board. mode can be 'i', 'o', or 's' for servo"""
+    def _get_pin(self, pin: int, mode: str = "o", priority: int = ACTUATOR) -> OutputPin:
+        """get a pin from the board, written through self.link. mode can be 'i', 'o', or 's'
+        for servo. priority is THRUSTER, ACTUATOR or CAMERA, lower is sent first"""
         assert self.board is not None
-        return self.board.get_pin(f"d:{pin}:{mode}")
+        return self.link.pin(self.board.get_pin(f"d:{pin}:{mode}"), priority)
     
     async def run(self):
         """run the server"""
         _server = await asyncio.start_server(self._handle_client, SERVER_IP, PORT)
-        print(f"{len(self.tasks)}") 
-        for task in self.tasks:
-            print("ensuring future")
-            asyncio.create_task(task)
+        # pilot commands may also arrive as datagrams on the same port number
+        _, self.command_protocol = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: CommandProtocol(self.rov_state), local_addr=(SERVER_IP, PORT)
+        )
+        logger.info("starting %d tasks", len(self.tasks))
+        self.tasks = [asyncio.create_task(task) for task in self.tasks]
         async with _server:
-            print(f"Ready to accept connection. Please start client.py {SERVER_IP=} {PORT=}")
+            logger.info("Ready to accept connection. Please start client.py %s:%d", SERVER_IP, PORT)
             await _server.serve_forever()
 
     async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
-        """called when a client connects to the server"""
-        print("client connected:")
-        asyncio.create_task(self._parse())
-        print("started parser")
-        
-        async def read_messages():
-            """reads incoming messages"""
-            msg = (await reader.read(1024)).decode("utf-8")
-            print(f"received first message: {msg}")
-            while msg:
-                async with self.lock:
-                    for spl in msg.split("~"):
-                        if (spl.strip() != ""):
-                            self.incoming.append(spl)
-                    self.last_update = utils.time_ms()
-                msg = (await reader.read(1024)).decode("utf-8")
-            print("client disconnected, closing parser")
-        
-        async def send_responses():
-            """sends responses to clients"""
-            last_response_time = time.time()
-            while True:
-                response = {
-                    "imu_data": json.dumps(self.rov_state._current_imu_data),
-                    "depth": json.dumps(self.rov_state._current_depth),
-                    "status_flags": json.dumps(self.rov_state.status_flags),
-                }
-                await self._send_response(writer, response)
-                if time.time() - last_response_time < 1 / RESPONSE_LOOP_FREQ:
-                    await asyncio.sleep(1 / RESPONSE_LOOP_FREQ - (time.time() - last_response_time))
-                else:
-                    print("Warning: write loop took too long")
-                last_response_time = time.time()
-
-        asyncio.create_task(read_messages())
-        asyncio.create_task(send_responses())
-        
-        print("started reader and writer")
-
-    async def _send_response(self, writer: asyncio.StreamWriter, response: dict):
-        """send a response back to the client"""
+        """called when a client connects to the server. Returns once the client disconnects."""
+        connection = Connection(
+            reader, writer, self.dispatcher, self.publisher, self._welcome()
+        )
+        logger.info("client connected: %s", connection.peer)
+        self.connections.add(connection)
         try:
-            msg = json.dumps(response)
-            writer.write(str.encode(msg))
-            await writer.drain()
-        except Exception as e:
-            print(f"Error sending response: {e}")
-
-    async def _parse(self):
-        """parses incoming messages"""
-        while True:
-            await asyncio.sleep(0.005)
-            async with self.lock:
-                if len(self.incoming) > 0:
-                    msg = self.incoming.pop()
-                    if len(self.incoming) > 5:
-                        self.incoming = []
-                else:
-                    msg = None
-            
-            if msg is None:
-                await asyncio.sleep(0.01)
-                continue
-
-            try:
-                json_msg = json.loads(msg)
-            except json.JSONDecodeError as e:
-                print(f"error decoding json: {e} | received: {msg}")
-                continue
-
-            if "target_velocity" in json_msg:
-                self.rov_state.set_target_velocity(
-                    utils.VelocityVector(json.loads(json_msg["target_velocity"]))
-                )
-
-            if "status_flags" in json_msg:
-                self.rov_state.set_status_flags(dict(json.loads(json_msg["status_flags"])))
-
-            if "imu_data" in json_msg:
-                self.rov_state.set_current_imu_data(
-                    dict(json.loads(json_msg["imu_data"]))
-                )
-
-            if "claw_movement" in json_msg:
-                self.rov_state.set_claw_movement(
-                    dict(json.loads(json_msg["claw_movement"]))
-                )
-            
-            if "depth" in json_msg:
-                self.rov_state.set_current_depth(
-                    list(json.loads(json_msg["depth"]))
-                )
+            await connection.serve()
+        finally:
+            self.connections.discard(connection)
+            logger.info("live connections: %s", self.stats())
+
+    def _welcome(self) -> dict:
+        """handshake parameters advertised to every client when it connects"""
+        return {
+            "version": codec.PROTOCOL_VERSION,
+            "control_loop_freq": self.rov_state.control_loop_frequency,
+            "command_timeout": self.rov_state.command_timeout,
+        }
+
+    def stats(self) -> dict:
+        """Return the number of live connections and tasks, the rate each client negotiated,
+        the publisher's feeds, the udp command channel's counters, the emergency stop's
+        receipt to pin write latency, the control loop's timing and the cost of writing the
+        actuator outputs, the serial link's load and writer thread, the sensors' rates, read
+        latency and errors, and the age of the samples read from shared memory."""
+        return {
+            "connections": len(self.connections),
+            "connection_tasks": sum(conn.live_tasks for conn in self.connections),
+            "publish_rates": {str(conn.peer): conn.publish_rate for conn in self.connections},
+            "feeds": self.publisher.stats(),
+            "commands": self.command_protocol.stats() if self.command_protocol else {},
+            "estop": self.dispatcher.stats()[codec.ESTOP],
+            "control_loop": self.rov_state.scheduler.stats(),
+            "actuators": self.rov_state.driver.stats(),
+            "serial_link": self.link.stats() if self.link else {},
+            "serial_writer": self.writer.stats() if self.writer else {},
+            "sensors": self.rov_state.poller.stats(),
+            "shared_sample_age_ms": {
+                topic: age.stats() for topic, age in self.rov_state.shared_age.items()
+            },
+        }
+
+    def _register_handlers(self):
+        """route each incoming topic to the matching ROVState setter"""
+        self.dispatcher.register(
+            codec.TARGET_VELOCITY,
+            lambda msg: self.rov_state.set_target_velocity(utils.VelocityVector(msg)),
+        )
+        self.dispatcher.register(codec.STATUS_FLAGS, self.rov_state.set_status_flags)
+        self.dispatcher.register(codec.IMU_DATA, self.rov_state.set_current_imu_data)
+        self.dispatcher.register(codec.CLAW_MOVEMENT, self.rov_state.set_claw_movement)
+        self.dispatcher.register(codec.DEPTH, self.rov_state.set_current_depth)
+        # handled in the reading task as soon as the frame is decoded, not on the next dispatch
+        self.dispatcher.register(codec.ESTOP, self.rov_state.emergency_stop, immediate=True)
+
+    def _register_topics(self):
+        """make ROVState telemetry available to subscribing clients"""
+        self.publisher.add_topic(
+            codec.IMU_DATA,
+            lambda: self.rov_state._current_imu_data,
+            DELTA_THRESHOLDS[codec.IMU_DATA],
+        )
+        self.publisher.add_topic(
+            codec.DEPTH,
+            lambda: self.rov_state._current_depth_data,
+            DELTA_THRESHOLDS[codec.DEPTH],
+        )
+        self.publisher.add_topic(
+            codec.STATUS_FLAGS,
+            lambda: self.rov_state.status_flags,
+            DELTA_THRESHOLDS[codec.STATUS_FLAGS],
+        )
 
 
 if __name__ == "__main__":
+    log.setup()
     server = Server()
     asyncio.run(server.run())
@@ -0,0 +1,244 @@
+"""Micro-benchmarks for the hot paths in pi.
+
+Run with `python -m pi.benchmarks`. Each benchmark prints the time per call of the current
+implementation next to the one it replaced.
+"""
+
+import asyncio
+import multiprocessing
+import socket
+import time
+import uuid
+
+import numpy as np
+
+import ms5837
+from common import codec
+from common.benchmarks import report
+
+from .actuator_driver import ActuatorDriver
+from .allocation import DEFAULT_MIX
+from .hardware import LinActuator, Servo, Thruster
+from .shared_sample import SharedSample
+
+CLAW = {"extend": 0, "rotate": 90, "close_main": 90, "close_side": 90, "sample": 0,
+        "camera_servo": 90}
+
+
+class NullPin:
+    """pin that drops every write"""
+
+    def write(self, value):
+        pass
+
+
+def make_actuators() -> tuple[dict, dict]:
+    """the 8 thrusters and 6 claw actuators of the ROV, on pins that do nothing"""
+    thrusters = {
+        name: Thruster(NullPin(), reverse=name.endswith("vertical")) for name in DEFAULT_MIX
+    }
+    actuators = {
+        name: Servo(NullPin()) for name in ("rotate", "close_main", "close_side", "camera_servo")
+    }
+    actuators["extend"] = LinActuator(NullPin(), NullPin())
+    actuators["sample"] = LinActuator(NullPin(), NullPin())
+    return thrusters, actuators
+
+
+def bench_actuator_tick(number: int = 5000):
+    """setting and writing the 14 outputs once, per control loop tick"""
+    thrusters, actuators = make_actuators()
+    thrust = np.linspace(-1, 1, len(thrusters))
+    mix = dict(zip(thrusters, thrust.tolist()))
+    driver = ActuatorDriver({**thrusters, **actuators}, thrusters=list(thrusters))
+
+    async def gather_set_val():
+        # as the control loop did: 14 set_val coroutines, each taking its actuator's lock.
+        # The pins were then written by each actuator's own run() task, not counted here.
+        start = time.perf_counter()
+        for _ in range(number):
+            await asyncio.gather(
+                *(thrusters[name].set_val(value) for name, value in mix.items()),
+                *(actuators[name].set_val(value) for name, value in CLAW.items()),
+            )
+        return (time.perf_counter() - start) / number * 1e6
+
+    def driver_tick():
+        start = time.perf_counter()
+        for _ in range(number):
+            driver.set_thrust(thrust)
+            for name, value in CLAW.items():
+                driver.set_val(name, value)
+            driver.tick()
+        return (time.perf_counter() - start) / number * 1e6
+
+    report(
+        "set and write 14 actuator outputs",
+        min(asyncio.run(gather_set_val()) for _ in range(5)),
+        min(driver_tick() for _ in range(5)),
+    )
+
+
+def bench_ms5837_compensation(samples: int = 2_000_000):
+    """compensating raw MS5837 counts, per sample, as when reprocessing a raw log"""
+    rng = np.random.default_rng(0)
+    d1 = rng.integers(4_000_000, 9_000_000, samples)
+    d2 = rng.integers(6_000_000, 10_500_000, samples)
+    prom = [0, 46372, 43981, 29059, 27842, 31553, 28165]
+    sensor = ms5837.MS5837.__new__(ms5837.MS5837)  # no bus needed to compute
+    sensor._model = ms5837.MODEL_02BA
+    sensor._C = prom
+    sensor._fluidDensity = ms5837.DENSITY_FRESHWATER
+    scalar_samples = samples // 20
+
+    def scalar():
+        start = time.perf_counter()
+        for sensor._D1, sensor._D2 in zip(d1[:scalar_samples].tolist(),
+                                          d2[:scalar_samples].tolist()):
+            sensor._calculate()
+            sensor.depth()
+        return (time.perf_counter() - start) / scalar_samples * 1e6
+
+    def vectorized():
+        start = time.perf_counter()
+        ms5837.compensate(d1, d2, prom, ms5837.MODEL_02BA)
+        return (time.perf_counter() - start) / samples * 1e6
+
+    report(
+        f"compensate {samples} MS5837 samples",
+        min(scalar() for _ in range(3)),
+        min(vectorized() for _ in range(3)),
+    )
+
+
+def publish_depth(path: str, address, count: int, freq: float, times):
+    """sensor process: publish count depth samples at freq over path, then their send times"""
+    if path == "socket":
+        sock = socket.create_connection(address)
+        publish = lambda msg: sock.sendall(codec.encode(codec.DEPTH, msg))
+    else:
+        shared = SharedSample(codec.DEPTH, address)
+        shared.open()
+        publish = shared.write
+    sent = []
+    deadline = time.monotonic()
+    for i in range(count):
+        deadline += 1 / freq
+        while time.monotonic() < deadline:
+            time.sleep(max(0.0, deadline - time.monotonic() - 0.0005))
+        sent.append(time.monotonic())
+        publish({"depth": float(i), "rate": 0.0})
+    times.put(sent)
+
+
+def bench_sensor_ipc(count: int = 1000, freq: float = 200.0, tick_freq: float = 100.0):
+    """age of the newest depth sample at each control loop tick, from a sensor process"""
+    # spawned, so the sensor process has its own resource tracker, as it would on the Pi
+    context = multiprocessing.get_context("spawn")
+
+    async def ticks(newest, sent_times) -> float:
+        # what the control loop sees: at every tick, how old the newest sample it has is
+        ages = []
+        start = time.monotonic()
+        while time.monotonic() - start < count / freq:
+            await asyncio.sleep(1 / tick_freq)
+            sample = newest()
+            if sample is not None:
+                ages.append((time.monotonic(), sample))
+        sent = sent_times()
+        return np.mean([now - sent[i] for now, i in ages]) * 1e6
+
+    async def over_socket():
+        latest = [None]
+        done = asyncio.Event()
+
+        async def handle(reader, writer):
+            try:
+                while True:
+                    _, msg = await codec.read_frame(reader)
+                    latest[0] = int(msg["depth"])
+            except asyncio.IncompleteReadError:
+                done.set()
+
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        times = context.Queue()
+        process = context.Process(target=publish_depth, args=(
+            "socket", server.sockets[0].getsockname(), count, freq, times))
+        process.start()
+        age = await ticks(lambda: latest[0], times.get)
+        await done.wait()
+        process.join()
+        server.close()
+        return age
+
+    async def over_shared_memory():
+        name = f"bench_{uuid.uuid4().hex[:12]}"
+        owner = SharedSample(codec.DEPTH, name, create=True)
+        reader = SharedSample(codec.DEPTH, name)
+        reader.open()
+        times = context.Queue()
+        process = context.Process(target=publish_depth, args=(
+            "shm", name, count, freq, times))
+        process.start()
+
+        def newest():
+            sample = reader.read()
+            return int(sample[2]["depth"]) if sample else None
+
+        age = await ticks(newest, times.get)
+        process.join()
+        reader.close()
+        owner.close(unlink=True)
+        return age
+
+    report(
+        f"depth sample age at a {tick_freq:g} Hz tick",
+        asyncio.run(over_socket()),
+        asyncio.run(over_shared_memory()),
+    )
+
+    # cost of moving one sample, in one process
+    left, right = socket.socketpair()
+    right.setblocking(False)
+    name = f"bench_{uuid.uuid4().hex[:12]}"
+    shared = SharedSample(codec.DEPTH, name, create=True)
+    msg = {"depth": 1.0, "rate": 0.0}
+    header = codec.HEADER.size
+
+    def socket_path(number=20000):
+        start = time.perf_counter()
+        for _ in range(number):
+            left.sendall(codec.encode(codec.DEPTH, msg))
+            frame = right.recv(64)
+            length, topic_id = codec.HEADER.unpack_from(frame)
+            codec.decode(topic_id, frame[header:header + length])
+        return (time.perf_counter() - start) / number * 1e6
+
+    def shared_path(number=20000):
+        start = time.perf_counter()
+        for _ in range(number):
+            shared.write(msg)
+            shared.read()
+        return (time.perf_counter() - start) / number * 1e6
+
+    report(
+        "publish and read one depth sample",
+        min(socket_path() for _ in range(5)),
+        min(shared_path() for _ in range(5)),
+    )
+    left.close()
+    right.close()
+    shared.close(unlink=True)
+
+
+BENCHMARKS = {
+    "actuator_tick": bench_actuator_tick,
+    "ms5837_compensation": bench_ms5837_compensation,
+    "sensor_ipc": bench_sensor_ipc,
+}
+
+
+if __name__ == "__main__":
+    print(f"{'benchmark':<40} {'before':>12} {'after':>12} {'speedup':>8}")
+    for benchmark in BENCHMARKS.values():
+        benchmark()
@@ -0,0 +1,55 @@
+import asyncio
+import logging
+
+from common import codec, log, utils
+
+from .rov_state import ROVState
+
+logger = logging.getLogger(__name__)
+
+
+class CommandProtocol(asyncio.DatagramProtocol):
+    """Low latency UDP channel for pilot commands.
+
+    Each datagram holds one sequenced target_velocity or claw_movement frame. Commands are
+    applied to the ROVState as soon as they arrive, without going through the dispatcher,
+    and ROVState drops the ones that arrive out of order or late. A lost datagram is simply
+    replaced by the next one, so a retransmit can never hold newer commands back.
+    """
+
+    def __init__(self, rov_state: ROVState):
+        self.rov_state = rov_state
+        self.received = 0
+        self.applied = 0
+        self.errors = 0
+
+    def datagram_received(self, data: bytes, addr):
+        self.received += 1
+        try:
+            seq, sent_at, topic, msg = codec.decode_datagram(data)
+        except codec.CodecError as e:
+            self.errors += 1
+            logger.warning("error decoding datagram from %s: %s", addr, e, extra=log.every(1.0))
+            return
+        if topic == codec.TARGET_VELOCITY:
+            applied = self.rov_state.set_target_velocity(utils.VelocityVector(msg), seq, sent_at)
+        elif topic == codec.CLAW_MOVEMENT:
+            applied = self.rov_state.set_claw_movement(msg, seq, sent_at)
+        else:
+            # status flags and configuration must use the reliable tcp connection
+            self.errors += 1
+            return
+        if applied:
+            self.applied += 1
+
+    def stats(self) -> dict[str, int]:
+        """Return datagram counters."""
+        return {
+            "received": self.received,
+            "applied": self.applied,
+            "errors": self.errors,
+            "velocity_out_of_order": self.rov_state._target_velocity_filter.out_of_order,
+            "velocity_stale": self.rov_state._target_velocity_filter.stale,
+            "claw_out_of_order": self.rov_state._claw_filter.out_of_order,
+            "claw_stale": self.rov_state._claw_filter.stale,
+        }
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import time
+
+from common import codec, log
+
+from .dispatcher import Dispatcher
+from .publisher import Publisher
+
+MAX_WRITE_BUFFER = 64 * 1024  # bytes queued for a client before frames to it are skipped
+
+logger = logging.getLogger(__name__)
+
+
+class Connection:
+    """A single client connection.
+
+    Owns the client's reader and writer and the tasks serving them. The server opens with a
+    welcome advertising its protocol version, control loop rate and command timeout. The
+    client answers with a hello holding its protocol version, the rate it chose to publish at,
+    and declaring the topics it publishes and the topics (with rate and full or
+    delta mode) it subscribes to. Frames on topics the client did not declare are ignored,
+    and it is only sent the topics it subscribed to, except for the emergency stop, which is
+    always accepted. When the client disconnects every task of the connection is cancelled,
+    its subscriptions are removed and the socket is closed.
+    """
+
+    def __init__(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        dispatcher: Dispatcher,
+        publisher: Publisher,
+        welcome: dict,
+    ):
+        """
+        Args:
+            reader (asyncio.StreamReader): client reader
+            writer (asyncio.StreamWriter): client writer
+            dispatcher (Dispatcher): dispatcher shared by all connections
+            publisher (Publisher): publisher shared by all connections
+            welcome (dict): welcome message sent to the client when it connects
+        """
+        self.reader = reader
+        self.writer = writer
+        self.dispatcher = dispatcher
+        self.publisher = publisher
+        self.welcome = welcome
+        self.publish_rate = None  # rate (Hz) the client negotiated, None until hello
+        self.peer = writer.get_extra_info("peername")
+        self.publishes: set[str] | None = None  # None until the client says hello
+        self.subscriptions: dict[str, float] = {}  # topic: rate (Hz)
+        self.rejected = 0  # frames on topics the client did not declare
+        self.tasks: list[asyncio.Task] = []
+        self.closed = False
+
+    @property
+    def live_tasks(self) -> int:
+        """number of tasks of this connection that are still running"""
+        return sum(1 for task in self.tasks if not task.done())
+
+    async def serve(self):
+        """Serve the client until it disconnects, then clean up."""
+        self.send(codec.encode(codec.WELCOME, self.welcome))
+        self.tasks = [asyncio.create_task(self._read_messages())]
+        try:
+            # any task finishing means the connection is over
+            await asyncio.wait(self.tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            await self.close()
+
+    async def close(self):
+        """Cancel all tasks of the connection, drop its subscriptions and close the socket."""
+        if self.closed:
+            return
+        self.closed = True
+        self.publisher.unsubscribe(self)
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+        logger.info("client disconnected: %s", self.peer)
+
+    def send(self, frame: bytes) -> bool:
+        """Queue encoded frames for the client without waiting.
+        Returns:
+            bool: False if the client is gone or too far behind to take more data
+        """
+        if self.closed or self.writer.is_closing():
+            return False
+        if self.writer.transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+            return False
+        self.writer.write(frame)
+        return True
+
+    def _on_hello(self, hello: dict) -> bool:
+        """apply the client's declared publications and subscriptions
+        Returns:
+            bool: False if the client speaks another protocol version
+        """
+        if hello["version"] != self.welcome["version"]:
+            logger.error("%s uses protocol version %s, expected %s. Closing connection.",
+                         self.peer, hello["version"], self.welcome["version"])
+            return False
+        self.publish_rate = hello["publish_rate"]
+        self.publishes = set(hello["publishes"])
+        self.publisher.unsubscribe(self)
+        self.subscriptions = {}
+        for topic, rate in hello["subscribes"].items():
+            if self.publisher.subscribe(self, topic, rate, delta=topic in hello["delta"]):
+                self.subscriptions[topic] = rate
+            else:
+                logger.warning("%s cannot subscribe to %s at %s Hz", self.peer, topic, rate)
+        logger.info("%s publishes %s at %g Hz (control loop %g Hz), subscribes %s",
+                    self.peer, sorted(self.publishes), self.publish_rate,
+                    self.welcome["control_loop_freq"], self.subscriptions)
+        return True
+
+    async def _read_messages(self):
+        """reads incoming frames and posts them to the dispatcher"""
+        while True:
+            try:
+                topic, msg = await codec.read_frame(self.reader)
+                received_at = time.perf_counter()
+            except (asyncio.IncompleteReadError, ConnectionError):
+                return
+            except codec.CodecError as e:
+                logger.warning("error decoding frame from %s: %s", self.peer, e,
+                               extra=log.every(1.0))
+                continue
+            if topic == codec.HELLO:
+                if not self._on_hello(msg):
+                    return
+            elif (self.publishes is not None and topic not in self.publishes
+                  and topic != codec.ESTOP):
+                self.rejected += 1
+            else:
+                self.dispatcher.post(topic, msg, received_at)
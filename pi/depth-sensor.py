@@ -1,76 +1,107 @@
+import logging
 import ms5837
-import json
 import os
 import socket
 import time
 
+from common import codec, log
+
+from .depth_estimator import DepthEstimator
+from .shared_sample import DEPTH_NAME, SharedSample
+
 HOST = "192.168.0.102"  # The server's hostname or IP address
 PORT = 2049  # The port used by the server
 CONTROL_LOOP_FREQ = 10  # Hz
+# file the raw D1/D2 counts of every read are appended to, to reprocess them offline with
+# ms5837.compensate(); not logged if unset
+RAW_LOG = os.environ.get("DEPTH_RAW_LOG")
+# with SENSOR_SHM set, every estimate is written to shared memory for the server to read
+# instead of being sent over a socket
+SENSOR_SHM = bool(os.environ.get("SENSOR_SHM"))
 
-# Print readings
+logger = logging.getLogger("pi.depth_sensor")
+
+# Log readings
 def read_depth(sensor):
         if sensor.read():
-                print(("P: %0.1f mbar  %0.3f psi\tDepth: %0.3f\tT: %0.2f C  %0.2f F") % (
+                logger.debug("P: %0.1f mbar  %0.3f psi\tDepth: %0.3f\tT: %0.2f C  %0.2f F",
                 sensor.pressure(), # Default is mbar (no arguments)
                 sensor.pressure(ms5837.UNITS_psi), # Request psi
                 sensor.depth(),
                 sensor.temperature(), # Default is degrees C (no arguments)
-                sensor.temperature(ms5837.UNITS_Farenheit))) # Request Farenheit
+                sensor.temperature(ms5837.UNITS_Farenheit), # Request Farenheit
+                extra=log.sample(10))
                 return sensor.depth()
         else:
-                print("Sensor read failed!")
+                logger.warning("Sensor read failed!", extra=log.every(1.0))
                 raise LookupError("Encountered error reading from depth sensor: Sensor read failed")
 
-with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-    print(f"connecting to {HOST}:{PORT}")
+def connect():
+    """connect to the server and introduce this process as a depth publisher"""
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    logger.info("connecting to %s:%d", HOST, PORT)
     s.connect((HOST, PORT))
-    last_time = time.time()
-    sensor = ms5837.MS5837_02BA() # Default I2C bus is 1 (Raspberry Pi 3)
+    _, welcome = codec.recv_frame(s)
+    if welcome["version"] != codec.PROTOCOL_VERSION:
+        raise RuntimeError(f"server uses protocol version {welcome['version']}")
+    s.sendall(codec.encode(codec.HELLO, {
+        "publish_rate": CONTROL_LOOP_FREQ,
+        "publishes": [codec.DEPTH],
+        "subscribes": {},
+    }))
+    logger.info("publishing at %g Hz, server control loop %g Hz",
+                CONTROL_LOOP_FREQ, welcome["control_loop_freq"])
+    return s
+
+log.setup()
 
-    # We must initialize the sensor before reading it
-    while not sensor.init():
-        print("Error: depth sensor could not be initialized")
-        time.sleep(1.0)
+s = shared = None
+if SENSOR_SHM:
+    shared = SharedSample(codec.DEPTH, DEPTH_NAME, create=True)
+    logger.info("publishing at %g Hz into shared memory %s", CONTROL_LOOP_FREQ, DEPTH_NAME)
+else:
+    s = connect()
+last_time = time.time()
+sensor = ms5837.MS5837_02BA() # Default I2C bus is 1 (Raspberry Pi 3)
 
-    # TODO: Rewrite this to standard
-    # store target height as a variable
-    # come up with target velocity based on current velocity, 
-    # target height and target depth
-    # hardcode velocity scalar proportional to where we are and
-    # where we want to be, in rov_state.py
-    # might have to store a couple of depth values
-    # pop off end and stack with list- queue, need to be able to 
-    # average the whole thing
-    # init param! 
-    # send over to rov_state, rov_state only has the height setpoint
-    # get vector down from top, pick some scalar (whatever speaks to you emotionally)
-    # change it by that much based on the message you get
+# We must initialize the sensor before reading it
+while not sensor.init():
+    logger.error("depth sensor could not be initialized")
+    time.sleep(1.0)
 
-    depth_list = []
-    depth_list_length = 10
+# filtered depth and vertical rate, sent instead of an average of the last readings
+estimator = DepthEstimator()
 
+raw_log = None
+if RAW_LOG:
+    raw_log = open(RAW_LOG, "a", buffering=1 << 16)
+    # the calibration goes with the counts: np.loadtxt(RAW_LOG, delimiter=",") skips it
+    raw_log.write(f"# prom: {sensor.prom()}\n# time,D1,D2\n")
+
+try:
     while True:
-        # appends the newest depth to the depth list
-        # pops off the oldest if there are enough values
         try:
-            depth = read_depth(sensor)
-            depth_list.append(depth)
-            if len(depth_list) >= depth_list_length:
-                depth_list.pop(0)
-
-            msg = {
-                "depth": json.dumps(depth_list),
-            }
-            s.send(str.encode(json.dumps(msg) + "~"))
-            print(f"sent: {msg}")
+            estimate = estimator.update(read_depth(sensor))
+            if raw_log is not None:
+                d1, d2 = sensor.raw()
+                raw_log.write(f"{time.time():.3f},{d1},{d2}\n")
+            if shared is not None:
+                shared.write(estimate)
+            else:
+                s.sendall(codec.encode(codec.DEPTH, estimate))
+            logger.debug("sent: %s", estimate, extra=log.sample(10))
         except Exception as err:
-            print("Error encountered in depth sensor client execution: " + str(err))
+            logger.warning("Error encountered in depth sensor client execution: %s", err,
+                           extra=log.every(1.0))
 
         # sleep for remainder of loop
         if time.time() - last_time < 1 / CONTROL_LOOP_FREQ:
             time.sleep(1 / CONTROL_LOOP_FREQ - (time.time() - last_time))
         else:
-            print("Warning: control loop took too long")
+            logger.warning("control loop took too long", extra=log.every(1.0))
         last_time = time.time()
-
+finally:
+    if shared is not None:
+        shared.close(unlink=True)
+    if s is not None:
+        s.close()
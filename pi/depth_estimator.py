@@ -0,0 +1,139 @@
+"""Depth and vertical rate from the depth sensor's readings.
+
+DepthEstimator runs a two-state Kalman filter (depth, rate) with a constant-velocity model,
+in constant time per reading. It replaces the boxcar average of the last 10 readings, which
+lagged by half its length and knew nothing of the rate. Readings that are implausibly far
+from the prediction are rejected, and the innovations of the last readings are kept in a
+ring buffer to report how noisy the sensor is.
+"""
+
+import math
+import time
+from typing import Callable
+
+
+class DepthEstimator:
+    """Kalman filter of depth (m, positive down) and its rate (m/s, positive going deeper)."""
+
+    def __init__(
+        self,
+        noise: float = 0.005,
+        accel: float = 0.5,
+        gate: float = 5.0,
+        max_rejected: int = 5,
+        window: int = 50,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            noise (float): standard deviation (m) of the sensor's readings
+            accel (float): standard deviation (m/s^2) of the vertical acceleration, how fast
+                the rate is allowed to change
+            gate (float): readings more than gate standard deviations from the prediction
+                are rejected as glitches
+            max_rejected (int): rejected readings in a row after which the filter restarts
+                from the reading, so a real jump is not rejected forever
+            window (int): innovations kept for the noise statistics
+            clock (Callable): monotonic time source (s) of the readings
+        """
+        self.r = noise**2
+        self.q = accel**2
+        self.gate = gate
+        self.max_rejected = max_rejected
+        self.clock = clock
+        self.depth = 0.0
+        self.rate = 0.0
+        # covariance of (depth, rate)
+        self._p00 = self._p01 = self._p11 = 0.0
+        self._last: float | None = None  # time of the last reading, None before the first
+        self._rejected_run = 0
+        self._innovations = [0.0] * window  # ring buffer
+        self._index = 0
+        self._sum_squares = 0.0
+        self._recorded = 0
+        self.readings = 0
+        self.rejected = 0
+
+    def reset(self, depth: float, now: float):
+        """restart from a reading, at rest"""
+        self.depth = depth
+        self.rate = 0.0
+        self._p00 = self.r
+        self._p01 = 0.0
+        self._p11 = 1.0  # (m/s)^2, the rate is not known yet
+        self._last = now
+        self._rejected_run = 0
+
+    def update(self, depth: float, now: float | None = None) -> dict:
+        """Add a reading.
+        Args:
+            depth (float): depth (m) read by the sensor
+            now (float): time (s) of the reading, the clock's time if None
+        Returns:
+            dict: the estimate, as the DEPTH message ({"depth": m, "rate": m/s})
+        """
+        now = self.clock() if now is None else now
+        self.readings += 1
+        if self._last is None:
+            self.reset(depth, now)
+            return self.message()
+
+        # predict, with white noise acceleration between readings
+        dt = now - self._last
+        self._last = now
+        q = self.q
+        dt2 = dt * dt
+        p11 = self._p11
+        p01 = self._p01 + dt * p11
+        p00 = self._p00 + dt * (2 * self._p01 + dt * p11) + q * dt2 * dt2 / 4
+        p01 += q * dt2 * dt / 2
+        p11 += q * dt2
+        predicted = self.depth + self.rate * dt
+
+        innovation = depth - predicted
+        s = p00 + self.r
+        if innovation * innovation > self.gate * self.gate * s:
+            self.rejected += 1
+            self._rejected_run += 1
+            if self._rejected_run >= self.max_rejected:
+                self.reset(depth, now)
+            else:
+                self.depth = predicted
+                self._p00, self._p01, self._p11 = p00, p01, p11
+            return self.message()
+        self._rejected_run = 0
+        self._record(innovation)
+
+        k0 = p00 / s
+        k1 = p01 / s
+        self.depth = predicted + k0 * innovation
+        self.rate += k1 * innovation
+        self._p00 = (1 - k0) * p00
+        self._p01 = (1 - k0) * p01
+        self._p11 = p11 - k1 * p01
+        return self.message()
+
+    def _record(self, innovation: float):
+        """keep the innovation in the ring buffer, with a running sum of squares"""
+        old = self._innovations[self._index]
+        self._innovations[self._index] = innovation
+        self._index = (self._index + 1) % len(self._innovations)
+        self._sum_squares += innovation * innovation - old * old
+        self._recorded += 1
+
+    def message(self) -> dict:
+        """the current estimate, as the DEPTH message"""
+        return {"depth": self.depth, "rate": self.rate}
+
+    def stats(self) -> dict:
+        """Return the estimate, the reading counts and the RMS innovation (m) over the window,
+        which should stay close to the sensor noise."""
+        window = min(self._recorded, len(self._innovations))
+        return {
+            "depth": self.depth,
+            "rate": self.rate,
+            "readings": self.readings,
+            "rejected": self.rejected,
+            "innovation_rms": math.sqrt(max(self._sum_squares, 0.0) / window) if window else 0.0,
+            "depth_std": math.sqrt(self._p00),
+        }
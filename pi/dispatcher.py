@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import time
+from typing import Any, Callable
+
+from common import log
+
+logger = logging.getLogger(__name__)
+
+
+class Mailbox:
+    """Latest-wins slot for a single topic.
+
+    Only the newest undelivered message is kept. Counters record how many messages were
+    received, delivered to the handler, overwritten before delivery, or dropped, and how long
+    delivered messages took from receipt to the end of their handler.
+    """
+
+    def __init__(self):
+        self.value = None
+        self.received_at = None
+        self.full = False
+        self.received = 0
+        self.delivered = 0
+        self.overwritten = 0
+        self.dropped = 0
+        self.errors = 0
+        self.last_latency = 0.0  # s
+        self.max_latency = 0.0  # s
+
+    def put(self, value: Any, received_at: float | None = None):
+        """store a message, replacing an undelivered one"""
+        if self.full:
+            self.overwritten += 1
+        self.value = value
+        self.received_at = received_at
+        self.full = True
+        self.received += 1
+
+    def record_latency(self, received_at: float | None):
+        """record the time from receipt of a message to now, if the receipt time is known"""
+        if received_at is None:
+            return
+        self.last_latency = time.perf_counter() - received_at
+        self.max_latency = max(self.max_latency, self.last_latency)
+
+    def take(self) -> Any:
+        """remove and return the stored message"""
+        value = self.value
+        self.value = None
+        self.full = False
+        return value
+
+    def stats(self) -> dict[str, float]:
+        """Return counters and latencies."""
+        return {
+            "received": self.received,
+            "delivered": self.delivered,
+            "overwritten": self.overwritten,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "last_latency_ms": self.last_latency * 1000,
+            "max_latency_ms": self.max_latency * 1000,
+        }
+
+
+class Dispatcher:
+    """Event-driven dispatcher with one latest-wins mailbox per topic.
+
+    Readers call post() for every decoded message, which wakes run(). run() then hands the
+    newest message of every pending topic to that topic's handler, so a burst on one topic
+    can never push out the messages of another. Handlers registered as immediate, such as the
+    emergency stop, are instead called from post() itself, before the reader yields to any
+    other task.
+    """
+
+    def __init__(self):
+        self._handlers: dict[str, Callable[[Any], None]] = {}
+        self._immediate: set[str] = set()
+        self._mailboxes: dict[str, Mailbox] = {}
+        self._pending: dict[str, None] = {}  # topics with undelivered messages, in post order
+        self._wakeup = asyncio.Event()
+
+    def register(self, topic: str, handler: Callable[[Any], None], immediate: bool = False):
+        """Register the handler that receives messages of a topic.
+        Args:
+            topic (str): topic name
+            handler (Callable): called with the newest message of the topic
+            immediate (bool): call the handler synchronously from post(), for every message
+        """
+        self._handlers[topic] = handler
+        self._mailboxes.setdefault(topic, Mailbox())
+        if immediate:
+            self._immediate.add(topic)
+        else:
+            self._immediate.discard(topic)
+
+    def post(self, topic: str, value: Any, received_at: float | None = None):
+        """Store a message in its topic's mailbox and wake the dispatcher.
+        Args:
+            topic (str): topic name
+            value (Any): decoded message
+            received_at (float): time.perf_counter() when the message was read, for latency
+        """
+        mailbox = self._mailboxes.setdefault(topic, Mailbox())
+        if topic not in self._handlers:
+            mailbox.received += 1
+            mailbox.dropped += 1
+            return
+        if topic in self._immediate:
+            mailbox.received += 1
+            self._deliver(topic, mailbox, value, received_at)
+            return
+        mailbox.put(value, received_at)
+        self._pending[topic] = None
+        self._wakeup.set()
+
+    def _deliver(self, topic: str, mailbox: Mailbox, value: Any, received_at: float | None):
+        try:
+            self._handlers[topic](value)
+            mailbox.delivered += 1
+            mailbox.record_latency(received_at)
+        except Exception as e:  # pylint: disable=broad-except
+            mailbox.errors += 1
+            logger.error("error handling %s: %s", topic, e, extra=log.every(1.0))
+
+    def dispatch_pending(self):
+        """Deliver the newest message of every pending topic to its handler."""
+        pending, self._pending = self._pending, {}
+        for topic in pending:
+            mailbox = self._mailboxes[topic]
+            received_at = mailbox.received_at
+            self._deliver(topic, mailbox, mailbox.take(), received_at)
+
+    async def run(self):
+        """Wait for messages and dispatch them as they arrive."""
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            self.dispatch_pending()
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        """Return per topic counters and latencies."""
+        return {topic: mailbox.stats() for topic, mailbox in self._mailboxes.items()}
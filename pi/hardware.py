@@ -1,24 +1,135 @@
 import asyncio
+import time
 from abc import ABC, abstractmethod
+from typing import Sequence
 
+import numpy as np
 from pyfirmata import Pin
 
-from common import utils
+from common import codec, utils
+
+from .depth_estimator import DepthEstimator
+from .imu_buffer import IMUBuffer
+from .output_link import OutputLink
+from .step_generator import MAX_RATE, StepGenerator
+from .thrust_curve import LUT_SIZE, ThrustCurve, linear_lut
 
 linear_map = utils.linear_map
 
 class Sensor(ABC):
-    """Abstract sensor class."""
+    """Abstract sensor class.
+
+    init() and read() block on the sensor's bus, so SensorPoller calls them from a thread
+    pool, never on the event loop. Each reading is a message of the sensor's topic, handed
+    to ROVState as if it had come in a frame.
+    """
+
+    topic: str  # codec topic of the readings
+    freq: float = 10.0  # Hz, rate the sensor is read at
 
-    # TODO: temporary, fill out
+    def init(self) -> bool:
+        """set the sensor up, False if it is not there (yet)"""
+        return True
 
     @abstractmethod
-    async def get_val(self):
-        """get value of sensor"""
+    def read(self):
+        """Read the sensor.
+        Returns:
+            the reading, as a message of self.topic
+        Raises:
+            Exception: if the read failed
+        """
+
+
+class IMUSensor(Sensor):
+    """BNO08x on an I2C bus, read as pi/imu.py does: every reading is a sample of an
+    IMUBuffer, which integrates the velocity over the real time between readings."""
+
+    topic = codec.IMU_DATA
+
+    def __init__(self, bus: int = 8, freq: float = 10.0):
+        """
+        Args:
+            bus (int): I2C bus number
+            freq (float): rate (Hz)
+        """
+        self.bus = bus
+        self.freq = freq
+        self.bno = None
+        self.buffer = IMUBuffer()
+
+    def init(self) -> bool:
+        # the Adafruit libraries are only installed on the Pi
+        from adafruit_bno08x import (
+            BNO_REPORT_GAME_ROTATION_VECTOR,
+            BNO_REPORT_GYROSCOPE,
+            BNO_REPORT_LINEAR_ACCELERATION,
+            BNO_REPORT_MAGNETOMETER,
+        )
+        from adafruit_bno08x.i2c import BNO08X_I2C
+        from adafruit_extended_bus import ExtendedI2C as I2C
+
+        self.bno = BNO08X_I2C(I2C(self.bus))
+        for feature in (BNO_REPORT_LINEAR_ACCELERATION, BNO_REPORT_GYROSCOPE,
+                        BNO_REPORT_MAGNETOMETER, BNO_REPORT_GAME_ROTATION_VECTOR):
+            self.bno.enable_feature(feature, int(1_000_000 / self.freq))  # report interval (us)
+        return True
+
+    def read(self) -> dict:
+        bno = self.bno
+        try:
+            t = time.monotonic()
+            self.buffer.add(t, bno.linear_acceleration, bno.magnetic, bno.game_quaternion)
+        except RuntimeError:
+            # the sensor is in a bad state, as in pi/imu.py
+            bno.hard_reset()
+            raise
+        return self.buffer.take()
+
+
+class DepthSensor(Sensor):
+    """MS5837 on an I2C bus, filtered by a DepthEstimator as in pi/depth-sensor.py."""
+
+    topic = codec.DEPTH
+
+    def __init__(self, bus: int = 1, freq: float = 20.0, oversampling: int = 4,
+                 model: int = 0):
+        """
+        Args:
+            bus (int): I2C bus number
+            freq (float): rate (Hz)
+            oversampling (int): ms5837.OSR_* of the conversions, OSR_4096 by default
+            model (int): ms5837.MODEL_02BA or MODEL_30BA
+        """
+        self.bus = bus
+        self.freq = freq
+        self.oversampling = oversampling
+        self.model = model
+        self.sensor = None
+        self.estimator = DepthEstimator()
+
+    def init(self) -> bool:
+        import ms5837  # needs smbus2, only installed on the Pi
+
+        if self.sensor is None:
+            self.sensor = ms5837.MS5837(self.model, self.bus)
+        return self.sensor.init()
+
+    def read(self) -> dict:
+        if not self.sensor.read(self.oversampling):
+            raise LookupError("depth sensor read failed")
+        return self.estimator.update(self.sensor.depth())
 
 
 class Actuator(ABC):
-    """Abstract actuator class."""
+    """Abstract actuator class.
+
+    stop() puts the actuator in its safe state right away and latches it there: set_val() is
+    ignored until release() is called, so a control loop iteration that is already running
+    cannot undo an emergency stop.
+    """
+
+    stopped = False
 
     def linear_map(self, _: float):
         """map value to actuator value"""
@@ -31,16 +142,68 @@ class Actuator(ABC):
     async def run(self):
         """run actuator"""
 
+    def stop(self):
+        """Synchronously drive the actuator to its safe state and ignore set_val() until
+        release()."""
+        self.stopped = True
 
-class Stepper(Actuator):
-    """Stepper motor class."""
+    def release(self):
+        """Accept set_val() again after stop()."""
+        self.stopped = False
+
+
+class DrivenActuator(Actuator):
+    """Actuator whose pins ActuatorDriver writes on its tick, with the timing done for every
+    actuator at once. A Stepper times its own pulses instead."""
+
+    @abstractmethod
+    def command(self, val: float):
+        """Check and map a commanded value to the value written to the pins.
+        Raises:
+            ValueError: if val is out of range
+        """
 
-    def __init__(self, pin: Pin, direction_pin: Pin, direction: bool = True):
+    @property
+    @abstractmethod
+    def output(self):
+        """value last set to be written to the pins, as returned by command()"""
+
+    @abstractmethod
+    def write(self, value):
+        """Synchronously write a value returned by command() to the pins and keep it as the
+        output."""
+
+
+class Stepper(Actuator):
+    """Stepper motor class. Steps are timed by a StepGenerator thread, started by run()."""
+
+    def __init__(
+        self,
+        pin: Pin,
+        direction_pin: Pin,
+        direction: bool = True,
+        steps_per_rev: int = 200,
+        accel: float = 2000.0,
+        max_rate: float = MAX_RATE,
+        link: OutputLink | None = None,
+    ):
+        """
+        Args:
+            pin (Pin): step pin, a pin of the board itself, not an OutputPin
+            direction_pin (Pin): direction pin, likewise
+            direction (bool): False to turn the other way for positive speeds
+            steps_per_rev (int): steps per revolution
+            accel (float): acceleration (steps/s^2) when the speed changes
+            max_rate (float): highest step rate (steps/s)
+            link (OutputLink): link of the board, the step rate is reserved from its budget
+        """
         self.pin = pin
         self.direction_pin = direction_pin
         self.direction = direction
+        self.steps_per_rev = steps_per_rev
         self.speed = 0  # rev / s
-        self.lock = asyncio.Lock()
+        self.generator = StepGenerator(pin, direction_pin, accel=accel, max_rate=max_rate,
+                                       link=link)
 
     def linear_map(self, x: float):
         return int(linear_map(x, -50, 50, -5, 5))
@@ -50,31 +213,32 @@ class Stepper(Actuator):
         Args:
             speed (float): speed in rev / s
         """
-        async with self.lock:
-            self.speed = val
+        if self.stopped:
+            return
+        self.speed = val
+        self.generator.set_rate(val * self.steps_per_rev * (1 if self.direction else -1))
+
+    def stop(self):
+        """stop stepping"""
+        super().stop()
+        self.speed = 0
+        self.generator.halt()
 
     async def reverse(self):
         """reverse direction of stepper motor"""
-        async with self.lock:
-            self.direction_pin.write(self.direction_pin)
-            self.direction = not self.direction
+        self.direction = not self.direction
+        await self.set_val(self.speed)
 
     async def run(self):
-        while True:
-            async with self.lock:
-                speed = self.speed
-            if speed == 0:
-                await asyncio.sleep(0.1)
-                continue
-            delay = (1 / 200) * (1 / speed)
-            asyncio.ensure_future(self.reverse())
-            self.pin.write(1)
-            await asyncio.sleep(delay)
-            self.pin.write(0)
-            await asyncio.sleep(delay)
+        """step from the generator's thread until cancelled"""
+        self.generator.start()
+        try:
+            await asyncio.Future()
+        finally:
+            self.generator.stop()
 
 
-class Servo(Actuator):
+class Servo(DrivenActuator):
     """Servo motor class."""
 
     def __init__(self, pin: Pin):
@@ -86,11 +250,25 @@ class Servo(Actuator):
         """no mapping needed"""
         return int(x)
 
-    async def set_val(self, val: int):
-        """set angle of servo motor in degrees"""
+    def command(self, val: float) -> int:
         val = self.linear_map(val)
         if val < 0 or val > 1800:
             raise ValueError("Angle must be between 0 and 180")
+        return val
+
+    @property
+    def output(self) -> int:
+        return self.angle
+
+    def write(self, value):
+        self.angle = int(value)
+        self.pin.write(self.angle)
+
+    async def set_val(self, val: int):
+        """set angle of servo motor in degrees"""
+        if self.stopped:
+            return
+        val = self.command(val)
         async with self.lock:
             self.angle = val
 
@@ -99,30 +277,82 @@ class Servo(Actuator):
         while True:
             async with self.lock:
                 #print(f"{self.pin}: writing {self.angle}") # Debugging line
-                self.pin.write(self.angle)
+                self.write(self.angle)
             await asyncio.sleep(0.7)
 
 
 class Thruster(Servo):
-    """Thruster class."""
+    """Thruster class.
+
+    Commands in [-1, 1] are mapped to pulse widths through a lookup table computed once at
+    startup: linear over active_range, or from a calibrated thrust curve so that a command
+    is the same fraction of thrust forwards and in reverse, outside the deadband.
+    """
 
     active_range: tuple
 
     # TOASK: are we limiting our range here for all thrusters
-    def __init__(self, pin: Pin, active_range: tuple = (1200, 1800), reverse=False):
+    def __init__(
+        self,
+        pin: Pin,
+        active_range: tuple = (1200, 1800),
+        reverse=False,
+        curve: ThrustCurve | None = None,
+    ):
         super().__init__(pin)
-        self.angle = 1500
         self.active_range = active_range
         self.reverse = reverse
+        self.curve = curve
+        lut = linear_lut(active_range) if curve is None else curve.lut(active_range)
+        # rounded away from neutral: truncating would put the smallest forward commands
+        # back in the deadband
+        neutral = lut[len(lut) // 2]
+        lut = np.where(lut > neutral, np.ceil(lut), np.floor(lut))
+        self.lut = lut.astype(int)  # pulse width (us) per command, command -1 first
+        self._entries = self.lut.tolist()  # indexing a list is the cheapest scalar lookup
+        self._half = (LUT_SIZE - 1) / 2
+        self.angle = self.linear_map(0)
 
     def linear_map(self, x: float):
         """map value to thruster value"""
-        if not self.reverse:
-            return int(linear_map(x, -1, 1, self.active_range[0], self.active_range[1]))
-        return int(linear_map(x, -1, 1, self.active_range[1], self.active_range[0]))
+        if self.reverse:
+            x = -x
+        return self._entries[int((min(max(x, -1.0), 1.0) + 1.0) * self._half + 0.5)]
 
+    def stop(self):
+        """write neutral to the pin now, without waiting for run()"""
+        super().stop()
+        self.write(self.linear_map(0))
 
-class LinActuator(Actuator):
+
+class ThrusterTable:
+    """Lookup tables of several thrusters stacked, to map a command to every one of them
+    in one call."""
+
+    def __init__(self, thrusters: Sequence[Thruster]):
+        """
+        Args:
+            thrusters (Sequence[Thruster]): thrusters, in the order of the commands
+        """
+        self.table = np.stack([thruster.lut for thruster in thrusters])
+        half = (self.table.shape[1] - 1) / 2
+        # index = command * scale + offset, with reversed thrusters' commands negated
+        self._scale = np.array([-half if thruster.reverse else half for thruster in thrusters])
+        self._offset = half + 0.5
+        self._flat = self.table.ravel()
+        self._row_start = np.arange(len(thrusters)) * self.table.shape[1]
+        self._last = self.table.shape[1] - 1
+
+    def map(self, commands: np.ndarray) -> np.ndarray:
+        """Map commands in [-1, 1] to pulse widths (us), one per thruster.
+        Gives the same values as each thruster's linear_map()."""
+        index = np.asarray(commands) * self._scale
+        index += self._offset
+        np.clip(index, 0.5, self._last + 0.5, out=index)
+        return self._flat.take(index.astype(int) + self._row_start)
+
+
+class LinActuator(DrivenActuator):
     """Linear actuator class."""
 
     def __init__(self, pin: Pin, pin2: Pin, deadzone: int = 0.1):
@@ -136,10 +366,32 @@ class LinActuator(Actuator):
         """no mapping needed"""
         return int(x)
 
-    async def set_val(self, val: int):
-        """set extension rate of linear actuator motor in degrees"""
+    def command(self, val: float) -> float:
         if val < -1 or val > 1:
             raise ValueError("Angle must be between -1 and 1")
+        return val
+
+    @property
+    def output(self) -> float:
+        return self.pos
+
+    def write(self, value):
+        self.pos = value
+        if value < 0 - self.deadzone:
+            self.pin.write(1)
+            self.pin2.write(0)
+        elif value > 0 + self.deadzone:
+            self.pin.write(0)
+            self.pin2.write(1)
+        else:
+            self.pin.write(0)
+            self.pin2.write(0)
+
+    async def set_val(self, val: int):
+        """set extension rate of linear actuator motor in degrees"""
+        if self.stopped:
+            return
+        val = self.command(val)
         async with self.lock:
             self.pos = val
 
@@ -147,13 +399,10 @@ class LinActuator(Actuator):
         """continuously set extension rate of linear actuator"""
         while True:
             async with self.lock:
-                if self.pos < 0 - self.deadzone:
-                    self.pin.write(1)
-                    self.pin2.write(0)
-                elif self.pos > 0 + self.deadzone:
-                    self.pin.write(0)
-                    self.pin2.write(1)
-                else:
-                    self.pin.write(0)
-                    self.pin2.write(0)
+                self.write(self.pos)
             await asyncio.sleep(0.1)
+
+    def stop(self):
+        """cut both motor outputs now, without waiting for run()"""
+        super().stop()
+        self.write(0)
@@ -1,10 +1,11 @@
 # SPDX-FileCopyrightText: 2020 Bryan Siepert, written for Adafruit Industries
 #
 # SPDX-License-Identifier: Unlicense
+import logging
+import os
 import time
 import board
 import busio
-import json
 import socket
 from adafruit_extended_bus import ExtendedI2C as I2C
 # import serial
@@ -18,7 +19,16 @@ from adafruit_bno08x import (
 from adafruit_bno08x.i2c import BNO08X_I2C
 # from adafruit_bno08x.uart import BNO08X_UART
 
-from common import utils
+from common import codec, log
+
+from .imu_buffer import IMUBuffer
+from .shared_sample import IMU_NAME, SharedSample
+
+HOST = "192.168.0.102"  # The server's hostname or IP address
+PORT = 2049  # The port used by the server
+SAMPLE_FREQ = 100  # Hz, rate the BNO08x reports at and is sampled at
+UPLINK_FREQ = 10  # Hz, rate the samples are downsampled to and sent at
+REPORT_INTERVAL = 1_000_000 // SAMPLE_FREQ  # us
 
 try:
     i2c = I2C(8)
@@ -28,93 +38,96 @@ try:
     # uart = serial.Serial("/dev/serial0", 115200)
     # bno = BNO08X_UART(uart)
 
-    bno.enable_feature(BNO_REPORT_LINEAR_ACCELERATION)
-    bno.enable_feature(BNO_REPORT_GYROSCOPE)
-    bno.enable_feature(BNO_REPORT_MAGNETOMETER)
-    bno.enable_feature(BNO_REPORT_GAME_ROTATION_VECTOR)
+    bno.enable_feature(BNO_REPORT_LINEAR_ACCELERATION, REPORT_INTERVAL)
+    bno.enable_feature(BNO_REPORT_GYROSCOPE, REPORT_INTERVAL)
+    bno.enable_feature(BNO_REPORT_MAGNETOMETER, REPORT_INTERVAL)
+    bno.enable_feature(BNO_REPORT_GAME_ROTATION_VECTOR, REPORT_INTERVAL)
 except Exception as e:
     raise RuntimeError("Could not initialize IMU")
 
-HOST = "192.168.0.102"  # The server's hostname or IP address
-PORT = 2049  # The port used by the server
-CONTROL_LOOP_FREQ = 10  # Hz
-
-# Global variables to store velocity
-# These are initialized to 0 and will be updated in the read_data function
-vel_x = 0.0
-vel_y = 0.0
-vel_z = 0.0
-
-"""Reads data from the IMU sensor and returns as a dictionary.
+"""Reads one sample from the IMU sensor into the buffer, which integrates the velocity
+with the time since the previous sample.
 
-Returns:
-    dict: a dictionary of dictionaries, each one containing a set of data from the IMU
-        (accelerometer, gyroscope, magnetometer, or quaternion)
+Args:
+    buffer (IMUBuffer): buffer of the samples
 """
-def read_data() -> dict:
-    data = {}
-    # acceleration
-    accel_x, accel_y, accel_z = bno.linear_acceleration  # pylint:disable=no-member
-    data["acceleration"] = utils.make_xyz_dict(accel_x, accel_y, accel_z)
-
-    # velocity
-    global vel_x, vel_y, vel_z
-    vel_x = vel_x + accel_x / CONTROL_LOOP_FREQ
-    vel_y = vel_y + accel_y / CONTROL_LOOP_FREQ
-    vel_z = vel_z + accel_z / CONTROL_LOOP_FREQ
-    data["velocity"] = utils.make_xyz_dict(vel_x, vel_y, vel_z)
-
-    # gyro
+def read_sample(buffer: IMUBuffer):
+    t = time.monotonic()
+    accel = bno.linear_acceleration  # pylint:disable=no-member
     # gyro_x, gyro_y, gyro_z = bno.gyro  # pylint:disable=no-member
-    # data["gyroscope"] = utils.make_xyz_dict(gyro_x, gyro_y, gyro_z)
+    magnetic = bno.magnetic  # pylint:disable=no-member
+    quaternion = bno.game_quaternion  # pylint:disable=no-member
+    buffer.add(t, accel, magnetic, quaternion)
 
-    # magnetometer
-    mag_x, mag_y, mag_z = bno.magnetic  # pylint:disable=no-member
-    data["magnetometer"] = utils.make_xyz_dict(mag_x, mag_y, mag_z)
+"""Samples the IMU at SAMPLE_FREQ until manually terminated, and publishes the samples
+downsampled into one message every publish_every samples.
 
-    # quaternion
-    quat_i, quat_j, quat_k, quat_real = bno.game_quaternion  # pylint:disable=no-member
-    quaternion = {}
-    quaternion["i"] = quat_i
-    quaternion["j"] = quat_j
-    quaternion["k"] = quat_k
-    quaternion["real"] = quat_real
-    data["game_quaternion"] = quaternion
-
-    return data
-
-"""
-Starts the client. Connects to async_server, then reads and
-publishes IMU data to the server at the rate defined above until manually terminated.
+Args:
+    publish (Callable): called with each IMU_DATA message
+    publish_every (int): samples per message
 """
-with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-    print(f"connecting to {HOST}:{PORT}")
-    s.connect((HOST, PORT))
-    last_time = time.time()
-    
+def sample_loop(publish, publish_every: int):
+    buffer = IMUBuffer()
+    period = 1 / SAMPLE_FREQ
+    deadline = time.monotonic()
+    ticks = 0
+
     while True:
         try:
-            data = read_data()
-            msg = {
-                "imu_data": json.dumps(data),
-            }
-            
-            s.send(str.encode(json.dumps(msg) + "~"))
-
-            print(f"sent: {msg}")
+            read_sample(buffer)
+            ticks += 1
+            if ticks % publish_every == 0:
+                data = buffer.take()
+                publish(data)
+                logger.debug("sent: %s %s", data, buffer.stats(), extra=log.sample(10))
         except RuntimeError as err:
-            print(f"Fatal error: {err=}. Resetting.")
+            logger.error("Fatal error: %r. Resetting.", err)
             bno.hard_reset()
             time.sleep(5)
         except BrokenPipeError:
-            print("Connection closed.")
+            logger.info("Connection closed.")
             break
         except Exception as err:
-            print(f"Transient error: {err=}.")
-
-        # sleep for remainder of loop
-        if time.time() - last_time < 1 / CONTROL_LOOP_FREQ:
-            time.sleep(1 / CONTROL_LOOP_FREQ - (time.time() - last_time))
+            logger.warning("Transient error: %r.", err, extra=log.every(1.0))
+
+        # sleep until the next sample is due; missed samples are skipped, the velocity is
+        # integrated over the real time between the samples read
+        deadline += period
+        delay = deadline - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
         else:
-            print("Warning: control loop took too long")
-        last_time = time.time()
+            deadline = time.monotonic()
+            logger.warning("sample loop took too long", extra=log.every(1.0))
+
+"""
+Starts the client. With SENSOR_SHM set, writes every sample to shared memory for the
+server to read. Otherwise connects to async_server and publishes the samples downsampled
+to UPLINK_FREQ.
+"""
+log.setup()
+logger = logging.getLogger("pi.imu")
+
+if os.environ.get("SENSOR_SHM"):
+    shared = SharedSample(codec.IMU_DATA, IMU_NAME, create=True)
+    logger.info("sampling at %g Hz into shared memory %s", SAMPLE_FREQ, IMU_NAME)
+    try:
+        sample_loop(shared.write, 1)
+    finally:
+        shared.close(unlink=True)
+else:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        logger.info("connecting to %s:%d", HOST, PORT)
+        s.connect((HOST, PORT))
+        _, welcome = codec.recv_frame(s)
+        if welcome["version"] != codec.PROTOCOL_VERSION:
+            raise RuntimeError(f"server uses protocol version {welcome['version']}")
+        s.sendall(codec.encode(codec.HELLO, {
+            "publish_rate": UPLINK_FREQ,
+            "publishes": [codec.IMU_DATA],
+            "subscribes": {},
+        }))
+        logger.info("sampling at %g Hz, publishing at %g Hz, server control loop %g Hz",
+                    SAMPLE_FREQ, UPLINK_FREQ, welcome["control_loop_freq"])
+        sample_loop(lambda data: s.sendall(codec.encode(codec.IMU_DATA, data)),
+                    max(1, round(SAMPLE_FREQ / UPLINK_FREQ)))
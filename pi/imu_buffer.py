@@ -0,0 +1,100 @@
+"""IMU samples at the sensor's report rate, sent at a lower rate.
+
+IMUBuffer keeps every sample with its time in a preallocated ring buffer and integrates the
+linear acceleration into velocity with the real time between samples, instead of assuming
+a perfect loop period. take() turns the samples since the previous take() into one IMU_DATA
+message, so the IMU can be sampled at 100+ Hz while the uplink stays at its own rate.
+"""
+
+import numpy as np
+
+from common import utils
+
+# columns of a sample
+TIME = 0
+ACCELERATION = slice(1, 4)
+VELOCITY = slice(4, 7)
+MAGNETOMETER = slice(7, 10)
+QUATERNION = slice(10, 14)  # i, j, k, real
+COLUMNS = 14
+MAX_DT = 0.1  # s, longer gaps (e.g. a sensor reset) are not integrated over
+
+
+class IMUBuffer:
+    """Ring buffer of IMU samples, integrating velocity as they are added."""
+
+    def __init__(self, size: int = 256):
+        """
+        Args:
+            size (int): samples kept, at least the samples between two take() calls
+        """
+        self.samples = np.zeros((size, COLUMNS))
+        self.count = 0  # samples added
+        self.overruns = 0  # samples overwritten before a take()
+        self.velocity = [0.0, 0.0, 0.0]
+        self._taken = 0  # count at the last take()
+        self._last_time: float | None = None
+        self._last_accel = (0.0, 0.0, 0.0)
+
+    def add(self, t: float, accel: tuple, magnetic: tuple, quaternion: tuple):
+        """Add a sample.
+        Args:
+            t (float): time (s) the sample was read, monotonic
+            accel (tuple): linear acceleration x, y, z (m/s^2)
+            magnetic (tuple): magnetic field x, y, z (uT)
+            quaternion (tuple): game rotation vector i, j, k, real
+        """
+        velocity = self.velocity
+        if self._last_time is not None:
+            dt = t - self._last_time
+            if 0 < dt <= MAX_DT:
+                # trapezoid rule between the previous sample and this one
+                last = self._last_accel
+                for axis in range(3):
+                    velocity[axis] += (last[axis] + accel[axis]) * dt / 2
+        self._last_time = t
+        self._last_accel = accel
+        self.samples[self.count % len(self.samples)] = (t, *accel, *velocity, *magnetic,
+                                                        *quaternion)
+        self.count += 1
+
+    def pending(self) -> np.ndarray:
+        """the samples added since the last take(), oldest first"""
+        size = len(self.samples)
+        new = self.count - self._taken
+        if new > size:
+            self.overruns += new - size
+            new = size
+        return self.samples[np.arange(self.count - new, self.count) % size]
+
+    def take(self) -> dict | None:
+        """Downsample the samples added since the last take() into one IMU_DATA message:
+        the mean acceleration and magnetic field, and the newest velocity and orientation.
+        Returns:
+            dict | None: the message, None if no sample was added
+        """
+        rows = self.pending()
+        self._taken = self.count
+        if not len(rows):
+            return None
+        mean = rows.mean(axis=0)
+        newest = rows[-1]
+        i, j, k, real = newest[QUATERNION].tolist()
+        return {
+            "acceleration": utils.make_xyz_dict(*mean[ACCELERATION].tolist()),
+            "velocity": utils.make_xyz_dict(*newest[VELOCITY].tolist()),
+            "magnetometer": utils.make_xyz_dict(*mean[MAGNETOMETER].tolist()),
+            "game_quaternion": {"i": i, "j": j, "k": k, "real": real},
+        }
+
+    def stats(self) -> dict:
+        """Return the samples added, those lost to overruns, and the sample rate (Hz) over
+        the buffer."""
+        size = len(self.samples)
+        n = min(self.count, size)
+        rate = 0.0
+        if n > 1:
+            times = self.samples[np.arange(self.count - n, self.count) % size, TIME]
+            span = times[-1] - times[0]
+            rate = (n - 1) / span if span > 0 else 0.0
+        return {"samples": self.count, "overruns": self.overruns, "sample_rate": rate}
@@ -0,0 +1,194 @@
+"""Write-on-change output to the Arduino over the Firmata serial link.
+
+Every thruster, servo and motor output goes over one 57600 baud serial link. Actuators write
+to OutputPins, which only record the value; OutputLink.flush() then sends the values that
+changed, highest priority first, and resends unchanged values once per keepalive interval.
+With a SerialWriter, the values are handed to its thread instead of written to the port on
+the event loop. Bytes sent are counted against the link's capacity: writes that do not fit
+in the budget wait for the next flush, and a warning is logged when the link gets close to
+saturated. Step pulses, which are timed by a StepGenerator's thread and cannot wait for a
+flush, reserve their share of the budget up front instead.
+"""
+
+import bisect
+import logging
+import math
+import time
+from typing import Callable
+
+from pyfirmata import Pin
+
+from common import log
+
+from .serial_writer import SerialWriter
+
+BAUD = 57600
+LINK_BUDGET = BAUD / 10  # bytes/s, 8N1 framing puts 10 bits on the wire per byte
+MESSAGE_BYTES = 3  # every Firmata digital, analog and servo write is one 3 byte message
+# priorities, lower is sent first
+THRUSTER = 0
+ACTUATOR = 1
+CAMERA = 2
+STEPPER_SHARE = 0.25  # most of the budget that step pulses may reserve, all steppers together
+URGENT_TIMEOUT = 0.05  # s, longest the writer thread may take to write an urgent flush
+
+logger = logging.getLogger(__name__)
+
+
+class OutputPin:
+    """Stands in for a pyfirmata Pin: write() records the value, OutputLink.flush() sends it."""
+
+    def __init__(self, pin: Pin, priority: int):
+        self.pin = pin
+        self.priority = priority
+        self.value = None  # last value written, None until the first write
+        self.sent = None  # last value sent to the board
+        self.sent_at = -math.inf  # time the last value was sent
+
+    def write(self, value):
+        """set the value sent on the next flush"""
+        self.value = value
+
+
+class OutputLink:
+    """Sends the values of OutputPins over the serial link, only when needed."""
+
+    def __init__(
+        self,
+        keepalive: float = 1.0,
+        budget: float = LINK_BUDGET,
+        burst: float = 0.1,
+        warn_at: float = 0.8,
+        writer: SerialWriter | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            keepalive (float): time (s) after which an unchanged value is sent again
+            budget (float): bytes/s the link can carry
+            burst (float): most bytes one flush may send, as seconds of budget
+            warn_at (float): fraction of the budget above which a warning is logged
+            writer (SerialWriter): thread the pin writes are handed to, written on the
+                calling thread without one
+            clock (Callable): monotonic time source (s)
+        """
+        self.keepalive = keepalive
+        self.budget = budget
+        self.burst = budget * burst
+        self.warn_at = warn_at
+        self.writer = writer
+        self.clock = clock
+        self.pins: list[OutputPin] = []  # by priority
+        self.reserved = 0.0  # bytes/s reserved for writes made outside of flush()
+        self._allowance = self.burst  # bytes that may be sent now
+        # writer submissions an urgent flush is waiting on, and when they are due
+        self._urgent: tuple[int, float] | None = None
+        self._last_flush = clock()
+        self._window_start = self._last_flush
+        self._window_bytes = 0
+        self.bytes_per_s = 0.0  # over the last full second
+        self.bytes_sent = 0
+        self.writes = 0  # values sent because they changed
+        self.keepalives = 0  # unchanged values sent again
+        self.suppressed = 0  # unchanged values not sent
+        self.deferred = 0  # values left for the next flush for lack of budget
+
+    def pin(self, pin: Pin, priority: int = ACTUATOR) -> OutputPin:
+        """Wrap a pyfirmata Pin.
+        Args:
+            pin (Pin): pin of the board
+            priority (int): THRUSTER, ACTUATOR or CAMERA, lower is sent first
+        Returns:
+            OutputPin: to give to the actuator in place of pin
+        """
+        output = OutputPin(pin, priority)
+        self.pins.insert(bisect.bisect_right([p.priority for p in self.pins], priority), output)
+        return output
+
+    def reserve(self, bytes_per_s: float) -> float:
+        """Reserve part of the budget for writes that bypass flush(), the step pulses of a
+        StepGenerator; flush() only uses what is left.
+        Args:
+            bytes_per_s (float): most bytes/s the writes will take
+        Returns:
+            float: bytes/s granted, no more than what is left of STEPPER_SHARE of the budget
+        """
+        granted = max(0.0, min(bytes_per_s, self.budget * STEPPER_SHARE - self.reserved))
+        self.reserved += granted
+        return granted
+
+    def flush(self, urgent: bool = False):
+        """Send the values that changed and the ones due for a keepalive.
+        Args:
+            urgent (bool): send everything that changed regardless of the budget, for the
+                emergency stop. Does not wait for the writer thread: the next flushes check
+                that it wrote them within URGENT_TIMEOUT.
+        """
+        now = self.clock()
+        self._allowance = min(
+            self.burst, self._allowance + (now - self._last_flush) * (self.budget - self.reserved)
+        )
+        self._last_flush = now
+        for output in self.pins:
+            value = output.value
+            if value is None:
+                continue
+            changed = value != output.sent
+            if not changed and now - output.sent_at < self.keepalive:
+                self.suppressed += 1
+                continue
+            if self._allowance < MESSAGE_BYTES and not (urgent and changed):
+                self.deferred += 1
+                continue
+            if self.writer is not None:
+                self.writer.submit(output.pin, value)
+            else:
+                if not changed:
+                    # pyfirmata drops a write of the value it already has
+                    output.pin.value = None
+                output.pin.write(value)
+            output.sent = value
+            output.sent_at = now
+            self._allowance -= MESSAGE_BYTES
+            self._window_bytes += MESSAGE_BYTES
+            self.bytes_sent += MESSAGE_BYTES
+            if changed:
+                self.writes += 1
+            else:
+                self.keepalives += 1
+        if urgent and self.writer is not None:
+            self._urgent = (self.writer.submitted, now + URGENT_TIMEOUT)
+        elif self._urgent is not None:
+            self._check_urgent(now)
+        if now - self._window_start >= 1.0:
+            self.bytes_per_s = self._window_bytes / (now - self._window_start)
+            self._window_start = now
+            self._window_bytes = 0
+            if self.bytes_per_s + self.reserved > self.warn_at * self.budget:
+                logger.warning("serial link at %.0f%% of its %.0f bytes/s, %.0f reserved",
+                               100 * (self.bytes_per_s + self.reserved) / self.budget,
+                               self.budget, self.reserved, extra=log.every(5.0))
+
+    def _check_urgent(self, now: float):
+        """log an error if the writer thread is late with the last urgent flush"""
+        mark, due = self._urgent
+        if self.writer.written_through(mark):
+            self._urgent = None
+        elif now > due:
+            self._urgent = None
+            logger.error("serial writer did not write the urgent values in %g s",
+                         URGENT_TIMEOUT)
+
+    def stats(self) -> dict:
+        """Return the bytes/s sent and reserved against the budget and the counts of values
+        sent, kept back and deferred."""
+        return {
+            "bytes_per_s": self.bytes_per_s,
+            "reserved": self.reserved,
+            "utilization": self.bytes_per_s / self.budget,
+            "bytes_sent": self.bytes_sent,
+            "writes": self.writes,
+            "keepalives": self.keepalives,
+            "suppressed": self.suppressed,
+            "deferred": self.deferred,
+        }
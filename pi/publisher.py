@@ -0,0 +1,166 @@
+import asyncio
+import time
+from typing import Any, Callable
+
+from common import codec
+from common.delta import DeltaEncoder
+
+
+class Feed:
+    """A topic sent at one rate, in one mode, to every connection subscribed to it that way.
+
+    Delta feeds own a DeltaEncoder, so their subscribers receive keyframes and deltas that
+    are consistent with each other.
+    """
+
+    def __init__(self, topic: str, rate: float, encoder: DeltaEncoder | None = None):
+        self.topic = topic
+        self.rate = rate
+        self.period = 1.0 / rate
+        self.encoder = encoder
+        self.next_due = time.monotonic()
+        self.subscribers: set = set()  # connections
+        self.sent = 0  # frames written to subscribers
+        self.skipped = 0  # frames not written because a subscriber was backed up
+
+
+class Publisher:
+    """Topic based fan-out of ROV state to subscribed clients.
+
+    Each topic is read from its getter and encoded at most once per tick, and the same bytes
+    are written to every connection whose subscription to that topic is due. Subscribers
+    that ask for deltas get a full keyframe every keyframe_period and, in between, only the
+    fields that moved past the topic's thresholds, or nothing at all.
+    """
+
+    def __init__(self, max_freq: float, keyframe_period: float = 1.0):
+        """
+        Args:
+            max_freq (float): highest rate (Hz) a client may subscribe at
+            keyframe_period (float): seconds between full frames of delta feeds
+        """
+        self.max_freq = max_freq
+        self.keyframe_period = keyframe_period
+        self._getters: dict[str, Callable[[], Any]] = {}
+        self._thresholds: dict[str, float | dict[str, float]] = {}
+        self._feeds: dict[tuple[str, float, bool], Feed] = {}
+        self._changed = asyncio.Event()
+        self.encodes = 0  # number of times a topic was serialized
+
+    def add_topic(
+        self,
+        topic: str,
+        getter: Callable[[], Any],
+        thresholds: float | dict[str, float] = 0.0,
+    ):
+        """Make a topic available to subscribers.
+        Args:
+            topic (str): topic name
+            getter (Callable): returns the current value of the topic
+            thresholds (float | dict[str, float]): change thresholds of the topic's fields
+                for delta subscribers, see DeltaEncoder
+        """
+        self._getters[topic] = getter
+        self._thresholds[topic] = thresholds
+
+    def subscribe(self, connection, topic: str, rate: float, delta: bool = False) -> bool:
+        """Subscribe a connection to a topic.
+        Args:
+            connection (Connection): subscriber, must provide send(bytes) -> bool
+            topic (str): topic name
+            rate (float): requested rate (Hz), capped to max_freq
+            delta (bool): send keyframes and deltas instead of full frames
+        Returns:
+            bool: False if the topic is not published by the server
+        """
+        if topic not in self._getters or rate <= 0:
+            return False
+        rate = min(rate, self.max_freq)
+        key = (topic, rate, delta)
+        feed = self._feeds.get(key)
+        if feed is None:
+            encoder = None
+            if delta:
+                encoder = DeltaEncoder(topic, self._thresholds[topic], self.keyframe_period)
+            feed = self._feeds[key] = Feed(topic, rate, encoder)
+        elif feed.encoder is not None:
+            # the new subscriber has no state to apply deltas to yet
+            feed.encoder.force_keyframe()
+        feed.subscribers.add(connection)
+        self._changed.set()
+        return True
+
+    def unsubscribe(self, connection):
+        """Remove a connection from every feed."""
+        for key, feed in list(self._feeds.items()):
+            feed.subscribers.discard(connection)
+            if not feed.subscribers:
+                del self._feeds[key]
+
+    def publish_due(self, now: float):
+        """Send every feed that is due at the given time.
+        Args:
+            now (float): time.monotonic() timestamp
+        """
+        values: dict[str, Any] = {}  # topic: value, so each getter is called once per tick
+        frames: dict[str, bytes] = {}  # topic: full frame, so each topic is encoded once
+        for feed in self._feeds.values():
+            if feed.next_due > now:
+                continue
+            feed.next_due += feed.period
+            if feed.next_due <= now:
+                # fell more than a period behind, do not burst to catch up
+                feed.next_due = now + feed.period
+            if feed.topic not in values:
+                values[feed.topic] = self._getters[feed.topic]()
+            if feed.encoder is not None:
+                frame = feed.encoder.encode(values[feed.topic], now)
+                if frame is None:
+                    continue  # nothing moved
+            else:
+                frame = frames.get(feed.topic)
+                if frame is None:
+                    frame = frames[feed.topic] = codec.encode(feed.topic, values[feed.topic])
+                    self.encodes += 1
+            for connection in feed.subscribers:
+                if connection.send(frame):
+                    feed.sent += 1
+                else:
+                    feed.skipped += 1
+
+    async def run(self):
+        """Publish feeds as they come due. Sleeps while there are no subscribers."""
+        while True:
+            if not self._feeds:
+                self._changed.clear()
+                await self._changed.wait()
+                continue
+            next_due = min(feed.next_due for feed in self._feeds.values())
+            delay = next_due - time.monotonic()
+            if delay > 0:
+                self._changed.clear()
+                try:
+                    # wake early if a new subscription may be due sooner
+                    await asyncio.wait_for(self._changed.wait(), timeout=delay)
+                    continue
+                except asyncio.TimeoutError:
+                    pass
+            self.publish_due(time.monotonic())
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        """Return per feed counters, keyed by "topic@rate" plus "/delta" for delta feeds."""
+        stats = {}
+        for feed in self._feeds.values():
+            feed_stats = {
+                "subscribers": len(feed.subscribers),
+                "sent": feed.sent,
+                "skipped": feed.skipped,
+            }
+            name = f"{feed.topic}@{feed.rate:g}"
+            if feed.encoder is not None:
+                name += "/delta"
+                feed_stats["keyframes"] = feed.encoder.keyframes
+                feed_stats["deltas"] = feed.encoder.deltas
+                feed_stats["unchanged"] = feed.encoder.unchanged
+            stats[name] = feed_stats
+        return stats
@@ -1,17 +1,31 @@
 import asyncio
 import logging
+import math
+import time
+from typing import Callable, Sequence
+
 import numpy as np
 
-from common import utils
+from common import codec, log, utils
+from common.scheduler import SKIP, Histogram, PeriodicScheduler
 
-from .hardware import Actuator, Sensor, Thruster
+from .actuator_driver import ActuatorDriver
+from .allocation import DEFAULT_MIX, ThrusterAllocator
+from .hardware import Actuator, DrivenActuator, Sensor
+from .output_link import OutputLink
+from .sensor_poller import SensorPoller
+from .shared_sample import SharedSample
 
-PIDController = utils.PIDController
+PIDBank = utils.PIDBank
 VelocityVector = utils.VelocityVector
-SlewRateLimiter = utils.SlewRateLimiter
-time_ms = utils.time_ms
+SlewRateLimiterBank = utils.SlewRateLimiterBank
+SequenceFilter = utils.SequenceFilter
 linear_map = utils.linear_map
 
+SHARED_RETRY = 1.0  # s between attempts to attach a shared record, and its longest silence
+
+logger = logging.getLogger(__name__)
+
 
 class ROVState:
     """State of ROV."""
@@ -27,7 +41,27 @@ class ROVState:
         thrusters: dict[str, Actuator],
         sensors: dict[str, Sensor],
         status_flags: dict[str, any],
+        link: OutputLink | None = None,
+        allocator: ThrusterAllocator | None = None,
+        shared: Sequence[SharedSample] = (),
+        clock: Callable[[], float] = time.monotonic,
     ):
+        """
+        Args:
+            actuators (dict[str, Actuator]): name: actuator, arm motors
+            thrusters (dict[str, Actuator]): name: thruster
+            sensors (dict[str, Sensor]): name: sensor, polled in-process; their readings set
+                the current IMU data and depth like the frames of the sensor scripts
+            status_flags (dict[str, any]): initial status flags
+            link (OutputLink): link the actuators' pins write through, flushed after every
+                control loop tick
+            allocator (ThrusterAllocator): maps velocity to thruster outputs, the tuned
+                DEFAULT_MIX by default
+            shared (Sequence[SharedSample]): records written by sensor processes, read at
+                the start of every control loop tick
+            clock (Callable): monotonic time source (s) of the control loop and of the
+                update times, virtual time in a simulation
+        """
         self.actuators = actuators
         self.thrusters = thrusters
         self.sensors = sensors
@@ -36,84 +70,103 @@ class ROVState:
         self._current_claw = {"extend": 0, "rotate": 90, "close_main": 90,
                               "close_side": 90, "sample": 0, "camera_servo": 90}
         self._target_velocity = VelocityVector()
-        self._pid_controllers = {}  # axis: PIDController
+        # one controller per axis of VelocityVector, in FIELDS order
         # TOASK: how are we using this and is it tuned? May explain some things
-        for axis in self._current_velocity.keys():
-            self._pid_controllers[axis] = PIDController(
-                kp=1.0, ki=0.1, kd=0.01, max_output=90, max_rate_of_change=180
-            )
+        self._pid = PIDBank(
+            len(VelocityVector.FIELDS), kp=1.0, ki=0.1, kd=0.01, max_output=90,
+            max_rate_of_change=180,
+        )
         self._control_loop_frequency = 10.0  # Hz
-        self._last_time = time_ms()  # time the last control loop iteration was executed in ms
-        self._last_current_velocity_update = 0  # time of last current velocity update in ms
-        self._last_current_claw_update = 0  # time of last current claw update in ms
-        self._last_target_velocity_update = 0  # time of last target velocity update in ms
+        # stale commands are useless, so an overrun drops the missed ticks
+        self.scheduler = PeriodicScheduler(
+            self._control_loop_frequency, policy=SKIP, name="control loop", clock=clock
+        )
+        # times (s) of the last updates, on the scheduler's monotonic clock
+        self._last_current_velocity_update = -math.inf
+        self._last_current_claw_update = -math.inf
+        self._last_target_velocity_update = -math.inf
+        # drop late commands from the udp channel; anything older than a control loop
+        # period behind the fastest packet seen is stale
+        self._target_velocity_filter = SequenceFilter(max_age=1 / self._control_loop_frequency)
+        self._claw_filter = SequenceFilter(max_age=1 / self._control_loop_frequency)
+        self.estopped = False  # True while an emergency stop is engaged
         self._current_depth = 0.0 # current depth of ROV
+        self._current_depth_data = {"depth": 0.0, "rate": 0.0} # as sent by the depth sensor
+        self._last_current_depth_update = -math.inf  # time (s) of last current depth update
         self._target_depth = 0.0 # target depth for ROV
         self._current_imu_data = utils.init_imu_data()
         self._z_sensitivity = 0.0001 # how much the z changes with controller input
         self._bang_bang_radius = 0.02 # distance in meters from target depth before turning on
         self._p_factor = 1 # factor to scale the auto-depth by
-        self._slew_limiters = {}
-        for name, _ in self.thrusters.items():
-            self._slew_limiters[name] = SlewRateLimiter(
-                max_rate = (1.5 / 1.0), 
-                initial_value = 0.0
-            )
+        self._allocator = allocator or ThrusterAllocator.from_mix(DEFAULT_MIX)
+        # thrusters scaled by agnes_factor in agnes mode
+        self._agnes_mask = np.array([name.endswith("vertical") for name in self._allocator.names])
+        # one channel per thruster, in allocator order
+        self._slew_limiter = SlewRateLimiterBank(len(self._allocator.names), max_rate_up=1.5)
+        # writes every thruster and claw output once per control loop tick; steppers time
+        # their own pulses and keep their run() task
+        self.driver = ActuatorDriver(
+            {
+                name: actuator
+                for name, actuator in {**thrusters, **actuators}.items()
+                if isinstance(actuator, DrivenActuator)
+            },
+            thrusters=self._allocator.names,
+            link=link,
+        )
+
+        self.poller = SensorPoller(
+            sensors,
+            {codec.IMU_DATA: self.set_current_imu_data, codec.DEPTH: self.set_current_depth},
+        )
+        self.shared = list(shared)
+        self.shared_age = {sample.topic: Histogram() for sample in self.shared}  # ms
+        self._shared_retry = 0.0  # time (s) of the next attempt to attach missing records
 
         # for axis in self._current_velocity.keys():
         #     self._slew_limiters[axis] = SlewRateLimiter(
         #         max_rate=500  # max rate of change of pwm per second
         #     )
 
+    @property
+    def control_loop_frequency(self) -> float:
+        """rate (Hz) at which the control loop consumes commands"""
+        return self._control_loop_frequency
+
+    @property
+    def command_timeout(self) -> float:
+        """time (s) without a new target velocity after which the ROV is stopped"""
+        return 2.0 / self._control_loop_frequency
+
     def get_tasks(self) -> list[asyncio.Task]:
-        """Return tasks for all actuators"""
+        """Return tasks for the actuators not written by self.driver and for polling the
+        sensors"""
         tasks = []
-        for actuator in self.actuators.values():
-            tasks.append(actuator.run())
-        for actuator in self.thrusters.values():
-            tasks.append(actuator.run())
+        for name, actuator in {**self.actuators, **self.thrusters}.items():
+            if name not in self.driver.names:
+                tasks.append(actuator.run())
+        tasks.extend(self.poller.get_tasks())
         return tasks
     
 
     def _translate_velocity_to_thruster_mix(
         self, target_velocity: VelocityVector, dt: float
-    ) -> dict[str, float]:
+    ) -> np.ndarray:
         """
         Translate target velocity to thruster mix.
         Args:
             target_velocity (VelocityVector): target velocity
             dt (float): delta time (s)
         Returns:
-            dict[str, float]: thruster mix
-        """
-        mix = {
-            "front_left_horizontal": target_velocity.x + target_velocity.y + target_velocity.yaw,
-            "front_right_horizontal": -target_velocity.x + target_velocity.y - target_velocity.yaw,
-            "back_left_horizontal": -target_velocity.x + target_velocity.y + target_velocity.yaw,
-            "back_right_horizontal": target_velocity.x + target_velocity.y + target_velocity.yaw,
-            "front_left_vertical": target_velocity.z + target_velocity.pitch + target_velocity.roll,
-            "front_right_vertical": target_velocity.z + target_velocity.pitch - target_velocity.roll,
-            "back_left_vertical": target_velocity.z - target_velocity.pitch + target_velocity.roll,
-            "back_right_vertical": target_velocity.z - target_velocity.pitch - target_velocity.roll,
-        }
+            np.ndarray: thruster mix, each in [-1, 1], in self._allocator.names order
+        """
+        gains = None
         if self.status_flags["agnes_mode"]:
-            mix["front_left_vertical"] *= self.status_flags["agnes_factor"]
-            mix["front_right_vertical"] *= self.status_flags["agnes_factor"]
-            mix["back_left_vertical"] *= self.status_flags["agnes_factor"]
-            mix["back_right_vertical"] *= self.status_flags["agnes_factor"]
-        
-        # apply slew rate limiters to thruster mix
-        for name, value in mix.items():
-            if name in self._slew_limiters:
-                mix[name] = self._slew_limiters[name].update(value, dt)
-            else:
-                logging.warning(f"Slew rate limiter for {name} not found, using raw value.")
-
-        # cap value to [-1, 1]
-        for name, value in mix.items():
-            mix[name] = max(min(value, 1), -1)
-
-        return mix
+            gains = np.where(self._agnes_mask, self.status_flags["agnes_factor"], 1.0)
+        # desaturated as a whole, so the commanded direction is kept
+        thrust = self._allocator.allocate(target_velocity.as_array(), gains)
+        # each output moves from one value in [-1, 1] towards another, so it stays in range
+        return self._slew_limiter.update(thrust, dt)
 
     def set_current_velocity(self, velocity: VelocityVector):
         """
@@ -122,24 +175,43 @@ class ROVState:
             velocity (VelocityVector): current velocity
         """
         self._current_velocity = velocity
-        self._last_current_velocity_update = time_ms()
+        self._last_current_velocity_update = self.scheduler.clock()
     
-    def set_claw_movement(self, claw: dict):
+    def set_claw_movement(self, claw: dict, seq: int | None = None, sent_at: float | None = None):
         """
         Set current claw movement values.
         Args:
             claw (dict): current claw movement values
+            seq (int): sequence number, for commands from the udp channel
+            sent_at (float): time.time() at which the surface sent the command
+        Returns:
+            bool: False if the command was dropped as out of order or stale
         """
+        if seq is not None and not self._claw_filter.accept(seq, sent_at):
+            return False
         self._current_claw = claw
-        self._last_current_claw_update = time_ms()
+        self._last_current_claw_update = self.scheduler.clock()
+        return True
 
-    def set_current_depth(self, recent_depths):
+    def set_current_depth(self, depth: dict):
         """
-        Set current depth by averaging previous 10 values
+        Set current depth. Filtering is done by the depth sensor before sending.
         Args: 
-            recent_depths (List[float]): Lsit of the most recent depths
+            depth (dict): filtered depth (m) and its rate (m/s, positive going deeper)
+        """
+        self._current_depth_data = depth
+        self._current_depth = depth["depth"]
+        self._last_current_depth_update = self.scheduler.clock()
+
+    def _depth_at(self, now: float) -> float:
         """
-        self._current_depth = np.average(recent_depths)
+        Depth extrapolated with its rate from the last reading to now, over at most one
+        control loop period, so auto-depth does not act on a reading a tick old.
+        Args:
+            now (float): time (s) on the scheduler's clock
+        """
+        elapsed = min(now - self._last_current_depth_update, 1 / self._control_loop_frequency)
+        return self._current_depth + self._current_depth_data["rate"] * max(elapsed, 0.0)
 
     def set_current_imu_data(self, imu_data):
         """
@@ -149,14 +221,51 @@ class ROVState:
         """
         self._current_imu_data = imu_data
 
-    def set_target_velocity(self, velocity: VelocityVector):
+    def set_target_velocity(
+        self, velocity: VelocityVector, seq: int | None = None, sent_at: float | None = None
+    ):
         """Set target velocity.
 
         Args:
             velocity (VelocityVector): target velocity
+            seq (int): sequence number, for commands from the udp channel
+            sent_at (float): time.time() at which the surface sent the command
+        Returns:
+            bool: False if the command was dropped as out of order or stale
         """
+        if seq is not None and not self._target_velocity_filter.accept(seq, sent_at):
+            return False
         self._target_velocity = velocity
-        self._last_target_velocity_update = time_ms()
+        self._last_target_velocity_update = self.scheduler.clock()
+        return True
+
+    def emergency_stop(self, engaged: bool):
+        """
+        Engage or release the emergency stop.
+        Engaging writes neutral to every thruster pin and cuts the linear actuators before
+        returning, without waiting for the control loop, and holds them there until released.
+        Servos keep their position. Releasing zeroes the target velocity, so the ROV only moves
+        again once the pilot sends a new command.
+        Args:
+            engaged (bool): True to stop, False to release
+        """
+        if engaged:
+            for thruster in self.thrusters.values():
+                thruster.stop()
+            for actuator in self.actuators.values():
+                actuator.stop()
+        else:
+            for thruster in self.thrusters.values():
+                thruster.release()
+            for actuator in self.actuators.values():
+                actuator.release()
+        self.driver.sync()
+        if engaged != self.estopped:
+            logger.warning("emergency stop %s", "engaged" if engaged else "released")
+        self.estopped = engaged
+        self._target_velocity = VelocityVector()
+        self._slew_limiter.reset(0.0)  # ramp up again from neutral
+        self._pid.reset()
 
     def set_status_flags(self, status_flags: dict):
         """
@@ -169,85 +278,97 @@ class ROVState:
         self.status_flags = status_flags
     
 
+    def _read_shared(self):
+        """hand the new samples of the sensor processes' shared records to their setters"""
+        now = time.monotonic()
+        retry = now >= self._shared_retry
+        if retry:
+            self._shared_retry = now + SHARED_RETRY
+        for sample in self.shared:
+            if sample.shm is None and not (retry and sample.open()):
+                continue
+            new = sample.read_new()
+            if new is None:
+                if retry and sample.written_at < now - SHARED_RETRY:
+                    # the writer stopped or was restarted with a new record: attach again
+                    sample.close()
+                continue
+            written_at, msg = new
+            self.shared_age[sample.topic].record((now - written_at) * 1000)
+            self.poller.handlers[sample.topic](msg)
+
     async def control_loop(self):
-        """Control loop."""
-        loop_period = 1000.0 / self._control_loop_frequency  # ms
-
-        while True:
-            dt = float(time_ms() - self._last_time) / 1000.0
-            # update last time
-            self._last_time = time_ms()
-
-            if -0.1 < self._target_velocity.z < 0.1:
-                self._target_depth -= self._target_velocity.z * self._z_sensitivity
-                # test different sensitivities and potentially functions
-                if self._target_depth > 1 and self._current_depth > 1:
-                    self._target_velocity.z = (self._target_depth - self._current_depth) ** 3
-
-            # Plan test these and either make them toggleable or keep the best one
-            # Auto Depth V1 (Bang Bang P)
-            # if self.status_flags["auto_depth"]:
-            #     if abs(self._target_depth - self._current_depth) > self._bang_bang_radius:
-            #         self._target_velocity.z = ((self._target_depth - self._current_depth) * 
-            #                                    self._p_factor)
-            #     else: 
-            #         self._target_velocity.z = 0
-
-            # Auto Depth V2 (Pure Bang Bang)
-            # if self.status_flags["auto_depth"]:
-            #     if self._target_depth - self._current_depth > self._bang_bang_radius:
-            #         self._target_velocity.z = 1 
-            #     elif self._current_depth - self._target_depth > self._bang_bang_radius:
-            #         self._target_velocity.z = -1
-            #     else: 
-            #         self._target_velocity.z = 0
-
-            # Auto Depth V3 (Altitude Mode w/ Bang Bang P)
-            # if self.status_flags["auto_depth"]:
-            #     z_radius = 0.1 # parameter for how far stick has to be to stop holding altitude
-            #     if abs(self._target_velocity.z) > z_radius:
-            #         self._target_depth += self._target_velocity.z * self._z_sensitivity
-            #     if abs(self._target_depth - self._current_depth) > self._bang_bang_radius:
-            #         self._target_velocity.z = ((self._target_depth - self._current_depth) *
-            #                                    self._p_factor)
-            #     else:
-            #          self._target_velocity.z = 0
-
-            if time_ms() - self._last_target_velocity_update > 2 * loop_period:
-                # target velocity is stale, stop ROV
-                self._target_velocity = VelocityVector()
-
-            if time_ms() - self._last_current_velocity_update <= 2 * loop_period:
-                # current velocity is not stale, use PID controller
-                output_velocity = VelocityVector()
-                for axis, controller in self._pid_controllers.items():
-                    error = self._target_velocity[axis] - self._current_velocity[axis]
-                    output_velocity[axis] = controller.update(error, dt)
-            else:
-                # controller bypass. uses target velocity directly.
-                # logging.warning("Current velocity is stale, using target velocity directly.")
-                output_velocity = self._target_velocity
-
-            # translate output velocity to thruster mix
-            thruster_mix = self._translate_velocity_to_thruster_mix(output_velocity, dt)
-            # print(thruster_mix)
-            # print(self._current_claw)
-            set_val_tasks = []
-            for name, value in thruster_mix.items():
-                set_val_tasks.append(self.thrusters[name].set_val(value))
-            for name, value in self._current_claw.items():
-                set_val_tasks.append(self.actuators[name].set_val(value))
-            
-            for thruster_name, _ in self.thrusters.items():
-                print(f"{thruster_name}: {thruster_mix[thruster_name]}")
-            for actuator_name, _ in self.actuators.items():
-                print(f"{actuator_name}: {self._current_claw[actuator_name]}")
-            await asyncio.gather(*set_val_tasks)
-
-            # sleep until next control loop iteration
-            if (time_ms() - self._last_time) < loop_period:
-                await asyncio.sleep(
-                    (1 / self._control_loop_frequency) - (time_ms() - self._last_time) / 1000
-                )
-            else:
-                logging.warning("Control loop iteration took too long.")
+        """Control loop. Timing is reported by self.scheduler.stats(), the cost of writing
+        the outputs by self.driver.stats()."""
+        async for dt in self.scheduler.ticks():
+            self._read_shared()
+            self.tick(dt, self.scheduler.clock())
+
+    def tick(self, dt: float, now: float):
+        """
+        Run one control loop iteration: hold depth, drop a stale target velocity, run the
+        PIDs and allocation and write every output.
+        Args:
+            dt (float): time (s) since the previous iteration
+            now (float): time (s) on the scheduler's clock
+        """
+        loop_period = 1 / self._control_loop_frequency  # s
+
+        if -0.1 < self._target_velocity.z < 0.1:
+            self._target_depth -= self._target_velocity.z * self._z_sensitivity
+            current_depth = self._depth_at(now)
+            # test different sensitivities and potentially functions
+            if self._target_depth > 1 and current_depth > 1:
+                self._target_velocity.z = (current_depth - self._target_depth) ** 3
+
+        # Plan test these and either make them toggleable or keep the best one
+        # Auto Depth V1 (Bang Bang P)
+        # if self.status_flags["auto_depth"]:
+        #     if abs(self._target_depth - self._current_depth) > self._bang_bang_radius:
+        #         self._target_velocity.z = ((self._target_depth - self._current_depth) * 
+        #                                    self._p_factor)
+        #     else: 
+        #         self._target_velocity.z = 0
+
+        # Auto Depth V2 (Pure Bang Bang)
+        # if self.status_flags["auto_depth"]:
+        #     if self._target_depth - self._current_depth > self._bang_bang_radius:
+        #         self._target_velocity.z = 1 
+        #     elif self._current_depth - self._target_depth > self._bang_bang_radius:
+        #         self._target_velocity.z = -1
+        #     else: 
+        #         self._target_velocity.z = 0
+
+        # Auto Depth V3 (Altitude Mode w/ Bang Bang P)
+        # if self.status_flags["auto_depth"]:
+        #     z_radius = 0.1 # parameter for how far stick has to be to stop holding altitude
+        #     if abs(self._target_velocity.z) > z_radius:
+        #         self._target_depth += self._target_velocity.z * self._z_sensitivity
+        #     if abs(self._target_depth - self._current_depth) > self._bang_bang_radius:
+        #         self._target_velocity.z = ((self._target_depth - self._current_depth) *
+        #                                    self._p_factor)
+        #     else:
+        #          self._target_velocity.z = 0
+
+        if now - self._last_target_velocity_update > self.command_timeout:
+            # target velocity is stale, stop ROV
+            self._target_velocity = VelocityVector()
+
+        if now - self._last_current_velocity_update <= 2 * loop_period:
+            # current velocity is not stale, use PID controller
+            error = self._target_velocity.as_array() - self._current_velocity.as_array()
+            output_velocity = VelocityVector()
+            output_velocity.as_array()[:] = self._pid.update(error, dt)
+        else:
+            # controller bypass. uses target velocity directly.
+            # logger.warning("Current velocity is stale, using target velocity directly.")
+            output_velocity = self._target_velocity
+
+        # translate output velocity to thruster mix
+        thruster_mix = self._translate_velocity_to_thruster_mix(output_velocity, dt)
+        self.driver.set_thrust(thruster_mix)
+        for name, value in self._current_claw.items():
+            self.driver.set_val(name, value)
+        logger.debug("thrusters: %s claw: %s", thruster_mix, self._current_claw,
+                     extra=log.sample(10))
+        self.driver.tick()
@@ -0,0 +1,108 @@
+"""Polling of the ROV's sensors from inside the server.
+
+Each sensor is read at its own rate by a task with a PeriodicScheduler. The blocking I2C
+reads run in a thread pool, so they never hold up the event loop, and every reading is
+handed straight to the handler of its topic (a ROVState setter) instead of going through a
+sensor script, a socket and the dispatcher.
+"""
+
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Mapping
+
+from common import log
+from common.scheduler import SKIP, Histogram, PeriodicScheduler
+
+from .hardware import Sensor
+
+INIT_RETRY = 1.0  # s between attempts to set up a sensor that is not there
+
+logger = logging.getLogger(__name__)
+
+
+class SensorPoller:
+    """Reads sensors at their rates from a thread pool and hands the readings to handlers."""
+
+    def __init__(
+        self,
+        sensors: Mapping[str, Sensor],
+        handlers: Mapping[str, Callable[[object], object]],
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            sensors (Mapping[str, Sensor]): name: sensor
+            handlers (Mapping[str, Callable]): topic: function called with each reading of
+                a sensor of that topic, on the event loop
+            clock (Callable): monotonic time source (s)
+        """
+        self.sensors = dict(sensors)
+        self.handlers = handlers
+        self.clock = clock
+        # one thread per sensor: a slow bus never delays the reads of another sensor
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, len(self.sensors)), thread_name_prefix="sensor"
+        )
+        self._schedulers = {
+            name: PeriodicScheduler(sensor.freq, policy=SKIP, name=f"{name} sensor")
+            for name, sensor in self.sensors.items()
+        }
+        self._latency = {name: Histogram() for name in self.sensors}  # ms per read
+        self._reads = dict.fromkeys(self.sensors, 0)
+        self._errors = dict.fromkeys(self.sensors, 0)
+        self._ready = dict.fromkeys(self.sensors, False)
+        self._since = dict.fromkeys(self.sensors, 0.0)  # time each sensor was set up
+
+    def get_tasks(self) -> list:
+        """Return one polling coroutine per sensor"""
+        return [self._poll(name) for name in self.sensors]
+
+    async def _poll(self, name: str):
+        sensor = self.sensors[name]
+        handler = self.handlers[sensor.topic]
+        loop = asyncio.get_running_loop()
+        while not self._ready[name]:
+            try:
+                self._ready[name] = await loop.run_in_executor(self._executor, sensor.init)
+            except Exception as err:  # pylint: disable=broad-except
+                logger.error("%s sensor could not be initialized: %r", name, err,
+                             extra=log.every(10.0))
+            if not self._ready[name]:
+                await asyncio.sleep(INIT_RETRY)
+        self._since[name] = self.clock()
+        logger.info("polling %s sensor at %g Hz", name, sensor.freq)
+
+        async for _ in self._schedulers[name].ticks():
+            start = self.clock()
+            try:
+                reading = await loop.run_in_executor(self._executor, sensor.read)
+            except Exception as err:  # pylint: disable=broad-except
+                self._errors[name] += 1
+                logger.warning("%s sensor read failed: %r", name, err, extra=log.every(1.0))
+                continue
+            self._latency[name].record((self.clock() - start) * 1000)
+            self._reads[name] += 1
+            handler(reading)
+
+    def close(self):
+        """stop the threads, once the polling tasks are cancelled"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        """Return per sensor: whether it is set up, the reads/s since it was set up, the
+        read latency (ms), the read errors and the scheduler's timing."""
+        now = self.clock()
+        return {
+            name: {
+                "ready": self._ready[name],
+                "rate": self._reads[name] / (now - self._since[name])
+                if self._ready[name] and now > self._since[name] else 0.0,
+                "reads": self._reads[name],
+                "errors": self._errors[name],
+                "latency_ms": self._latency[name].stats(),
+                "schedule": self._schedulers[name].stats(),
+            }
+            for name in self.sensors
+        }
@@ -0,0 +1,200 @@
+"""Pin writes on a thread of their own, off the event loop.
+
+pyfirmata writes every pin value to the serial port as soon as Pin.write() is called, which
+blocks the caller for as long as the port takes. SerialWriter keeps the latest value
+submitted for each pin and does the writes from a background thread: every value pending
+when the thread wakes up is written into one buffer, which goes to the port in one write.
+A pin written again before the thread got to it only keeps its newest value, so the queue
+never holds more than one value per pin.
+"""
+
+import logging
+import threading
+import time
+from typing import Callable
+
+from pyfirmata import Board, Pin
+
+from common.scheduler import Histogram
+
+LATENCY_EDGES = (0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100)  # ms
+
+logger = logging.getLogger(__name__)
+
+
+class BatchedSerial:
+    """Stands in for a board's serial port: between collect() and flush(), the writes of the
+    thread that called collect() are collected and then go to the port in one call. Writes
+    outside of a batch or from other threads (step pulses, which must not wait for the
+    batch), and everything else, the reads of the board's iterator thread included, go
+    straight to the port."""
+
+    def __init__(self, port):
+        self.port = port
+        self.buffer = bytearray()
+        self.collecting = False
+        self._collector: int | None = None  # thread collecting writes
+        self._lock = threading.Lock()
+
+    def write(self, data) -> int:
+        with self._lock:
+            if self.collecting and threading.get_ident() == self._collector:
+                self.buffer += data
+                return len(data)
+            return self.port.write(data)
+
+    def collect(self):
+        """start collecting the calling thread's writes"""
+        with self._lock:
+            self.collecting = True
+            self._collector = threading.get_ident()
+
+    def flush(self) -> int:
+        """write everything collected to the port in one call, return the bytes written"""
+        with self._lock:
+            self.collecting = False
+            self._collector = None
+            if not self.buffer:
+                return 0
+            data = bytes(self.buffer)
+            self.buffer.clear()
+            self.port.write(data)
+            return len(data)
+
+    def __getattr__(self, name):
+        return getattr(self.port, name)
+
+
+class SerialWriter:
+    """Writes pin values from a background thread, one serial write per batch."""
+
+    def __init__(
+        self, board: Board | None = None, clock: Callable[[], float] = time.perf_counter
+    ):
+        """
+        Args:
+            board (Board): board whose serial port gets batched. Without one, each pin
+                write goes to the port on its own, still off the event loop.
+            clock (Callable): time source (s) for the enqueue to write latency
+        """
+        self.serial = None
+        if board is not None:
+            self.serial = BatchedSerial(board.sp)
+            board.sp = self.serial
+        self.clock = clock
+        self._pending: dict[Pin, tuple[object, float]] = {}  # pin: (value, time submitted)
+        self._busy = False  # a batch is being written
+        self._taken = 0  # submissions handed to the batch being written
+        self._done = 0  # submissions written, replaced ones included
+        self._condition = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._running = False
+        self.submitted = 0
+        self.replaced = 0  # values overwritten by a newer one before they were written
+        self.written = 0
+        self.batches = 0
+        self.bytes_written = 0
+        self.errors = 0
+        self.max_depth = 0  # most pins waiting at once
+        self.latency = Histogram(LATENCY_EDGES)  # ms from submit() to the port write
+
+    def start(self):
+        """start the writer thread"""
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="serial writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """write what is pending and stop the writer thread"""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, pin: Pin, value):
+        """Queue a value for a pin, replacing any value still waiting for it. Never blocks on
+        the serial port."""
+        with self._condition:
+            if pin in self._pending:
+                self.replaced += 1
+            self._pending[pin] = (value, self.clock())
+            self.submitted += 1
+            self.max_depth = max(self.max_depth, len(self._pending))
+            self._condition.notify()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Block until everything submitted so far is written.
+        Returns:
+            bool: False on timeout
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._pending and not self._busy, timeout=timeout
+            )
+
+    def written_through(self, mark: int) -> bool:
+        """Whether the first mark submissions (a past value of self.submitted) are written.
+        Never blocks."""
+        return self._done >= mark
+
+    @property
+    def depth(self) -> int:
+        """pins with a value waiting to be written"""
+        return len(self._pending)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or not self._running)
+                if not self._pending:
+                    return
+                batch, self._pending = self._pending, {}
+                self._busy = True
+                taken = self.submitted
+            try:
+                self._write(batch)
+            finally:
+                with self._condition:
+                    self._busy = False
+                    self._done = taken
+                    self._condition.notify_all()
+
+    def _write(self, batch: dict[Pin, tuple[object, float]]):
+        """write one batch of pin values and flush them to the port together"""
+        if self.serial is not None:
+            self.serial.collect()
+        for pin, (value, _) in batch.items():
+            pin.value = None  # pyfirmata drops a write of the value it already has
+            try:
+                pin.write(value)
+            except Exception:  # pylint: disable=broad-except
+                self.errors += 1
+                logger.exception("writing %s to %s failed", value, pin)
+        try:
+            if self.serial is not None:
+                self.bytes_written += self.serial.flush()
+        except Exception:  # pylint: disable=broad-except
+            self.errors += 1
+            logger.exception("serial write failed")
+        now = self.clock()
+        for _, submitted_at in batch.values():
+            self.latency.record((now - submitted_at) * 1000)
+        self.written += len(batch)
+        self.batches += 1
+
+    def stats(self) -> dict:
+        """Return the queue depth now and at most, the counts of values submitted, replaced
+        in the queue and written, and the submit to write latency (ms)."""
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "submitted": self.submitted,
+            "replaced": self.replaced,
+            "written": self.written,
+            "batches": self.batches,
+            "bytes_written": self.bytes_written,
+            "errors": self.errors,
+            "latency_ms": self.latency.stats(),
+        }
@@ -0,0 +1,157 @@
+"""Latest sensor samples shared between the Pi's processes through shared memory.
+
+A sensor process that runs on its own (to keep an I2C crash or a bno.hard_reset() out of the
+server) publishes every sample into a small shared memory record, and the server reads the
+newest one when it needs it: no socket, no encoding into frames, no lock and no system call
+per sample. The record is a seqlock:
+
+    seq (uint64) | write time (float64) | payload (the topic's codec layout) | crc32 (uint32)
+
+The writer stores an odd seq on its own, then the time, payload and CRC, then the next even
+seq, so the writer never waits for a reader. A reader copies the body between two reads of
+seq and retries if seq was odd or changed. Python cannot issue memory barriers, and the Pi's
+ARM core may make stores visible to another core out of order, so the seq alone cannot
+prove a copy whole: the reader also checks the body's CRC, which a copy mixing two samples
+fails (but for a 1 in 2^32 chance).
+
+seq 0 is a record nothing was written to yet, or that a restarted writer has just cleared.
+A writer starts its seq from the monotonic clock, so a restarted writer goes on past every
+seq the previous one reached and its first sample is new to the readers.
+"""
+
+import struct
+import time
+import zlib
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable
+
+from common import codec
+
+IMU_NAME = "rov_imu_data"
+DEPTH_NAME = "rov_depth"
+SEQ = struct.Struct("<Q")
+CRC = struct.Struct("<I")
+MAX_RETRIES = 100  # reads that raced a write before giving up on this read
+
+
+def untrack(shm: shared_memory.SharedMemory):
+    """keep the resource tracker from unlinking a record when a process that attached to it
+    exits (before Python 3.13 readers register it too); a record left by a crashed writer
+    is reused by the next one instead"""
+    resource_tracker.unregister(shm._name, "shared_memory")  # pylint: disable=protected-access
+
+
+class SharedSample:
+    """Seqlock protected shared memory record holding the newest message of a topic."""
+
+    def __init__(self, topic: str, name: str, create: bool = False,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            topic (str): codec topic of the messages, which sets the payload layout
+            name (str): shared memory name, the same in the writer and the readers
+            create (bool): True in the writer, which creates the record; readers attach to it
+                with open()
+            clock (Callable): time source of the write times, monotonic and shared by the
+                processes (time.monotonic is system wide on Linux)
+        """
+        self.topic = topic
+        self.name = name
+        self.layout = codec.LAYOUTS[topic]
+        # write time and payload, after seq
+        self.body = struct.Struct("<d" + self.layout.struct.format[1:])
+        self._crc_offset = SEQ.size + self.body.size
+        self.size = self._crc_offset + CRC.size
+        self.clock = clock
+        self.shm: shared_memory.SharedMemory | None = None
+        self._seq = 0  # the writer's sequence number, or the last one read
+        self.written_at = 0.0  # write time of the last sample read
+        self.written = 0
+        self.retries = 0  # reads that raced a write
+        if create:
+            try:
+                self.shm = shared_memory.SharedMemory(name, create=True, size=self.size)
+            except FileExistsError:
+                # left over by a writer that crashed, cleared below
+                self.shm = shared_memory.SharedMemory(name)
+            untrack(self.shm)
+            self.shm.buf[:self.size] = bytes(self.size)
+
+    def open(self) -> bool:
+        """Attach a reader to the record.
+        Returns:
+            bool: False if the writer has not created it yet
+        """
+        if self.shm is None:
+            try:
+                self.shm = shared_memory.SharedMemory(self.name)
+            except FileNotFoundError:
+                return False
+            untrack(self.shm)
+        return True
+
+    def write(self, value):
+        """Publish a message as the newest sample.
+        Args:
+            value: message of self.topic
+        """
+        buf = self.shm.buf
+        # even and past the last seq of any earlier writer of this record
+        seq = self._seq or time.monotonic_ns() * 2
+        body = self.body.pack(self.clock(), *self.layout.flatten(value))
+        # odd while the rest of the record is being written
+        SEQ.pack_into(buf, 0, seq + 1)
+        buf[SEQ.size:self._crc_offset] = body
+        CRC.pack_into(buf, self._crc_offset, zlib.crc32(body))
+        SEQ.pack_into(buf, 0, seq + 2)
+        self._seq = seq + 2
+        self.written += 1
+
+    def read(self) -> tuple[int, float, object] | None:
+        """Read the newest sample, without waiting for the writer.
+        Returns:
+            tuple | None: sequence number, write time and message; None if not attached,
+                nothing was written yet or every attempt raced a write
+        """
+        if self.shm is None:
+            return None
+        buf = self.shm.buf
+        end = self._crc_offset
+        for _ in range(MAX_RETRIES):
+            seq = SEQ.unpack_from(buf, 0)[0]
+            if not seq:
+                return None
+            if seq & 1:
+                self.retries += 1
+                continue
+            body = bytes(buf[SEQ.size:end])
+            crc = CRC.unpack_from(buf, end)[0]
+            if SEQ.unpack_from(buf, 0)[0] != seq or zlib.crc32(body) != crc:
+                self.retries += 1
+                continue
+            written_at, *values = self.body.unpack(body)
+            return seq, written_at, self.layout.unflatten(values)
+        return None
+
+    def read_new(self) -> tuple[float, object] | None:
+        """Read the newest sample if it was not read yet.
+        Returns:
+            tuple | None: write time and message, None if there is no new sample
+        """
+        sample = self.read()
+        if sample is None or sample[0] == self._seq:
+            return None
+        self._seq = sample[0]
+        self.written_at = sample[1]
+        return sample[1], sample[2]
+
+    def close(self, unlink: bool = False):
+        """detach, and remove the record if unlink (in the writer, on exit)"""
+        if self.shm is not None:
+            self.shm.close()
+            if unlink:
+                # unlink() also unregisters it from the tracker
+                name = self.shm._name  # pylint: disable=protected-access
+                resource_tracker.register(name, "shared_memory")
+                self.shm.unlink()
+            self.shm = None
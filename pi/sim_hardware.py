@@ -1,38 +1,309 @@
-import asyncio
+"""Simulated ROV for SIM mode.
 
-from common import utils
+ROVSim integrates a rigid-body model of the ROV (mass and added mass, linear and quadratic
+drag, buoyancy with a righting moment, thruster geometry) with NumPy. The thrusters are the
+real Thruster classes writing to SimPins, and the pulse width on each pin is turned back into
+thrust with the thrust curve, so SIM runs the same control and output code as the vehicle.
+The IMU and depth readings it makes are posted to the dispatcher like the frames of
+pi/imu.py and pi/depth-sensor.py.
 
-from .hardware import Servo
+Frames are those of VelocityVector: the body has x to the right, y forward and z up, the
+world has z up, and depth is -z. Time is virtual: step() advances it, run() keeps it in step
+with the wall clock, and simulate() runs as fast as it can, for batch tuning; drive() runs
+a ROVState's control loop under simulate().
+"""
 
+import math
+from typing import Callable, Mapping
 
-class SimThruster(Servo):
-    """Simulator Thruster. Prints out values."""
+import numpy as np
 
-    active_range: tuple
+from common import codec, utils
+from common.scheduler import SKIP, PeriodicScheduler
+
+from .depth_estimator import DepthEstimator
+from .dispatcher import Dispatcher
+from .hardware import Thruster
+from .rov_state import ROVState
+from .thrust_curve import ThrustCurve
+
+GRAVITY = 9.80665  # m/s^2, also N per kgf
+# thruster name: (position (m), thrust direction) in the body frame, as for
+# ThrusterAllocator.from_geometry: horizontal thrusters at 45 degrees, vertical ones at the
+# corners, with the signs of DEFAULT_MIX's x, y, z, pitch and roll columns
+SIM_GEOMETRY = {
+    "front_left_horizontal": ((-0.2, 0.25, 0.0), (1.0, 1.0, 0.0)),
+    "front_right_horizontal": ((0.2, 0.25, 0.0), (-1.0, 1.0, 0.0)),
+    "back_left_horizontal": ((-0.2, -0.25, 0.0), (-1.0, 1.0, 0.0)),
+    "back_right_horizontal": ((0.2, -0.25, 0.0), (1.0, 1.0, 0.0)),
+    "front_left_vertical": ((-0.2, 0.25, 0.0), (0.0, 0.0, 1.0)),
+    "front_right_vertical": ((0.2, 0.25, 0.0), (0.0, 0.0, 1.0)),
+    "back_left_vertical": ((-0.2, -0.25, 0.0), (0.0, 0.0, 1.0)),
+    "back_right_vertical": ((0.2, -0.25, 0.0), (0.0, 0.0, 1.0)),
+}
+EARTH_FIELD = np.array([0.0, 20.0, -40.0])  # uT in the world frame, roughly mid latitudes
+
+
+class SimPin:
+    """Stands in for a board pin: keeps the last value written."""
+
+    def __init__(self):
+        self.value = None
+
+    def write(self, value):
+        self.value = value
+
+
+class ROVModel:
+    """Physical parameters of the simulated ROV. Vectors are per body axis (x, y, z)."""
 
     def __init__(
-        self, pin_number: int, active_range: tuple = (30, 150)
-    ):  # pylint: disable=super-init-not-called
-        self.pin_number = pin_number
-        self.active_range = active_range
-        self.lock = asyncio.Lock()
-        self.angle = 90
-
-    def linear_map(self, x: float):
-        """map value to thruster value"""
-        return int(utils.linear_map(x, -1, 1, self.active_range[0], self.active_range[1]))
-
-    async def set_val(self, val: int):
-        """set angle of servo motor in degrees"""
-        val = self.linear_map(val)
-        if val < 0 or val > 180:
-            raise ValueError("Angle must be between 0 and 180")
-        async with self.lock:
-            self.angle = val
-
-    async def run(self):
-        """continuously print val of thruster"""
-        while True:
-            # async with self.lock:
-                # print(f"Thruster {self.pin_number}: {self.angle}")
-            await asyncio.sleep(0.1)
+        self,
+        mass: float = 12.0,
+        added_mass: tuple = (4.0, 6.0, 8.0),
+        inertia: tuple = (0.35, 0.25, 0.4),
+        linear_drag: tuple = (6.0, 5.0, 8.0),
+        quadratic_drag: tuple = (25.0, 18.0, 35.0),
+        angular_drag: tuple = (1.5, 1.5, 1.0),
+        angular_quadratic_drag: tuple = (2.0, 2.0, 1.5),
+        net_buoyancy: float = 1.5,
+        buoyancy_offset: float = 0.05,
+    ):
+        """
+        Args:
+            mass (float): mass (kg)
+            added_mass (tuple): mass of the water moved along with the ROV (kg)
+            inertia (tuple): moments of inertia about the body axes, water included (kg m^2)
+            linear_drag (tuple): drag per unit velocity (N s/m)
+            quadratic_drag (tuple): drag per unit velocity squared (N s^2/m^2)
+            angular_drag (tuple): drag torque per unit angular velocity (N m s/rad)
+            angular_quadratic_drag (tuple): drag torque per unit angular velocity squared
+            net_buoyancy (float): buoyancy minus weight (N), positive floats
+            buoyancy_offset (float): height of the center of buoyancy above the center of
+                gravity (m), which rights the ROV
+        """
+        self.mass = mass
+        self.effective_mass = mass + np.asarray(added_mass, dtype=float)
+        self.inertia = np.asarray(inertia, dtype=float)
+        self.linear_drag = np.asarray(linear_drag, dtype=float)
+        self.quadratic_drag = np.asarray(quadratic_drag, dtype=float)
+        self.angular_drag = np.asarray(angular_drag, dtype=float)
+        self.angular_quadratic_drag = np.asarray(angular_quadratic_drag, dtype=float)
+        self.buoyancy = mass * GRAVITY + net_buoyancy
+        self.net_buoyancy = net_buoyancy
+        self.buoyancy_offset = buoyancy_offset
+
+
+def rotation(q: np.ndarray) -> np.ndarray:
+    """Rotation matrix of a unit quaternion (w, x, y, z)."""
+    w, x, y, z = q
+    return np.array([
+        [1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)],
+        [2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)],
+        [2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)],
+    ])
+
+
+def cross(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """cross product of two 3-vectors, without np.cross's overhead"""
+    return np.array([
+        a[1] * b[2] - a[2] * b[1],
+        a[2] * b[0] - a[0] * b[2],
+        a[0] * b[1] - a[1] * b[0],
+    ])
+
+
+class ROVSim:
+    """Rigid-body simulation of the ROV, driven by its thrusters' pins."""
+
+    def __init__(
+        self,
+        thrusters: Mapping[str, Thruster],
+        curve: ThrustCurve,
+        geometry: Mapping[str, tuple] = SIM_GEOMETRY,
+        model: ROVModel | None = None,
+        depth: float = 1.0,
+        depth_noise: float = 0.0,
+        seed: int | None = None,
+    ):
+        """
+        Args:
+            thrusters (Mapping[str, Thruster]): thrusters writing to SimPins, one per
+                thruster of geometry
+            curve (ThrustCurve): thrust (kgf) of a thruster against its pulse width
+            geometry (Mapping): thruster name: (position (m), thrust direction), body frame
+            model (ROVModel): physical parameters
+            depth (float): starting depth (m)
+            depth_noise (float): standard deviation (m) of the noise on depth readings
+            seed (int): seed of the noise
+        """
+        self.model = model or ROVModel()
+        self.curve = curve
+        self._thrusters = [thrusters[name] for name in geometry]
+        # a reversed thruster pushes the other way for the same pulse width
+        self._sign = np.array([-1.0 if thruster.reverse else 1.0 for thruster in self._thrusters])
+        positions = np.array([position for position, _ in geometry.values()], dtype=float)
+        directions = np.array([direction for _, direction in geometry.values()], dtype=float)
+        directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+        self._force = directions.T  # (3, n) body force per N of thrust
+        self._torque = np.cross(positions, directions).T  # (3, n) body torque per N
+        self._buoyancy_arm = np.array([0.0, 0.0, self.model.buoyancy_offset])
+        self.depth_noise = depth_noise
+        self._rng = np.random.default_rng(seed)
+        self.time = 0.0  # virtual time (s)
+        self.position = np.array([0.0, 0.0, -depth])  # world frame (m)
+        self.velocity = np.zeros(3)  # body frame (m/s)
+        self.orientation = np.array([1.0, 0.0, 0.0, 0.0])  # body to world, (w, x, y, z)
+        self.angular_velocity = np.zeros(3)  # body frame (rad/s)
+        self.acceleration = np.zeros(3)  # body frame, gravity excluded (m/s^2)
+        self.thrust = np.zeros(len(self._thrusters))  # N per thruster
+
+    def clock(self) -> float:
+        """virtual time (s), to drive schedulers and controllers in simulate()"""
+        return self.time
+
+    def read_thrust(self) -> np.ndarray:
+        """thrust (N) of each thruster from the pulse width on its pin"""
+        pwm = [
+            self.curve.neutral if thruster.pin.value is None else thruster.pin.value
+            for thruster in self._thrusters
+        ]
+        return self.curve.thrust_at(np.array(pwm, dtype=float)) * GRAVITY * self._sign
+
+    def step(self, dt: float):
+        """Advance the simulation by dt (s), with the thrust on the pins now."""
+        model = self.model
+        self.thrust = self.read_thrust()
+        v, w = self.velocity, self.angular_velocity
+        body_to_world = rotation(self.orientation)
+        up = body_to_world[2]  # world +z in the body frame
+
+        force = self._force @ self.thrust + model.net_buoyancy * up
+        force -= (model.linear_drag + model.quadratic_drag * np.abs(v)) * v
+        torque = self._torque @ self.thrust
+        torque += cross(self._buoyancy_arm, model.buoyancy * up)
+        torque -= (model.angular_drag + model.angular_quadratic_drag * np.abs(w)) * w
+
+        # rigid body in a rotating frame; semi-implicit Euler
+        self.acceleration = force / model.effective_mass
+        v_dot = self.acceleration - cross(w, v)
+        w_dot = (torque - cross(w, model.inertia * w)) / model.inertia
+        self.velocity = v + v_dot * dt
+        self.angular_velocity = w + w_dot * dt
+        self.position = self.position + body_to_world @ self.velocity * dt
+
+        qw, qx, qy, qz = self.orientation
+        wx, wy, wz = self.angular_velocity
+        q_dot = 0.5 * np.array([
+            -qx * wx - qy * wy - qz * wz,
+            qw * wx + qy * wz - qz * wy,
+            qw * wy - qx * wz + qz * wx,
+            qw * wz + qx * wy - qy * wx,
+        ])
+        q = self.orientation + q_dot * dt
+        self.orientation = q / np.linalg.norm(q)
+        self.time += dt
+
+    def depth(self) -> float:
+        """depth (m) as the depth sensor reads it"""
+        noise = self._rng.normal(0.0, self.depth_noise) if self.depth_noise else 0.0
+        return float(-self.position[2] + noise)
+
+    def imu_data(self) -> dict:
+        """IMU reading in the format of pi/imu.py's read_data()"""
+        magnetic = rotation(self.orientation).T @ EARTH_FIELD
+        w, x, y, z = self.orientation.tolist()
+        return {
+            "acceleration": utils.make_xyz_dict(*self.acceleration.tolist()),
+            "velocity": utils.make_xyz_dict(*self.velocity.tolist()),
+            "magnetometer": utils.make_xyz_dict(*magnetic.tolist()),
+            "game_quaternion": {"i": x, "j": y, "k": z, "real": w},
+        }
+
+    async def run(
+        self,
+        dispatcher: Dispatcher,
+        freq: float = 200.0,
+        imu_freq: float = 10.0,
+        depth_freq: float = 10.0,
+    ):
+        """Step in real time and post IMU and depth readings to the dispatcher, where the
+        sensor processes' frames go.
+        Args:
+            dispatcher (Dispatcher): dispatcher of the server
+            freq (float): rate (Hz) of the physics steps
+            imu_freq (float): rate (Hz) of IMU readings
+            depth_freq (float): rate (Hz) of depth readings
+        """
+        imu_every = max(1, round(freq / imu_freq))
+        depth_every = max(1, round(freq / depth_freq))
+        scheduler = PeriodicScheduler(freq, policy=SKIP, name="simulator")
+        # filtered as pi/depth-sensor.py does
+        estimator = DepthEstimator(noise=max(self.depth_noise, 0.001), clock=self.clock)
+        ticks = 0
+        async for dt in scheduler.ticks():
+            self.step(min(dt, 2 * scheduler.period))  # a stalled loop must not blow it up
+            ticks += 1
+            if ticks % imu_every == 0:
+                dispatcher.post(codec.IMU_DATA, self.imu_data())
+            if ticks % depth_every == 0:
+                dispatcher.post(codec.DEPTH, estimator.update(self.depth()))
+
+    def drive(self, rov_state: ROVState) -> Callable[[float], None]:
+        """Controller for simulate() that runs rov_state's control loop on virtual time.
+        Every control period it hands rov_state the IMU reading and the filtered depth, as
+        run() posts them, then ticks it.
+        Args:
+            rov_state (ROVState): built with clock=self.clock, writing this sim's thrusters
+        Returns:
+            Callable[[float], None]: controller taking the control period (s)
+        """
+        # filtered as pi/depth-sensor.py does
+        estimator = DepthEstimator(noise=max(self.depth_noise, 0.001), clock=self.clock)
+
+        def controller(period: float):
+            rov_state.set_current_imu_data(self.imu_data())
+            rov_state.set_current_depth(estimator.update(self.depth()))
+            rov_state.tick(period, self.clock())
+
+        return controller
+
+    def simulate(
+        self,
+        duration: float,
+        controller: Callable[[float], None] | None = None,
+        control_freq: float = 10.0,
+        dt: float = 0.005,
+    ) -> dict[str, np.ndarray]:
+        """Run for duration (s) of virtual time, as fast as possible.
+        Args:
+            duration (float): virtual time (s) to run for
+            controller (Callable): called with the control period (s) every control period,
+                before the physics steps of that period; it writes the thrusters
+            control_freq (float): rate (Hz) at which controller is called
+            dt (float): physics step (s)
+        Returns:
+            dict[str, np.ndarray]: time, position, depth, velocity and orientation at the
+                start of every control period
+        """
+        period = 1.0 / control_freq
+        steps = max(1, round(period / dt))
+        ticks = math.ceil(duration / period)
+        log = {
+            "time": np.empty(ticks),
+            "position": np.empty((ticks, 3)),
+            "depth": np.empty(ticks),
+            "velocity": np.empty((ticks, 3)),
+            "orientation": np.empty((ticks, 4)),
+        }
+        for i in range(ticks):
+            log["time"][i] = self.time
+            log["position"][i] = self.position
+            log["depth"][i] = -self.position[2]
+            log["velocity"][i] = self.velocity
+            log["orientation"][i] = self.orientation
+            if controller is not None:
+                controller(period)
+            for _ in range(steps):
+                self.step(period / steps)
+        return log
@@ -0,0 +1,256 @@
+"""Step pulse generation for stepper motors, timed from a thread of its own.
+
+Motion is planned as arrays of step times, computed up front with numpy for constant
+acceleration ramps, and played back by a timing thread that waits on a condition until each
+step, giving up the GIL while it waits. Steps are then timed by the thread, to within the OS
+timer's tens of microseconds, not by the event loop's timer resolution, and the event loop
+only hands over new targets.
+
+Every step is two Firmata writes on the serial link, made from the thread straight away, so
+the step rate is capped by the share of the link's budget reserved for it (OutputLink.reserve).
+"""
+
+import logging
+import math
+import threading
+import time
+from typing import Callable
+
+import numpy as np
+from pyfirmata import Pin
+
+from common.scheduler import Histogram
+
+from .output_link import LINK_BUDGET, MESSAGE_BYTES, STEPPER_SHARE, OutputLink
+
+ERROR_EDGES = (0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5)  # ms, step timing error buckets
+STEP_BYTES = 2 * MESSAGE_BYTES  # a step writes the step pin high, then low
+MAX_RATE = LINK_BUDGET * STEPPER_SHARE / STEP_BYTES  # steps/s the link can carry, 240
+
+logger = logging.getLogger(__name__)
+
+
+def ramp(rate_from: float, rate_to: float, accel: float) -> tuple[np.ndarray, np.ndarray]:
+    """Steps that change the step rate from rate_from to rate_to at constant acceleration.
+    Args:
+        rate_from (float): step rate (steps/s) at the start, >= 0
+        rate_to (float): step rate (steps/s) to reach, >= 0
+        accel (float): acceleration (steps/s^2), > 0
+    Returns:
+        tuple[np.ndarray, np.ndarray]: time (s) of each step from the start of the ramp, and
+            the step rate reached at each step
+    """
+    a = accel if rate_to > rate_from else -accel
+    steps = np.arange(1, int(abs(rate_to**2 - rate_from**2) / (2 * accel)) + 1)
+    # position rate_from * t + a * t^2 / 2 reaches step k at:
+    rates = np.sqrt(np.maximum(rate_from**2 + 2 * a * steps, 0.0))
+    return (rates - rate_from) / a, rates
+
+
+def trapezoid(steps: int, max_rate: float, accel: float) -> np.ndarray:
+    """Step times of a move that starts and ends at rest, accelerating to at most max_rate.
+    Args:
+        steps (int): number of steps, > 0
+        max_rate (float): highest step rate (steps/s)
+        accel (float): acceleration and deceleration (steps/s^2)
+    Returns:
+        np.ndarray: time (s) of each step from the start of the move
+    """
+    peak = min(max_rate, math.sqrt(accel * steps))
+    ramp_steps = peak**2 / (2 * accel)
+    ramp_time = peak / accel
+    total = 2 * ramp_time + (steps - 2 * ramp_steps) / peak
+    k = np.arange(1, steps + 1, dtype=float)
+    return np.where(
+        k <= ramp_steps,
+        np.sqrt(2 * k / accel),
+        np.where(
+            k <= steps - ramp_steps,
+            ramp_time + (k - ramp_steps) / peak,
+            total - np.sqrt(2 * np.maximum(steps - k, 0.0) / accel),
+        ),
+    )
+
+
+class StepGenerator:
+    """Drives a step and a direction pin from a timing thread.
+
+    Either runs at a step rate, set_rate(), ramping between rates at accel, or makes a move
+    of a number of steps, move(). A new command replaces the one running at the next step.
+    """
+
+    def __init__(
+        self,
+        step_pin: Pin,
+        direction_pin: Pin,
+        accel: float = 2000.0,
+        max_rate: float = MAX_RATE,
+        link: OutputLink | None = None,
+        clock: Callable[[], float] = time.perf_counter,
+    ):
+        """
+        Args:
+            step_pin (Pin): pulsed once per step, written from the timing thread directly
+                (not through an OutputLink, which would merge the pulses)
+            direction_pin (Pin): 1 for positive steps
+            accel (float): acceleration (steps/s^2)
+            max_rate (float): highest step rate (steps/s)
+            link (OutputLink): link the pins' board is written through; max_rate is
+                reserved from its budget, and lowered to what it can spare
+            clock (Callable): time source (s) the steps are timed against
+        """
+        if link is not None:
+            max_rate = link.reserve(max_rate * STEP_BYTES) / STEP_BYTES
+            if max_rate <= 0:
+                logger.error("no serial link budget left for step pulses, stepper disabled")
+        self.step_pin = step_pin
+        self.direction_pin = direction_pin
+        self.accel = accel
+        self.max_rate = max_rate
+        self.clock = clock
+        self.position = 0  # steps from where the generator started
+        self.rate = 0.0  # step rate (steps/s) reached, negative in the negative direction
+        self._target_rate = 0.0
+        self._move: int | None = None  # steps of a pending move
+        self._version = 0  # bumped on every new command
+        self._direction = None
+        self._condition = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._running = False
+        self.steps = 0
+        self.error = Histogram(ERROR_EDGES)  # ms between a step's planned and actual time
+
+    def start(self):
+        """start the timing thread"""
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="step generator", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """stop the timing thread, without ramping down"""
+        with self._condition:
+            self._running = False
+            self._version += 1
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def set_rate(self, rate: float):
+        """Run at a step rate, reached with a ramp from the current one.
+        Args:
+            rate (float): steps/s, negative in the negative direction, clipped to max_rate
+        """
+        with self._condition:
+            self._target_rate = max(-self.max_rate, min(self.max_rate, rate))
+            self._move = None
+            self._version += 1
+            self._condition.notify_all()
+
+    def move(self, steps: int):
+        """Move a number of steps from rest with a trapezoid profile, after ramping down from
+        any rate it is running at.
+        Args:
+            steps (int): steps, negative in the negative direction
+        """
+        if steps == 0 or self.max_rate <= 0:
+            return
+        with self._condition:
+            self._target_rate = 0.0
+            self._move = steps
+            self._version += 1
+            self._condition.notify_all()
+
+    def halt(self):
+        """stop stepping at once, for the emergency stop"""
+        with self._condition:
+            self._target_rate = 0.0
+            self._move = None
+            self.rate = 0.0
+            self._version += 1
+            self._condition.notify_all()
+
+    @property
+    def idle(self) -> bool:
+        """True when not stepping and nothing is pending"""
+        return self.rate == 0 and self._target_rate == 0 and self._move is None
+
+    def _plan(self) -> tuple[np.ndarray, np.ndarray, int, float]:
+        """next segment to play: step times, rate at each step, direction and the rate to
+        keep stepping at afterwards (0 to stop)"""
+        rate, target = self.rate, self._target_rate
+        if rate != 0 and (target == 0 or (rate > 0) != (target > 0)):
+            # stop first, then possibly start the other way
+            times, rates = ramp(abs(rate), 0.0, self.accel)
+            return times, rates, 1 if rate > 0 else -1, 0.0
+        if target != 0:
+            times, rates = ramp(abs(rate), abs(target), self.accel)
+            return times, rates, 1 if target > 0 else -1, abs(target)
+        steps, self._move = self._move, None
+        times = trapezoid(abs(steps), self.max_rate, self.accel)
+        return times, np.zeros(len(times)), 1 if steps > 0 else -1, 0.0
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: not self._running or not self.idle)
+                if not self._running:
+                    return
+                version = self._version
+                times, rates, direction, cruise = self._plan()
+            if direction != self._direction:
+                self.direction_pin.write(1 if direction > 0 else 0)
+                self._direction = direction
+            start = self.clock()
+            done = self._play(start, times, rates, direction, version)
+            if done and cruise:
+                self._cruise(start + (times[-1] if len(times) else 0.0), cruise, direction,
+                             version)
+            elif done:
+                with self._condition:
+                    if self._version == version:
+                        self.rate = 0.0
+
+    def _play(self, start: float, times: np.ndarray, rates: np.ndarray, direction: int,
+              version: int) -> bool:
+        """step at start + times, False if a new command came in first"""
+        for t, rate in zip(times.tolist(), rates.tolist()):
+            if not self._step_at(start + t, direction, version, rate):
+                return False
+        return True
+
+    def _cruise(self, last: float, rate: float, direction: int, version: int):
+        """step every 1 / rate s after last until a new command comes in"""
+        interval = 1.0 / rate
+        while True:
+            last += interval
+            if not self._step_at(last, direction, version, rate):
+                return
+
+    def _step_at(self, when: float, direction: int, version: int, rate: float) -> bool:
+        """Wait for when and pulse the step pin, then record rate (0 to leave it) as reached.
+        Returns False without stepping if a new command came in first."""
+        clock = self.clock
+        with self._condition:
+            remaining = when - clock()
+            if remaining > 0:
+                self._condition.wait_for(lambda: self._version != version, timeout=remaining)
+            if self._version != version:
+                return False
+            self.step_pin.write(1)
+            self.error.record(max(0.0, clock() - when) * 1000)
+            self.step_pin.write(0)
+            self.position += direction
+            self.steps += 1
+            if rate:
+                self.rate = rate * direction
+        return True
+
+    def stats(self) -> dict:
+        """Return the position, rate, steps taken and the step timing error (ms)."""
+        return {
+            "position": self.position,
+            "rate": self.rate,
+            "steps": self.steps,
+            "error_ms": self.error.stats(),
+        }
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from ..actuator_driver import ActuatorDriver
+from ..hardware import LinActuator, Servo, Thruster
+
+
+class FakePin:
+    def __init__(self):
+        self.writes = []
+
+    def write(self, value):
+        self.writes.append(value)
+
+    @property
+    def value(self):
+        return self.writes[-1] if self.writes else None
+
+
+def make_driver():
+    actuators = {
+        "left": Thruster(FakePin()),
+        "right": Thruster(FakePin(), reverse=True),
+        "camera_servo": Servo(FakePin()),
+        "extend": LinActuator(FakePin(), FakePin()),
+    }
+    return actuators, ActuatorDriver(actuators, thrusters=("left", "right"))
+
+
+def test_tick_writes_every_output_once():
+    actuators, driver = make_driver()
+    driver.set_thrust(np.array([1.0, 1.0]))
+    driver.set_val("camera_servo", 120)
+    driver.set_val("extend", 1)
+    for actuator in actuators.values():
+        assert actuator.pin.writes == []  # nothing is written before the tick
+
+    driver.tick()
+    assert actuators["left"].pin.writes == [1800]
+    assert actuators["right"].pin.writes == [1200]
+    assert actuators["camera_servo"].pin.writes == [120]
+    assert actuators["extend"].pin.writes == [0] and actuators["extend"].pin2.writes == [1]
+    assert actuators["left"].angle == 1800 and actuators["extend"].pos == 1
+    stats = driver.stats()
+    assert stats["actuators"] == 4 and stats["ticks"] == 1 and stats["tick_ms"]["count"] == 1
+
+
+def test_set_val_checks_range():
+    _, driver = make_driver()
+    with pytest.raises(ValueError):
+        driver.set_val("extend", 2)
+
+
+def test_stopped_outputs_hold_their_safe_value():
+    actuators, driver = make_driver()
+    driver.set_thrust(np.array([1.0, -0.5]))
+    driver.set_val("extend", -1)
+    for actuator in actuators.values():
+        actuator.stop()
+    driver.sync()
+
+    driver.set_thrust(np.array([1.0, 1.0]))
+    driver.set_val("extend", 1)
+    driver.set_val("camera_servo", 10)
+    driver.tick()
+    assert actuators["left"].pin.value == 1500 and actuators["right"].pin.value == 1500
+    assert actuators["extend"].pin.value == 0 and actuators["extend"].pin2.value == 0
+    assert actuators["camera_servo"].pin.value == 90
+
+    actuators["left"].release()
+    driver.sync()
+    driver.set_thrust(np.array([1.0, 1.0]))
+    driver.tick()
+    assert actuators["left"].pin.value == 1800 and actuators["right"].pin.value == 1500
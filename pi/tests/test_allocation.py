@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from ..allocation import AXES, DEFAULT_MIX, ThrusterAllocator
+
+
+def hand_mix(v: dict) -> list[float]:
+    """the mix the ROV used before the allocation matrix"""
+    return [
+        v["x"] + v["y"] + v["yaw"],
+        -v["x"] + v["y"] - v["yaw"],
+        -v["x"] + v["y"] + v["yaw"],
+        v["x"] + v["y"] + v["yaw"],
+        v["z"] + v["pitch"] + v["roll"],
+        v["z"] + v["pitch"] - v["roll"],
+        v["z"] - v["pitch"] + v["roll"],
+        v["z"] - v["pitch"] - v["roll"],
+    ]
+
+
+def test_default_mix_matches_hand_mix_when_unsaturated():
+    allocator = ThrusterAllocator.from_mix(DEFAULT_MIX)
+    v = dict(zip(AXES, [0.1, 0.2, -0.3, 0.05, 0.1, -0.2]))
+    np.testing.assert_allclose(
+        allocator.allocate([v[axis] for axis in AXES]), hand_mix(v), atol=1e-12
+    )
+
+
+def test_desaturation_keeps_direction():
+    allocator = ThrusterAllocator.from_mix(DEFAULT_MIX)
+    velocity = np.array([1.0, 1.0, 0.0, 0.5, 0.0, 0.0])
+    thrust = allocator.allocate(velocity)
+    raw = allocator.matrix @ velocity
+    assert np.abs(thrust).max() == pytest.approx(1.0)
+    # scaled as a whole instead of clipped per thruster
+    np.testing.assert_allclose(thrust, raw / np.abs(raw).max())
+
+
+def test_gains_and_batches():
+    allocator = ThrusterAllocator.from_mix(DEFAULT_MIX)
+    velocities = np.random.default_rng(0).uniform(-1, 1, size=(50, len(AXES)))
+    gains = np.array([1, 1, 1, 1, 0.3, 0.3, 0.3, 0.3])
+    batch = allocator.allocate(velocities, gains)
+    assert batch.shape == (50, 8)
+    for velocity, thrust in zip(velocities, batch):
+        np.testing.assert_allclose(thrust, allocator.allocate(velocity, gains))
+    assert np.abs(batch).max() <= 1.0
+
+
+def test_from_geometry_decouples_axes():
+    # four vectored horizontal thrusters at 45 degrees and four vertical ones
+    s = np.sqrt(0.5)
+    geometry = {
+        "front_left_horizontal": ((-0.2, 0.3, 0), (s, s, 0)),
+        "front_right_horizontal": ((0.2, 0.3, 0), (-s, s, 0)),
+        "back_left_horizontal": ((-0.2, -0.3, 0), (-s, s, 0)),
+        "back_right_horizontal": ((0.2, -0.3, 0), (s, s, 0)),
+        "front_left_vertical": ((-0.2, 0.2, 0), (0, 0, 1)),
+        "front_right_vertical": ((0.2, 0.2, 0), (0, 0, 1)),
+        "back_left_vertical": ((-0.2, -0.2, 0), (0, 0, 1)),
+        "back_right_vertical": ((0.2, -0.2, 0), (0, 0, 1)),
+    }
+    allocator = ThrusterAllocator.from_geometry(geometry)
+    assert allocator.matrix.shape == (8, 6)
+    np.testing.assert_allclose(np.abs(allocator.matrix).max(axis=0), 1.0)
+    # pure surge: only the horizontal thrusters push, all forwards
+    thrust = allocator.allocate([0, 1, 0, 0, 0, 0])
+    assert np.all(thrust[:4] > 0)
+    np.testing.assert_allclose(thrust[4:], 0, atol=1e-9)
+
+
+def test_matrix_shape_is_checked():
+    with pytest.raises(ValueError):
+        ThrusterAllocator(["a", "b"], np.zeros((3, 6)))
@@ -0,0 +1,92 @@
+import asyncio
+
+from common import codec, utils
+
+from ..connection import Connection
+from ..dispatcher import Dispatcher
+from ..publisher import Publisher
+
+WELCOME = {"version": codec.PROTOCOL_VERSION, "control_loop_freq": 10.0, "command_timeout": 0.2}
+
+
+def test_connection_pub_sub_and_cleanup():
+    async def scenario():
+        dispatcher = Dispatcher()
+        received = []
+        dispatcher.register(codec.DEPTH, received.append)
+        dispatcher.register(codec.TARGET_VELOCITY, received.append)
+        publisher = Publisher(max_freq=50)
+        publisher.add_topic(codec.DEPTH, lambda: {"depth": 0.5, "rate": 0.0})
+        connections = []
+        done = asyncio.Event()
+
+        async def handle(reader, writer):
+            connection = Connection(reader, writer, dispatcher, publisher, WELCOME)
+            connections.append(connection)
+            await connection.serve()
+            done.set()
+
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        tasks = [asyncio.create_task(dispatcher.run()), asyncio.create_task(publisher.run())]
+
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        topic, welcome = await asyncio.wait_for(codec.read_frame(reader), timeout=1)
+        assert topic == codec.WELCOME
+        assert welcome["control_loop_freq"] == 10.0
+        writer.write(codec.encode(codec.HELLO, {
+            "publish_rate": welcome["control_loop_freq"],
+            "publishes": [codec.DEPTH],
+            "subscribes": {codec.DEPTH: 50},
+        }))
+        # not declared in the hello, so it is ignored
+        writer.write(codec.encode(codec.TARGET_VELOCITY, utils.VelocityVector()))
+        writer.write(codec.encode(codec.DEPTH, {"depth": 2.0, "rate": 0.0}))
+        await writer.drain()
+        # the server publishes the subscribed topic while the client is connected
+        topic, depth = await asyncio.wait_for(codec.read_frame(reader), timeout=1)
+        assert (topic, depth) == (codec.DEPTH, {"depth": 0.5, "rate": 0.0})
+        assert connections[0].live_tasks == 1
+        assert connections[0].rejected == 1
+        assert connections[0].publish_rate == 10.0
+
+        writer.close()
+        await writer.wait_closed()
+        await asyncio.wait_for(done.wait(), timeout=1)
+
+        for task in tasks:
+            task.cancel()
+        server.close()
+        await server.wait_closed()
+        return connections[0], received, publisher
+
+    connection, received, publisher = asyncio.run(scenario())
+    assert received == [{"depth": 2.0, "rate": 0.0}]
+    assert connection.closed
+    assert connection.live_tasks == 0
+    assert publisher.stats() == {}
+
+
+def test_connection_closes_on_protocol_mismatch():
+    async def scenario():
+        publisher = Publisher(max_freq=50)
+        connections = []
+
+        async def handle(reader, writer):
+            connection = Connection(reader, writer, Dispatcher(), publisher, WELCOME)
+            connections.append(connection)
+            await connection.serve()
+
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        await codec.read_frame(reader)
+        writer.write(codec.encode(codec.HELLO, {"version": codec.PROTOCOL_VERSION + 1}))
+        # the server hangs up
+        assert await asyncio.wait_for(reader.read(), timeout=1) == b""
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return connections[0]
+
+    assert asyncio.run(scenario()).closed
@@ -0,0 +1,52 @@
+import numpy as np
+
+from ..allocation import DEFAULT_MIX
+from ..depth_estimator import DepthEstimator
+from ..hardware import Thruster
+from ..rov_state import ROVState
+
+
+class FakePin:
+    def write(self, value):
+        pass
+
+
+def test_tracks_depth_and_rate_of_a_noisy_descent():
+    rng = np.random.default_rng(0)
+    estimator = DepthEstimator(noise=0.005)
+    times = np.arange(0, 10, 0.05)  # 20 Hz
+    truth = 1.0 + 0.2 * times  # descending at 0.2 m/s
+    for t, depth in zip(times, truth + rng.normal(0, 0.005, len(times))):
+        estimate = estimator.update(depth, now=t)
+    assert abs(estimate["depth"] - truth[-1]) < 0.01
+    assert abs(estimate["rate"] - 0.2) < 0.02
+    # lags less than the boxcar average of the last 10 readings, 0.25 s at 20 Hz
+    boxcar_lag = 0.2 * 0.05 * 9 / 2
+    assert abs(estimate["depth"] - truth[-1]) < boxcar_lag / 2
+    assert 0.002 < estimator.stats()["innovation_rms"] < 0.01
+
+
+def test_glitches_are_rejected_and_real_jumps_are_not():
+    estimator = DepthEstimator(noise=0.005, max_rejected=3)
+    for i in range(20):
+        estimator.update(2.0, now=i * 0.05)
+    estimator.update(12.0, now=1.0)  # bad I2C read
+    assert abs(estimator.depth - 2.0) < 1e-6 and estimator.rejected == 1
+    for i in range(3):
+        estimator.update(3.0, now=1.05 + i * 0.05)  # really moved, e.g. sensor replugged
+    assert estimator.depth == 3.0 and estimator.rate == 0.0
+
+
+def test_rov_state_extrapolates_depth_on_the_scheduler_clock():
+    rov_state = ROVState(
+        actuators={},
+        thrusters={name: Thruster(FakePin()) for name in DEFAULT_MIX},
+        sensors={},
+        status_flags={"agnes_mode": False, "agnes_factor": 0.3, "auto_depth": False},
+    )
+    rov_state.scheduler.clock = lambda: 100.0
+    rov_state.set_current_depth({"depth": 2.0, "rate": 0.5})
+    assert rov_state._last_current_depth_update == 100.0
+    assert rov_state._depth_at(100.04) == 2.0 + 0.5 * (100.04 - 100.0)
+    # no further than one control loop period (0.1 s at 10 Hz)
+    assert rov_state._depth_at(130.0) == 2.0 + 0.5 * 0.1
@@ -0,0 +1,72 @@
+import asyncio
+
+from ..dispatcher import Dispatcher
+
+
+def test_latest_message_wins_and_counts_overwrites():
+    dispatcher = Dispatcher()
+    received = []
+    dispatcher.register("depth", received.append)
+
+    for depth in (1.0, 2.0, 3.0):
+        dispatcher.post("depth", depth)
+    dispatcher.dispatch_pending()
+
+    assert received == [3.0]
+    stats = dispatcher.stats()["depth"]
+    assert stats["received"] == 3
+    assert stats["delivered"] == 1
+    assert stats["overwritten"] == 2
+
+
+def test_topics_do_not_starve_each_other():
+    dispatcher = Dispatcher()
+    received = []
+    dispatcher.register("imu_data", lambda msg: received.append(("imu_data", msg)))
+    dispatcher.register("depth", lambda msg: received.append(("depth", msg)))
+
+    dispatcher.post("depth", 1.0)
+    for i in range(100):
+        dispatcher.post("imu_data", i)
+    dispatcher.dispatch_pending()
+
+    assert received == [("depth", 1.0), ("imu_data", 99)]
+
+
+def test_unhandled_topic_is_dropped():
+    dispatcher = Dispatcher()
+    dispatcher.post("unknown", 1)
+    dispatcher.dispatch_pending()
+    assert dispatcher.stats()["unknown"]["dropped"] == 1
+
+
+def test_handler_error_does_not_stop_dispatch():
+    dispatcher = Dispatcher()
+    received = []
+
+    def bad_handler(_):
+        raise ValueError("bad message")
+
+    dispatcher.register("status_flags", bad_handler)
+    dispatcher.register("depth", received.append)
+    dispatcher.post("status_flags", {})
+    dispatcher.post("depth", 1.0)
+    dispatcher.dispatch_pending()
+
+    assert received == [1.0]
+    assert dispatcher.stats()["status_flags"]["errors"] == 1
+
+
+def test_run_wakes_on_post():
+    async def scenario():
+        dispatcher = Dispatcher()
+        received = asyncio.Queue()
+        dispatcher.register("depth", received.put_nowait)
+        task = asyncio.create_task(dispatcher.run())
+        await asyncio.sleep(0)
+        dispatcher.post("depth", 4.0)
+        msg = await asyncio.wait_for(received.get(), timeout=1)
+        task.cancel()
+        return msg
+
+    assert asyncio.run(scenario()) == 4.0
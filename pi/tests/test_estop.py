@@ -0,0 +1,125 @@
+import asyncio
+import time
+
+from common import codec, utils
+
+from ..connection import Connection
+from ..dispatcher import Dispatcher
+from ..hardware import LinActuator, Thruster
+from ..publisher import Publisher
+from ..rov_state import ROVState
+
+WELCOME = {"version": codec.PROTOCOL_VERSION, "control_loop_freq": 10.0, "command_timeout": 0.2}
+
+
+class FakePin:
+    """records every value written to it and when"""
+
+    def __init__(self):
+        self.writes = []  # (time.perf_counter(), value)
+
+    def write(self, value):
+        self.writes.append((time.perf_counter(), value))
+
+    @property
+    def value(self):
+        return self.writes[-1][1] if self.writes else None
+
+
+def make_rov_state() -> ROVState:
+    thrusters = {
+        name: Thruster(FakePin(), reverse=name.endswith("vertical"))
+        for name in (
+            "front_left_horizontal",
+            "front_right_horizontal",
+            "back_left_horizontal",
+            "back_right_horizontal",
+            "front_left_vertical",
+            "front_right_vertical",
+            "back_left_vertical",
+            "back_right_vertical",
+        )
+    }
+    actuators = {"extend": LinActuator(FakePin(), FakePin())}
+    return ROVState(
+        actuators=actuators,
+        thrusters=thrusters,
+        sensors={},
+        status_flags={"agnes_mode": False, "agnes_factor": 0.3, "auto_depth": False},
+    )
+
+
+def test_emergency_stop_writes_neutral_and_latches():
+    async def scenario():
+        rov_state = make_rov_state()
+        extend = rov_state.actuators["extend"]
+        await extend.set_val(1)
+        for thruster in rov_state.thrusters.values():
+            await thruster.set_val(1)
+
+        rov_state.emergency_stop(True)
+        # written before emergency_stop returned, not on the next run() or control loop tick
+        for thruster in rov_state.thrusters.values():
+            assert thruster.pin.value == 1500
+        assert extend.pin.value == 0 and extend.pin2.value == 0
+
+        # a control loop iteration that was already running cannot move anything
+        for thruster in rov_state.thrusters.values():
+            await thruster.set_val(1)
+            assert thruster.angle == 1500
+        await extend.set_val(1)
+        assert extend.pos == 0
+
+        rov_state.emergency_stop(False)
+        assert not rov_state.estopped
+        assert rov_state._target_velocity == utils.VelocityVector()
+        thruster = rov_state.thrusters["back_left_horizontal"]
+        await thruster.set_val(1)
+        assert thruster.angle == 1800
+
+    asyncio.run(scenario())
+
+
+def test_emergency_stop_bypasses_dispatch_with_bounded_latency():
+    async def scenario():
+        rov_state = make_rov_state()
+        dispatcher = Dispatcher()  # never run: immediate handlers must not depend on it
+        dispatcher.register(codec.TARGET_VELOCITY, rov_state.set_target_velocity)
+        dispatcher.register(codec.ESTOP, rov_state.emergency_stop, immediate=True)
+        publisher = Publisher(max_freq=50)
+        done = asyncio.Event()
+
+        async def handle(reader, writer):
+            await Connection(reader, writer, dispatcher, publisher, WELCOME).serve()
+            done.set()
+
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        await asyncio.wait_for(codec.read_frame(reader), timeout=1)
+        # the stop is accepted even though the client did not declare it
+        writer.write(codec.encode(codec.HELLO, {"publishes": [codec.TARGET_VELOCITY]}))
+
+        for _ in range(20):
+            writer.write(codec.encode(codec.TARGET_VELOCITY, utils.VelocityVector()))
+            writer.write(codec.encode(codec.ESTOP, True))
+            await writer.drain()
+            thruster = rov_state.thrusters["front_left_vertical"]
+            writes = len(thruster.pin.writes)
+            while len(thruster.pin.writes) == writes:
+                await asyncio.sleep(0)
+            rov_state.emergency_stop(False)
+
+        stats = dispatcher.stats()
+        writer.close()
+        await writer.wait_closed()
+        await asyncio.wait_for(done.wait(), timeout=1)
+        server.close()
+        await server.wait_closed()
+        return rov_state, stats
+
+    rov_state, stats = asyncio.run(scenario())
+    assert stats[codec.ESTOP]["delivered"] == 20
+    assert stats[codec.TARGET_VELOCITY]["delivered"] == 0
+    # receipt to last pin write, measured per frame; generous bound for a loaded test machine
+    assert 0 < stats[codec.ESTOP]["max_latency_ms"] < 20
@@ -0,0 +1,38 @@
+import numpy as np
+
+from ..imu_buffer import IMUBuffer
+
+LEVEL = (0.0, 0.0, 0.0, 1.0)
+FIELD = (20.0, 0.0, -40.0)
+
+
+def test_velocity_is_integrated_over_the_real_time_between_samples():
+    buffer = IMUBuffer()
+    # 1 m/s^2 forward, sampled with jittery gaps, and one missed sample
+    times = [0.0, 0.01, 0.021, 0.029, 0.05, 0.06]
+    for t in times:
+        buffer.add(t, (0.0, 1.0, 0.0), FIELD, LEVEL)
+    message = buffer.take()
+    assert abs(message["velocity"]["y"] - 0.06) < 1e-12
+    buffer.add(1.0, (0.0, 1.0, 0.0), FIELD, LEVEL)  # after a reset, not integrated over
+    assert abs(buffer.velocity[1] - 0.06) < 1e-12
+
+
+def test_take_downsamples_the_samples_since_the_last_take():
+    buffer = IMUBuffer(size=16)
+    assert buffer.take() is None
+    for i in range(10):
+        quaternion = (0.0, 0.0, np.sin(i / 20), np.cos(i / 20))
+        buffer.add(i * 0.01, (float(i), 0.0, 0.0), FIELD, quaternion)
+    message = buffer.take()
+    assert message["acceleration"]["x"] == 4.5  # mean of the 10 samples
+    assert message["magnetometer"] == {"x": 20.0, "y": 0.0, "z": -40.0}
+    assert message["game_quaternion"]["k"] == np.sin(9 / 20)  # newest orientation
+    buffer.add(0.1, (10.0, 0.0, 0.0), FIELD, LEVEL)
+    assert buffer.take()["acceleration"]["x"] == 10.0
+
+    for i in range(20):  # more than the buffer holds between two takes
+        buffer.add(0.11 + i * 0.01, (0.0, 0.0, 0.0), FIELD, LEVEL)
+    assert len(buffer.pending()) == 16
+    stats = buffer.stats()
+    assert stats["overruns"] == 4 and abs(stats["sample_rate"] - 100) < 1e-6
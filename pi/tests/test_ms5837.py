@@ -0,0 +1,62 @@
+import types
+
+import numpy as np
+
+import ms5837
+
+# calibration and ADC values from the MS5837 datasheet example
+PROM = [0, 46372, 43981, 29059, 27842, 31553, 28165]
+D1 = 6465444
+D2 = 8077636
+
+
+class FakeBus:
+    """answers the sensor's commands with fixed ADC values and records the commands"""
+
+    def __init__(self, bus):
+        self.commands = []
+        self._adc = 0
+
+    def write_byte(self, addr, command):
+        self.commands.append(command)
+        self._adc = D1 if command & 0xF0 == 0x40 else D2
+
+    def read_word_data(self, addr, register):
+        c = PROM[(register - 0xA0) // 2]
+        return ((c & 0xFF) << 8) | (c >> 8)
+
+    def read_i2c_block_data(self, addr, register, length):
+        return [self._adc >> 16, (self._adc >> 8) & 0xFF, self._adc & 0xFF]
+
+
+def make_sensor(monkeypatch) -> ms5837.MS5837:
+    monkeypatch.setattr(ms5837, "smbus", types.SimpleNamespace(SMBus=FakeBus), raising=False)
+    monkeypatch.setattr(ms5837, "sleep", lambda s: None)
+    sensor = ms5837.MS5837_02BA()
+    sensor._crc4 = lambda prom: 0  # the example PROM has no CRC
+    assert sensor.init()
+    sensor._bus.commands.clear()
+    return sensor
+
+
+def test_compensate_matches_the_scalar_path_bit_for_bit(monkeypatch):
+    rng = np.random.default_rng(0)
+    # D2 from about -40 C to 85 C, to take every second order branch
+    d1 = rng.integers(4_000_000, 9_000_000, 2000)
+    d2 = rng.integers(6_000_000, 10_500_000, 2000)
+    for model in (ms5837.MODEL_02BA, ms5837.MODEL_30BA):
+        sensor = make_sensor(monkeypatch)
+        sensor._model = model
+        sensor.setFluidDensity(ms5837.DENSITY_SALTWATER)
+        expected = []
+        for sensor._D1, sensor._D2 in zip(d1.tolist(), d2.tolist()):
+            sensor._calculate()
+            expected.append((sensor.pressure(), sensor.temperature(), sensor.depth()))
+        pressure, temperature, depth = ms5837.compensate(
+            d1, d2, sensor.prom(), model, ms5837.DENSITY_SALTWATER
+        )
+        temperatures = np.array([t for _, t, _ in expected])
+        assert temperatures.min() < -15 and temperatures.max() > 20
+        assert pressure.tolist() == [p for p, _, _ in expected]
+        assert temperature.tolist() == temperatures.tolist()
+        assert depth.tolist() == [d for _, _, d in expected]
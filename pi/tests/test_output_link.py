@@ -0,0 +1,109 @@
+import numpy as np
+
+from ..actuator_driver import ActuatorDriver
+from ..hardware import Servo, Thruster
+from ..output_link import ACTUATOR, CAMERA, MESSAGE_BYTES, THRUSTER, OutputLink
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakePin:
+    """appends (name, value) to a log shared by all pins, like pyfirmata's Pin it does not
+    send a value it already has"""
+
+    def __init__(self, name, sent):
+        self.name = name
+        self.sent = sent
+        self.value = None
+
+    def write(self, value):
+        if value is not self.value:
+            self.value = value
+            self.sent.append((self.name, value))
+
+
+def test_unchanged_values_only_go_out_as_keepalives():
+    clock = FakeClock()
+    sent = []
+    link = OutputLink(keepalive=1.0, clock=clock)
+    pin = link.pin(FakePin("servo", sent))
+    for value in (90, 90, 90, 120):
+        pin.write(value)
+        link.flush()
+        clock.now += 0.1
+    assert sent == [("servo", 90), ("servo", 120)]
+    assert link.stats()["suppressed"] == 2
+
+    clock.now += 1.0
+    link.flush()
+    assert sent[-1] == ("servo", 120)
+    assert link.keepalives == 1 and link.writes == 2
+
+
+def test_writes_go_out_by_priority():
+    sent = []
+    link = OutputLink(clock=FakeClock())
+    camera = link.pin(FakePin("camera", sent), CAMERA)
+    claw = link.pin(FakePin("claw", sent), ACTUATOR)
+    thruster = link.pin(FakePin("thruster", sent), THRUSTER)
+    for pin in (camera, claw, thruster):
+        pin.write(1500)
+    link.flush()
+    assert [name for name, _ in sent] == ["thruster", "claw", "camera"]
+
+
+def test_budget_defers_low_priority_writes():
+    clock = FakeClock()
+    sent = []
+    # room for two messages per flush
+    link = OutputLink(budget=2 * MESSAGE_BYTES / 0.1, burst=0.1, clock=clock)
+    pins = [link.pin(FakePin(i, sent), priority=i) for i in range(3)]
+    for pin in pins:
+        pin.write(1)
+    link.flush()
+    assert sent == [(0, 1), (1, 1)] and link.deferred == 1
+
+    clock.now += 0.1
+    link.flush()
+    assert sent[-1] == (2, 1)
+
+    # an emergency stop goes out whatever the budget
+    for pin in pins:
+        pin.write(0)
+    link.flush(urgent=True)
+    assert sent[-3:] == [(0, 0), (1, 0), (2, 0)]
+
+
+def test_rate_is_measured_against_the_budget():
+    clock = FakeClock()
+    link = OutputLink(keepalive=0.0, budget=100, burst=1.0, clock=clock)
+    pin = link.pin(FakePin("thruster", []))
+    pin.write(1500)
+    for i in range(11):
+        clock.now = i / 10
+        link.flush()
+    stats = link.stats()
+    assert stats["bytes_per_s"] == 11 * MESSAGE_BYTES
+    assert stats["utilization"] == 11 * MESSAGE_BYTES / 100
+
+
+def test_driver_flushes_the_link():
+    sent = []
+    link = OutputLink(clock=FakeClock())
+    thruster = Thruster(link.pin(FakePin("thruster", sent), THRUSTER))
+    camera = Servo(link.pin(FakePin("camera", sent), CAMERA))
+    driver = ActuatorDriver({"thruster": thruster, "camera": camera}, ("thruster",), link)
+    for _ in range(5):
+        driver.set_thrust(np.array([1.0]))
+        driver.tick()
+    assert sent == [("thruster", 1800), ("camera", 90)]
+
+    thruster.stop()
+    driver.sync()
+    assert sent[-1] == ("thruster", 1500)
@@ -0,0 +1,104 @@
+import time
+
+from common import codec
+
+from ..publisher import Publisher
+
+
+class FakeConnection:
+    """Collects the frames sent to it."""
+
+    def __init__(self, accept=True):
+        self.frames = []
+        self.accept = accept
+
+    def send(self, frame):
+        if self.accept:
+            self.frames.append(frame)
+        return self.accept
+
+
+DEPTH = {"depth": 1.25, "rate": 0.0}
+
+
+def _publisher():
+    publisher = Publisher(max_freq=50)
+    publisher.add_topic(codec.DEPTH, lambda: DEPTH)
+    publisher.add_topic(codec.STATUS_FLAGS, lambda: {
+        "agnes_mode": False, "agnes_factor": 0.3, "auto_depth": False})
+    return publisher
+
+
+def test_topic_is_encoded_once_for_all_subscribers():
+    publisher = _publisher()
+    connections = [FakeConnection() for _ in range(3)]
+    for connection in connections:
+        publisher.subscribe(connection, codec.DEPTH, 10)
+
+    publisher.publish_due(now=1e9)
+
+    assert publisher.encodes == 1
+    frame = codec.encode(codec.DEPTH, DEPTH)
+    assert all(connection.frames == [frame] for connection in connections)
+
+
+def test_only_subscribed_topics_are_sent():
+    publisher = _publisher()
+    depth_only = FakeConnection()
+    publisher.subscribe(depth_only, codec.DEPTH, 10)
+    publisher.subscribe(FakeConnection(), codec.STATUS_FLAGS, 10)
+
+    publisher.publish_due(now=1e9)
+
+    assert depth_only.frames == [codec.encode(codec.DEPTH, DEPTH)]
+
+
+def test_rates_are_independent():
+    publisher = _publisher()
+    fast, slow = FakeConnection(), FakeConnection()
+    publisher.subscribe(fast, codec.DEPTH, 10)
+    publisher.subscribe(slow, codec.DEPTH, 2)
+
+    start = time.monotonic()
+    for i in range(10):
+        publisher.publish_due(now=start + i * 0.1)
+
+    assert len(fast.frames) == 10
+    assert len(slow.frames) == 2
+
+
+def test_unknown_topic_and_backed_up_subscriber():
+    publisher = _publisher()
+    assert not publisher.subscribe(FakeConnection(), codec.TARGET_VELOCITY, 10)
+
+    publisher.subscribe(FakeConnection(accept=False), codec.DEPTH, 10)
+    publisher.publish_due(now=1e9)
+    assert publisher.stats()["depth@10"]["skipped"] == 1
+
+
+def test_unsubscribe_removes_empty_feeds():
+    publisher = _publisher()
+    connection = FakeConnection()
+    publisher.subscribe(connection, codec.DEPTH, 10)
+    publisher.unsubscribe(connection)
+    assert publisher.stats() == {}
+
+
+def test_delta_feed_sends_keyframe_then_only_changes():
+    depth = {"depth": 1.0, "rate": 0.0}
+    publisher = Publisher(max_freq=50, keyframe_period=10.0)
+    publisher.add_topic(codec.DEPTH, lambda: depth, thresholds=0.01)
+    connection = FakeConnection()
+    publisher.subscribe(connection, codec.DEPTH, 10, delta=True)
+
+    start = time.monotonic()
+    publisher.publish_due(now=start)
+    publisher.publish_due(now=start + 0.1)  # unchanged, nothing sent
+    depth["depth"] = 2.0
+    publisher.publish_due(now=start + 0.2)
+
+    assert connection.frames == [
+        codec.encode(codec.DEPTH, {"depth": 1.0, "rate": 0.0}),
+        codec.encode(codec.DELTA, (codec.DEPTH, {0: 2.0})),
+    ]
+    assert publisher.stats()["depth@10/delta"]["unchanged"] == 1
@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+from common import codec
+
+from .. import sensor_poller
+from ..hardware import Sensor
+from ..sensor_poller import SensorPoller
+
+
+class FakeSensor(Sensor):
+    """reads a counter, blocking for delay (s); every fail_every-th read raises"""
+
+    def __init__(self, topic, freq, delay=0.0, fail_every=0, init_failures=0):
+        self.topic = topic
+        self.freq = freq
+        self.delay = delay
+        self.fail_every = fail_every
+        self.init_failures = init_failures
+        self.count = 0
+
+    def init(self):
+        if self.init_failures:
+            self.init_failures -= 1
+            raise OSError("no device")
+        return True
+
+    def read(self):
+        time.sleep(self.delay)  # a blocking I2C transfer
+        self.count += 1
+        if self.fail_every and self.count % self.fail_every == 0:
+            raise OSError("remote I/O error")
+        return self.count
+
+
+def test_sensors_are_polled_at_their_own_rates(monkeypatch):
+    monkeypatch.setattr(sensor_poller, "INIT_RETRY", 0.01)
+    readings = {codec.IMU_DATA: [], codec.DEPTH: []}
+    sensors = {
+        "imu": FakeSensor(codec.IMU_DATA, freq=50, fail_every=5, init_failures=2),
+        # slower than its period would allow on the event loop
+        "depth": FakeSensor(codec.DEPTH, freq=10, delay=0.05),
+    }
+    poller = SensorPoller(sensors, {topic: readings[topic].append for topic in readings})
+
+    async def scenario():
+        tasks = [asyncio.create_task(task) for task in poller.get_tasks()]
+        await asyncio.sleep(0.5)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run(scenario())
+    poller.close()
+    stats = poller.stats()
+    # the depth sensor's 50 ms reads block a pool thread, not the loop the imu is polled on
+    assert stats["imu"]["ready"] and 15 <= sensors["imu"].count <= 26
+    assert stats["imu"]["errors"] == sensors["imu"].count // 5
+    assert len(readings[codec.IMU_DATA]) == stats["imu"]["reads"]
+    assert 3 <= stats["depth"]["reads"] <= 6 and stats["depth"]["errors"] == 0
+    assert readings[codec.DEPTH] == list(range(1, stats["depth"]["reads"] + 1))
+    assert stats["depth"]["latency_ms"]["p50"] >= 50
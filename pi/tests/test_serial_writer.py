@@ -0,0 +1,131 @@
+import threading
+
+from ..output_link import URGENT_TIMEOUT, OutputLink
+from ..serial_writer import BatchedSerial, SerialWriter
+
+
+class FakePort:
+    """serial port that records each write call, and can be held to block them"""
+
+    def __init__(self):
+        self.writes = []
+        self.released = threading.Event()
+        self.released.set()
+        self.entered = threading.Event()
+
+    def write(self, data):
+        self.entered.set()
+        self.released.wait()
+        self.writes.append(bytes(data))
+        return len(data)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeBoard:
+    def __init__(self):
+        self.sp = FakePort()
+
+
+class FakePin:
+    """writes a 3 byte message to its board's port, like pyfirmata's servo pins"""
+
+    def __init__(self, board, number):
+        self.board = board
+        self.number = number
+        self.value = None
+
+    def write(self, value):
+        if value is not self.value:
+            self.value = value
+            self.board.sp.write(bytearray([0xE0 + self.number, value % 128, value >> 7]))
+
+
+def test_pending_values_go_out_in_one_serial_write():
+    board = FakeBoard()
+    port = board.sp
+    writer = SerialWriter(board)
+    pins = [FakePin(board, i) for i in range(3)]
+    for pin in pins:
+        writer.submit(pin, 1500)
+    writer.submit(pins[0], 1600)  # replaces the 1500 still waiting
+    assert writer.depth == 3
+
+    writer.start()
+    assert writer.wait(timeout=1)
+    writer.stop()
+    assert port.writes == [bytes([0xE0, 1600 % 128, 1600 >> 7, 0xE1, 1500 % 128, 1500 >> 7,
+                                  0xE2, 1500 % 128, 1500 >> 7])]
+    stats = writer.stats()
+    assert stats["replaced"] == 1 and stats["written"] == 3 and stats["batches"] == 1
+    assert stats["max_depth"] == 3 and stats["bytes_written"] == 9
+    assert stats["latency_ms"]["count"] == 3
+
+
+def test_only_the_collecting_thread_is_batched():
+    port = FakePort()
+    serial = BatchedSerial(port)
+    serial.collect()
+    serial.write(b"\x01")
+    # a step pulse from another thread goes straight out, not into the batch
+    other = threading.Thread(target=serial.write, args=(b"\x02",))
+    other.start()
+    other.join()
+    assert port.writes == [b"\x02"]
+    assert serial.flush() == 1
+    assert port.writes == [b"\x02", b"\x01"]
+
+
+def test_submit_does_not_wait_for_a_slow_port():
+    board = FakeBoard()
+    port = board.sp
+    writer = SerialWriter(board)
+    pin = FakePin(board, 0)
+    writer.start()
+    port.released.clear()
+    writer.submit(pin, 1500)
+    assert port.entered.wait(timeout=1)  # the writer thread is stuck in the port write
+    for value in (1510, 1520, 1530):
+        writer.submit(pin, value)  # returns at once, only the newest value is kept
+    assert writer.depth == 1
+    port.released.set()
+    assert writer.wait(timeout=1)
+    writer.stop()
+    assert [message[1] + (message[2] << 7) for message in port.writes] == [1500, 1530]
+    assert writer.replaced == 2
+
+
+def test_urgent_flush_does_not_wait_for_the_writer(caplog):
+    board = FakeBoard()
+    port = board.sp
+    writer = SerialWriter(board)
+    writer.start()
+    clock = FakeClock()
+    link = OutputLink(writer=writer, clock=clock)
+    pin = link.pin(FakePin(board, 0))
+    pin.write(1500)
+    link.flush()
+    assert writer.wait(timeout=1)
+
+    port.released.clear()  # the port hangs
+    port.entered.clear()
+    pin.write(1600)
+    link.flush(urgent=True)  # returns at once all the same
+    assert port.entered.wait(timeout=1)
+    clock.now += 0.01
+    link.flush()
+    assert "did not write" not in caplog.text
+    clock.now += URGENT_TIMEOUT
+    link.flush()  # the next tick past the timeout reports the late write
+    assert "did not write the urgent values" in caplog.text
+
+    port.released.set()
+    assert writer.wait(timeout=1)
+    writer.stop()
+    assert port.writes[-1] == bytes([0xE0, 1600 % 128, 1600 >> 7])
@@ -0,0 +1,142 @@
+import multiprocessing
+import uuid
+
+from common import codec
+
+from ..allocation import DEFAULT_MIX
+from ..hardware import Thruster
+from ..rov_state import ROVState
+from ..shared_sample import MAX_RETRIES, SEQ, SharedSample
+
+
+class FakePin:
+    def write(self, value):
+        pass
+
+
+def unique_name() -> str:
+    return f"test_{uuid.uuid4().hex[:12]}"
+
+
+def test_reader_sees_the_newest_sample_once():
+    name = unique_name()
+    reader = SharedSample(codec.DEPTH, name)
+    assert not reader.open()  # no writer yet
+    writer = SharedSample(codec.DEPTH, name, create=True, clock=lambda: 12.5)
+    try:
+        assert reader.open()
+        assert reader.read_new() is None  # nothing written yet
+        writer.write({"depth": 1.0, "rate": 0.5})
+        writer.write({"depth": 2.0, "rate": 0.25})
+        assert reader.read_new() == (12.5, {"depth": 2.0, "rate": 0.25})
+        assert reader.read_new() is None
+    finally:
+        reader.close()
+        writer.close(unlink=True)
+
+
+def test_reader_rejects_a_sample_being_written():
+    name = unique_name()
+    writer = SharedSample(codec.DEPTH, name, create=True, clock=lambda: 1.0)
+    reader = SharedSample(codec.DEPTH, name)
+    try:
+        assert reader.open()
+        writer.write({"depth": 1.0, "rate": 0.0})
+        buf = writer.shm.buf
+        seq = writer._seq
+
+        # a writer stopped after the odd seq and the new body, before the CRC
+        SEQ.pack_into(buf, 0, seq + 1)
+        buf[SEQ.size:SEQ.size + writer.body.size] = writer.body.pack(2.0, 2.0, 0.0)
+        assert reader.read() is None
+        assert reader.retries == MAX_RETRIES
+
+        # the even seq seen before the body and CRC, as a weakly ordered CPU may show it
+        SEQ.pack_into(buf, 0, seq + 2)
+        assert reader.read() is None
+        assert reader.retries == 2 * MAX_RETRIES
+
+        writer.write({"depth": 3.0, "rate": 0.5})
+        assert reader.read() == (seq + 2, 1.0, {"depth": 3.0, "rate": 0.5})
+    finally:
+        reader.close()
+        writer.close(unlink=True)
+
+
+def test_reader_skips_the_record_a_restarted_writer_cleared():
+    name = unique_name()
+    writer = SharedSample(codec.DEPTH, name, create=True, clock=lambda: 1.0)
+    reader = SharedSample(codec.DEPTH, name)
+    try:
+        assert reader.open()
+        writer.write({"depth": 1.0, "rate": 0.0})
+        writer.write({"depth": 1.5, "rate": 0.0})
+        assert reader.read_new() == (1.0, {"depth": 1.5, "rate": 0.0})
+        writer.shm.close()  # the sensor process dies without unlinking its record
+
+        writer = SharedSample(codec.DEPTH, name, create=True, clock=lambda: 2.0)
+        assert reader.read() is None and reader.read_new() is None
+        # as many samples as the previous writer, each still new to the reader
+        writer.write({"depth": 2.0, "rate": 0.0})
+        assert reader.read_new() == (2.0, {"depth": 2.0, "rate": 0.0})
+        writer.write({"depth": 2.5, "rate": 0.0})
+        assert reader.read_new() == (2.0, {"depth": 2.5, "rate": 0.0})
+    finally:
+        reader.close()
+        writer.close(unlink=True)
+
+
+def write_samples(name: str, count: int):
+    writer = SharedSample(codec.DEPTH, name)
+    writer.open()
+    for i in range(count):
+        # every sample has rate == -depth, so a torn read would show
+        writer.write({"depth": float(i), "rate": -float(i)})
+    writer.close()
+
+
+def test_reads_are_never_torn_by_a_concurrent_writer():
+    name = unique_name()
+    owner = SharedSample(codec.DEPTH, name, create=True)
+    reader = SharedSample(codec.DEPTH, name)
+    assert reader.open()
+    process = multiprocessing.get_context("fork").Process(
+        target=write_samples, args=(name, 200_000)
+    )
+    process.start()
+    try:
+        last = -1.0
+        while process.is_alive():
+            sample = reader.read()
+            if sample is None:
+                continue
+            depth = sample[2]["depth"]
+            assert sample[2]["rate"] == -depth
+            assert depth >= last  # never goes back to an older sample
+            last = depth
+        process.join()
+        assert reader.read()[2] == {"depth": 199_999.0, "rate": -199_999.0}
+    finally:
+        reader.close()
+        owner.close(unlink=True)
+
+
+def test_rov_state_reads_shared_samples_each_tick():
+    name = unique_name()
+    writer = SharedSample(codec.DEPTH, name, create=True)
+    try:
+        rov_state = ROVState(
+            actuators={},
+            thrusters={name: Thruster(FakePin()) for name in DEFAULT_MIX},
+            sensors={},
+            status_flags={"agnes_mode": False, "agnes_factor": 0.3, "auto_depth": False},
+            shared=[SharedSample(codec.DEPTH, name)],
+        )
+        writer.write({"depth": 3.0, "rate": 0.125})
+        rov_state._read_shared()
+        assert rov_state._current_depth == 3.0
+        assert rov_state._current_depth_data == {"depth": 3.0, "rate": 0.125}
+        assert rov_state.shared_age[codec.DEPTH].count == 1
+        rov_state.shared[0].close()
+    finally:
+        writer.close(unlink=True)
@@ -0,0 +1,104 @@
+import time
+
+import numpy as np
+
+from common.utils import VelocityVector
+
+from ..allocation import ThrusterAllocator
+from ..hardware import LinActuator, Servo, Thruster
+from ..rov_state import ROVState
+from ..sim_hardware import SIM_GEOMETRY, ROVSim, SimPin
+from ..thrust_curve import ThrustCurve
+
+CURVE = ThrustCurve([1100, 1460, 1540, 1900], [-4.0, 0.0, 0.0, 5.0])
+
+
+def make_sim(**kwargs) -> tuple[ROVSim, dict[str, Thruster], ThrusterAllocator]:
+    thrusters = {name: Thruster(SimPin(), curve=CURVE) for name in SIM_GEOMETRY}
+    allocator = ThrusterAllocator.from_geometry(SIM_GEOMETRY)
+    return ROVSim(thrusters, CURVE, **kwargs), thrusters, allocator
+
+
+def command(thrusters, allocator, velocity):
+    for name, value in allocator.to_dict(allocator.allocate(np.array(velocity))).items():
+        thrusters[name].write(thrusters[name].command(value))
+
+
+def test_positive_buoyancy_rises_without_thrust():
+    sim, _, _ = make_sim(depth=2.0)
+    log = sim.simulate(3.0)
+    assert sim.depth() < 2.0
+    assert np.all(np.diff(log["depth"]) <= 1e-12)
+
+
+def test_commands_move_along_the_body_axes():
+    sim, thrusters, allocator = make_sim()
+    command(thrusters, allocator, [0, 0.5, 0, 0, 0, 0])  # forward
+    sim.simulate(2.0)
+    assert sim.position[1] > 0.5 and abs(sim.position[0]) < 0.05
+
+    sim, thrusters, allocator = make_sim()
+    command(thrusters, allocator, [0, 0, -0.5, 0, 0, 0])  # down, against the buoyancy
+    sim.simulate(2.0)
+    assert sim.depth() > 1.2
+
+
+def test_yaw_turns_and_keeps_a_unit_quaternion():
+    sim, thrusters, allocator = make_sim()
+    command(thrusters, allocator, [0, 0, 0, 0.5, 0, 0])
+    log = sim.simulate(2.0)
+    assert abs(sim.angular_velocity[2]) > 0.1
+    assert np.linalg.norm(sim.position[:2]) < 0.05
+    np.testing.assert_allclose(np.linalg.norm(log["orientation"], axis=1), 1.0, atol=1e-9)
+
+
+def test_runs_faster_than_real_time():
+    sim, _, _ = make_sim()
+    start = time.perf_counter()
+    sim.simulate(10.0)
+    assert time.perf_counter() - start < 10.0 / 5
+    assert abs(sim.clock() - 10.0) < 1e-9
+
+
+def test_readings_use_the_sensor_formats():
+    sim, _, _ = make_sim(depth=1.5, depth_noise=0.01, seed=1)
+    data = sim.imu_data()
+    assert set(data) == {"acceleration", "velocity", "magnetometer", "game_quaternion"}
+    assert data["game_quaternion"] == {"i": 0.0, "j": 0.0, "k": 0.0, "real": 1.0}
+    assert abs(sim.depth() - 1.5) < 0.05
+
+
+def make_rov_state(sim: ROVSim, thrusters: dict[str, Thruster]) -> ROVState:
+    return ROVState(
+        actuators={
+            "rotate": Servo(SimPin()),
+            "close_main": Servo(SimPin()),
+            "close_side": Servo(SimPin()),
+            "camera_servo": Servo(SimPin()),
+            "extend": LinActuator(SimPin(), SimPin()),
+            "sample": LinActuator(SimPin(), SimPin()),
+        },
+        thrusters=thrusters,
+        sensors={},
+        status_flags={"agnes_mode": False, "agnes_factor": 0.3, "auto_depth": True},
+        allocator=ThrusterAllocator.from_geometry(SIM_GEOMETRY),
+        clock=sim.clock,
+    )
+
+
+def test_rov_state_holds_depth_on_virtual_time():
+    for start in (1.5, 3.5):
+        sim, thrusters, _ = make_sim(depth=start, depth_noise=0.002, seed=2)
+        rov_state = make_rov_state(sim, thrusters)
+        rov_state._target_depth = 2.5
+        tick = sim.drive(rov_state)
+
+        def controller(period):
+            rov_state.set_target_velocity(VelocityVector())  # the pilot's sticks at rest
+            tick(period)
+
+        log = sim.simulate(60.0, controller)
+        settled = log["depth"][log["time"] > 30.0]
+        # the cubic law leaves a steady offset against the buoyancy, above the target
+        assert np.ptp(settled) < 0.05
+        assert abs(settled.mean() - 2.5) < 0.3
@@ -0,0 +1,114 @@
+import threading
+import time
+
+import numpy as np
+
+from ..output_link import LINK_BUDGET, STEPPER_SHARE, OutputLink
+from ..step_generator import MAX_RATE, STEP_BYTES, StepGenerator, ramp, trapezoid
+
+
+class FakePin:
+    """records the time of every rising edge and every value written"""
+
+    def __init__(self):
+        self.values = []
+        self.rises = []
+        self.lock = threading.Lock()
+
+    def write(self, value):
+        with self.lock:
+            if value:
+                self.rises.append(time.perf_counter())
+            self.values.append(value)
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_trapezoid_respects_the_limits():
+    times = trapezoid(400, max_rate=1000, accel=10000)
+    intervals = np.diff(times, prepend=0.0)  # from the start of the move
+    assert np.all(intervals > 0)
+    assert intervals.min() >= 1 / 1000 - 1e-9
+    # starts and ends at rest, symmetrically: 0.1 s of ramp each way, 0.3 s at the top rate
+    np.testing.assert_allclose(times[-1], 0.5)
+    np.testing.assert_allclose(intervals, intervals[::-1], atol=1e-6)
+    short = trapezoid(10, max_rate=1000, accel=10000)  # too short to reach max_rate
+    assert np.diff(short).min() > 1 / 1000
+
+
+def test_ramp_reaches_the_rate():
+    times, rates = ramp(0.0, 1000.0, 10000.0)
+    assert len(times) == 50 and abs(rates[-1] - 1000) < 1e-9
+    np.testing.assert_allclose(times[-1], 0.1)
+    times, rates = ramp(1000.0, 0.0, 10000.0)
+    assert len(times) == 50 and rates[-1] < 1e-6
+    np.testing.assert_allclose(times[-1], 0.1)
+
+
+def test_pulses_follow_the_schedule():
+    step_pin, direction_pin = FakePin(), FakePin()
+    generator = StepGenerator(step_pin, direction_pin, accel=20000, max_rate=2000)
+    generator.start()
+    generator.move(-200)
+    wait_for(lambda: generator.position == -200)
+    generator.stop()
+
+    assert direction_pin.values == [0]
+    assert step_pin.values == [1, 0] * 200
+    expected = np.diff(trapezoid(200, 2000, 20000))
+    error_ms = np.abs(np.diff(step_pin.rises) - expected) * 1000
+    # the thread sleeps until each step, so a typical step is within the OS timer's slack;
+    # only the median is checked, as preemption on a loaded test machine is not
+    assert np.median(error_ms) < 0.5
+    stats = generator.stats()
+    assert stats["error_ms"]["count"] == 200 and stats["error_ms"]["p50"] <= 0.5
+
+
+def test_waiting_for_a_step_does_not_hold_the_cpu():
+    generator = StepGenerator(FakePin(), FakePin(), accel=100_000, max_rate=2000)
+    generator.start()
+    generator.set_rate(2000)
+    wait_for(lambda: generator.rate == 2000)
+    wall, cpu = time.perf_counter(), time.process_time()
+    time.sleep(0.3)
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    generator.stop()
+    # spinning between steps would take most of a core
+    assert cpu < 0.5 * wall
+
+
+def test_step_rate_is_reserved_from_the_link():
+    link = OutputLink()
+    generator = StepGenerator(FakePin(), FakePin(), max_rate=2000, link=link)
+    assert generator.max_rate == MAX_RATE == LINK_BUDGET * STEPPER_SHARE / STEP_BYTES
+    assert link.reserved == MAX_RATE * STEP_BYTES
+    generator.set_rate(5000)
+    assert generator._target_rate == MAX_RATE
+
+    # the share is used up: a second stepper gets nothing and ignores its commands
+    second = StepGenerator(FakePin(), FakePin(), link=link)
+    assert second.max_rate == 0 and link.reserved == MAX_RATE * STEP_BYTES
+    second.set_rate(100)
+    second.move(100)
+    assert second.idle
+
+
+def test_rate_changes_ramp_and_halt_stops_at_once():
+    step_pin, direction_pin = FakePin(), FakePin()
+    generator = StepGenerator(step_pin, direction_pin, accel=20000, max_rate=2000)
+    generator.start()
+    generator.set_rate(1000)
+    wait_for(lambda: generator.rate == 1000)
+    generator.set_rate(-1000)  # ramps down to 0 first, then up the other way
+    wait_for(lambda: generator.rate == -1000)
+    assert direction_pin.values == [1, 0]
+    generator.halt()
+    steps = generator.steps
+    time.sleep(0.02)
+    assert generator.steps == steps and generator.rate == 0
+    generator.stop()
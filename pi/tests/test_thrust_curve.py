@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from common import utils
+
+from ..async_server import THRUST_CURVE
+from ..hardware import Thruster, ThrusterTable
+from ..thrust_curve import ThrustCurve
+
+PWM = np.array([1100, 1300, 1460, 1500, 1540, 1700, 1900])
+THRUST = np.array([-4.0, -2.0, 0.0, 0.0, 0.0, 2.0, 5.0])
+
+
+class FakePin:
+    def write(self, value):
+        pass
+
+
+def test_lut_gives_equal_thrust_both_ways():
+    curve = ThrustCurve(PWM, THRUST)
+    lut = curve.lut((1100, 1900), size=21)
+    thrust = np.interp(lut, curve.pwm, curve.thrust)
+    # the weaker direction (reverse, 4) sets full scale, forward is scaled down to match
+    np.testing.assert_allclose(thrust, np.linspace(-4, 4, 21), atol=1e-9)
+
+
+def test_lut_jumps_the_deadband():
+    curve = ThrustCurve(PWM, THRUST)
+    lut = curve.lut((1100, 1900), size=2001)
+    assert curve.deadband == (1460, 1540)
+    assert lut[1000] == 1500
+    assert 1540 < lut[1001] < 1541
+    assert 1459 < lut[999] < 1460
+
+
+def test_thruster_pulse_widths_leave_the_deadband():
+    curve = ThrustCurve.from_csv(THRUST_CURVE)
+    for active_range in ((1250, 1750), (1200, 1800)):
+        thruster = Thruster(FakePin(), active_range=active_range, curve=curve)
+        table = ThrusterTable([thruster])
+        commands = np.linspace(-1, 1, 2001)
+        pwm = np.array(thruster.lut)
+        assert pwm.dtype.kind == "i"
+        assert table.map(commands[:, None]).ravel().tolist() == pwm.tolist()
+        low, high = curve.deadband
+        assert pwm[1000] == 1500
+        # whole microseconds, but still outside the deadband for the smallest commands
+        assert np.all(pwm[1001:] > high) and np.all(pwm[:1000] < low)
+        thrust = curve.thrust_at(pwm)
+        assert np.all(thrust[1001:] > 0) and np.all(thrust[:1000] < 0)
+
+
+def test_curve_validation():
+    with pytest.raises(ValueError):
+        ThrustCurve(PWM, THRUST[::-1])
+    with pytest.raises(ValueError):
+        ThrustCurve(PWM, np.abs(THRUST))
+
+
+def test_linear_thruster_matches_linear_map():
+    for reverse in (False, True):
+        thruster = Thruster(FakePin(), active_range=(1250, 1750), reverse=reverse)
+        low, high = (1750, 1250) if reverse else (1250, 1750)
+        for x in np.linspace(-1, 1, 201):
+            assert abs(thruster.linear_map(x) - utils.linear_map(x, -1, 1, low, high)) <= 1
+        assert thruster.linear_map(0) == 1500
+        assert thruster.linear_map(1) == high
+        assert thruster.linear_map(5) == thruster.linear_map(1)
+
+
+def test_table_matches_each_thruster():
+    curve = ThrustCurve.from_csv(THRUST_CURVE)
+    thrusters = [
+        Thruster(FakePin(), active_range=(1250, 1750), reverse=True, curve=curve),
+        Thruster(FakePin(), active_range=(1250, 1750), curve=curve),
+        Thruster(FakePin(), reverse=True),
+        Thruster(FakePin()),
+    ]
+    table = ThrusterTable(thrusters)
+    rng = np.random.default_rng(0)
+    for commands in rng.uniform(-1.2, 1.2, (100, len(thrusters))):
+        expected = [thruster.linear_map(x) for thruster, x in zip(thrusters, commands)]
+        assert table.map(commands).tolist() == expected
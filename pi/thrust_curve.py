@@ -0,0 +1,78 @@
+import numpy as np
+
+LUT_SIZE = 2001  # entries over commands [-1, 1], a step of 0.001
+
+
+class ThrustCurve:
+    """Measured thrust of a thruster against the PWM pulse width driving it.
+
+    Turned into a lookup table from command ([-1, 1], a fraction of the thrust available in
+    both directions) to pulse width, so that equal commands give equal thrust forwards and in
+    reverse, and the smallest non-zero command already jumps out of the deadband.
+    """
+
+    def __init__(self, pwm: np.ndarray, thrust: np.ndarray):
+        """
+        Args:
+            pwm (np.ndarray): pulse widths (us) of the samples
+            thrust (np.ndarray): thrust at each pulse width, negative in reverse, any unit.
+                Must not decrease with pwm and must be 0 over the deadband.
+        """
+        order = np.argsort(pwm)
+        self.pwm = np.asarray(pwm, dtype=float)[order]
+        self.thrust = np.asarray(thrust, dtype=float)[order]
+        if np.any(np.diff(self.thrust) < 0):
+            raise ValueError("thrust must not decrease with pwm")
+        if not (self.thrust[0] < 0 < self.thrust[-1]) or not np.any(self.thrust == 0):
+            raise ValueError("thrust curve must cover reverse, the deadband and forward")
+        deadband = self.pwm[self.thrust == 0]
+        self.deadband = (deadband[0], deadband[-1])
+        self.neutral = (deadband[0] + deadband[-1]) / 2
+
+    @classmethod
+    def from_csv(cls, path: str) -> "ThrustCurve":
+        """Load a csv of pwm_us,thrust rows after a header line. Lines starting with # are
+        comments."""
+        with open(path, encoding="utf-8") as f:
+            rows = [line for line in f if line.strip() and not line.startswith("#")]
+        samples = np.loadtxt(rows[1:], delimiter=",", ndmin=2)
+        return cls(samples[:, 0], samples[:, 1])
+
+    def thrust_at(self, pwm: np.ndarray) -> np.ndarray:
+        """Thrust at pulse widths (us), interpolated between the samples."""
+        return np.interp(pwm, self.pwm, self.thrust)
+
+    def lut(self, active_range: tuple, size: int = LUT_SIZE) -> np.ndarray:
+        """Pulse width for each of size commands evenly spaced over [-1, 1].
+        Args:
+            active_range (tuple): lowest and highest pulse width the thruster may be driven at
+            size (int): number of entries, odd so that command 0 has its own entry
+        Returns:
+            np.ndarray: pulse widths (us), command -1 first
+        """
+        low, high = active_range
+        # thrust available in both directions within the active range
+        max_thrust = min(-np.interp(low, self.pwm, self.thrust),
+                         np.interp(high, self.pwm, self.thrust))
+        if max_thrust <= 0:
+            raise ValueError(f"no thrust in both directions within {active_range}")
+        forward = self.thrust > 0
+        reverse = self.thrust < 0
+        # inverse of each branch, starting at the deadband edge so any thrust leaves it
+        forward_thrust = np.concatenate(([0.0], self.thrust[forward]))
+        forward_pwm = np.concatenate(([self.deadband[1]], self.pwm[forward]))
+        reverse_thrust = np.concatenate(([0.0], -self.thrust[reverse][::-1]))
+        reverse_pwm = np.concatenate(([self.deadband[0]], self.pwm[reverse][::-1]))
+
+        commands = np.linspace(-1, 1, size)
+        wanted = np.abs(commands) * max_thrust
+        return np.where(
+            commands > 0,
+            np.interp(wanted, forward_thrust, forward_pwm),
+            np.where(commands < 0, np.interp(wanted, reverse_thrust, reverse_pwm), self.neutral),
+        )
+
+
+def linear_lut(active_range: tuple, size: int = LUT_SIZE) -> np.ndarray:
+    """Lookup table of an uncalibrated thruster: pulse width linear in the command."""
+    return np.linspace(active_range[0], active_range[1], size)
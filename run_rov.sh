@@ -10,13 +10,8 @@ killall() {
 }
 
 rm -f async_server_log.txt
-rm -f imu_log.txt
-rm -f depth_sensor_log.txt
 
-# run the async server and all clients
+# run the async server, which reads the IMU and depth sensor itself
+# (pi.imu and pi.depth-sensor still work as separate clients, for testing a sensor alone)
 python -u -m pi.async_server > async_server_log.txt &
-sleep 6
-python -u -m pi.imu > imu_log.txt &
-sleep 1
-python -u -m pi.depth-sensor > depth_sensor_log.txt &
-multitail async_server_log.txt imu_log.txt depth_sensor_log.txt # wait forever
+multitail async_server_log.txt # wait forever
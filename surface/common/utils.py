@@ -1,6 +1,9 @@
-from dataclasses import asdict, dataclass
+from array import array
+from operator import itemgetter
 from time import time_ns
 
+import numpy as np
+
 
 def time_ms():
     """Returns the current time in milliseconds."""
@@ -23,38 +26,104 @@ def linear_map(
     return (x - in_min) * (out_max - out_min) / (in_max - in_min) + out_min
 
 
-@dataclass
+_ZEROS = [0.0] * 6
+_get_fields = itemgetter("x", "y", "z", "yaw", "pitch", "roll")
+
+
+def _axis_property(index: int) -> property:
+    def get(self) -> float:
+        return self._values[index]
+
+    def set(self, value: float):
+        self._values[index] = value
+
+    return property(get, set)
+
+
 class VelocityVector:
     """Represents a velocity vector in 3D space. Standard 3D right handed coordinate system.
     The vehicle is parallel to the xy plane, pointed to +y.
     yaw is about the z axis, pitch is about the x axis, roll is about the y axis.
+
+    The six components live in one array of doubles, so they can be read and written by
+    name or index in O(1), viewed as a NumPy array without copying, and packed straight
+    into a frame.
     """
 
-    x: float = 0.0
-    y: float = 0.0
-    z: float = 0.0
-    yaw: float = 0.0
-    pitch: float = 0.0
-    roll: float = 0.0
+    __slots__ = ("_values",)
+
+    FIELDS = ("x", "y", "z", "yaw", "pitch", "roll")
+    _INDEX = {**{name: i for i, name in enumerate(FIELDS)}, **{i: i for i in range(6)}}
+
+    x = _axis_property(0)
+    y = _axis_property(1)
+    z = _axis_property(2)
+    yaw = _axis_property(3)
+    pitch = _axis_property(4)
+    roll = _axis_property(5)
 
     def __init__(self, vals: dict[str, float] | None = None):
-        if vals is not None:
-            for key, value in vals.items():
-                setattr(self, key, value)
+        if vals is None:
+            self._values = array("d", _ZEROS)
+            return
+        try:
+            self._values = array("d", _get_fields(vals))
+        except KeyError:
+            # missing components are 0
+            self._values = array("d", [vals.get(name, 0.0) for name in self.FIELDS])
+
+    @classmethod
+    def from_values(cls, values) -> "VelocityVector":
+        """Build a vector from its six components in FIELDS order."""
+        vector = cls()
+        vector._values = array("d", values)
+        if len(vector._values) != 6:
+            raise ValueError(f"expected 6 components, got {len(vector._values)}")
+        return vector
 
     def __getitem__(self, key):
-        return asdict(self)[key]
+        return self._values[self._INDEX[key]]
 
     def __setitem__(self, key, value):
-        asdict(self)[key] = value
+        self._values[self._INDEX[key]] = value
+
+    def __len__(self):
+        return 6
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __copy__(self):
+        # the backing array is not shared, as with the dataclass this replaced
+        return type(self).from_values(self._values)
+
+    def __deepcopy__(self, memo):
+        return self.__copy__()
+
+    def __eq__(self, other):
+        if not isinstance(other, VelocityVector):
+            return NotImplemented
+        return self._values == other._values
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={value}" for name, value in zip(self.FIELDS, self._values))
+        return f"VelocityVector({fields})"
 
     def keys(self):
         """Return keys."""
-        return asdict(self).keys()
+        return self.FIELDS
+
+    def values(self) -> array:
+        """Return the components in FIELDS order. This is the backing array, not a copy."""
+        return self._values
+
+    def as_array(self) -> np.ndarray:
+        """Return a float64 NumPy view of the components. Writes to it change the vector."""
+        return np.frombuffer(self._values, dtype=np.float64)
 
     def to_dict(self):
         """Return dict representation. Rounds values to 3 decimal places."""
-        return {k: round(v, 3) for k, v in asdict(self).items()}
+        return {k: round(v, 3) for k, v in zip(self.FIELDS, self._values)}
 
 
 class PIDController:
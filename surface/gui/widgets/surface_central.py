@@ -24,6 +24,7 @@ class SurfaceCentralWidget(QWidget):
 
         # telemetry attributes
         self.telemetry_depth = 0
+        self.telemetry_depth_rate = 0
         self.telemetry_velocity = utils.make_xyz_dict(0,0,0)
         self.telemetry_acceleration = utils.make_xyz_dict(0,0,0)
         self.elapsed_timer = QElapsedTimer()
@@ -77,15 +78,16 @@ class SurfaceCentralWidget(QWidget):
         sec = (elapsed_ms // 1000)  % 60
         ms2 = (elapsed_ms  % 1000) // 10
 
-        return f"Depth: {self.telemetry_depth:.2f}\nAcceleration(x, y, z): {self.telemetry_acceleration['x']:.2f}, {self.telemetry_acceleration['y']:.2f}, {self.telemetry_acceleration['z']:.2f}\nTimer: {min:02}:{sec:02}:{ms2:02}"
+        return f"Depth: {self.telemetry_depth:.2f} ({self.telemetry_depth_rate:+.2f} m/s)\nAcceleration(x, y, z): {self.telemetry_acceleration['x']:.2f}, {self.telemetry_acceleration['y']:.2f}, {self.telemetry_acceleration['z']:.2f}\nTimer: {min:02}:{sec:02}:{ms2:02}"
     
     def _format_status_flags_text(self):
         """Helper method to format the status flags text."""
         return f"Agnes Mode {'ON' if self.agnes_mode_flag else 'OFF'}\nMultiplier: {self.agnes_mode_multiplier:.2f}"
 
-    def update_depth(self, depth):
-        """Sets depth on the GUI and updates label"""
+    def update_depth(self, depth, rate=0.0):
+        """Sets depth and its rate on the GUI and updates label"""
         self.telemetry_depth = depth
+        self.telemetry_depth_rate = rate
         self.telemetry.setText(self._format_telemetry_text())
 
     def update_imu(self, imu_data):
@@ -184,6 +184,17 @@ class XBoxDriveController(Controller):
         return self.status_flags
 
 
+    def get_emergency_stop(self) -> bool | None:
+        """back engages the emergency stop, start releases it
+        Returns:
+            bool | None: True to stop, False to release, None if neither is pressed
+        """
+        if self.buttons_dict["back"].get_joy_val():
+            return True
+        if self.buttons_dict["start"].get_joy_val():
+            return False
+        return None
+
     def get_claw_vector(self) -> dict:
         """get the desired claw vector from joystick values"""
         pygame.event.get()  # clear events to get current values (not sure why this is needed)
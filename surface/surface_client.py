@@ -1,15 +1,19 @@
 import argparse
-import json
+import logging
 import os
 import time
 import asyncio
-from common import utils
+from common import codec, log, utils
+from common.scheduler import SKIP, PeriodicScheduler
 import surface.xgui as xgui
 from surface.joystick import XBoxDriveController
 
 HOST = "192.168.0.102"  # The server's hostname or IP address
 PORT = 2049  # The port used by the server
-WRITE_LOOP_FREQ = 100  # Hz
+WRITE_LOOP_FREQ = 100  # Hz, upper bound, the server's control loop rate is used if lower
+HANDSHAKE_TIMEOUT = 2.0  # s to wait for the server's welcome
+
+logger = logging.getLogger("surface.surface_client")
 
 drive_controller = XBoxDriveController(joy_id=0)
 claw_controller = XBoxDriveController(joy_id=1)
@@ -17,11 +21,28 @@ claw_controller = XBoxDriveController(joy_id=1)
 class SurfaceClient:
     """Surface client class."""
 
-    def __init__(self):
+    def __init__(self, use_udp: bool = False, on_change: bool = False):
+        """
+        Args:
+            use_udp (bool): send target_velocity and claw_movement as sequenced datagrams
+                instead of over the tcp connection. status_flags always use tcp.
+            on_change (bool): only send a message when it changed, plus a heartbeat often
+                enough that the server never sees the commands go stale
+        """
         self.loop = asyncio.get_event_loop()
         self.lock = asyncio.Lock()
         self.last_msg = ""
         self.last_update = utils.time_ms()
+        self.use_udp = use_udp
+        self.udp_transport = None
+        self.seq = 0  # sequence number of the next datagram
+        self.on_change = on_change
+        self.send_freq = WRITE_LOOP_FREQ  # Hz, negotiated with the server in run()
+        self.heartbeat_period = 0.0  # s, negotiated with the server in run()
+        self.scheduler = None  # write loop schedule, created once the rate is negotiated
+        self._last_sent = {}  # topic: (snapshot of the last sent value, time it was sent)
+        self.sent = 0
+        self.skipped = 0
         if os.environ.get("SIM"):
             print(f"{'='*10} SIMULATION MODE. Type YES to continue {'='*10}")
             if input() != "YES":
@@ -42,34 +63,102 @@ class SurfaceClient:
     async def run(self):
         """start reader, writer, and parser"""
         reader, writer = await asyncio.open_connection(HOST, PORT)
+        await self._negotiate(reader)
+        publishes = [codec.STATUS_FLAGS, codec.ESTOP]
+        if self.use_udp:
+            self.udp_transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+                asyncio.DatagramProtocol, remote_addr=(HOST, PORT)
+            )
+        else:
+            publishes += [codec.TARGET_VELOCITY, codec.CLAW_MOVEMENT]
+        writer.write(codec.encode(codec.HELLO, {
+            "publish_rate": self.send_freq,
+            "publishes": publishes,
+            "subscribes": {},
+        }))
 
         send_task = asyncio.create_task(self.send_messages(writer))
 
         await asyncio.gather(send_task)
 
+    async def _negotiate(self, reader):
+        """wait for the server's welcome and match the send rate to its control loop"""
+        topic, welcome = await asyncio.wait_for(codec.read_frame(reader), HANDSHAKE_TIMEOUT)
+        if topic != codec.WELCOME:
+            raise RuntimeError(f"expected a welcome from the server, got {topic}")
+        if welcome["version"] != codec.PROTOCOL_VERSION:
+            raise RuntimeError(f"server uses protocol version {welcome['version']}, "
+                               f"this client uses {codec.PROTOCOL_VERSION}")
+        # anything sent faster than the control loop consumes it is thrown away
+        self.send_freq = min(WRITE_LOOP_FREQ, welcome["control_loop_freq"])
+        self.heartbeat_period = welcome["command_timeout"] / 2
+        self.scheduler = PeriodicScheduler(self.send_freq, policy=SKIP, name="write loop")
+        logger.info("negotiated: server control loop %g Hz, sending at %g Hz%s",
+                    welcome["control_loop_freq"], self.send_freq,
+                    f", on change with a {self.heartbeat_period:g} s heartbeat"
+                    if self.on_change else "")
+
+    def _should_send(self, topic: str, snapshot, now: float) -> bool:
+        """whether a message is due: always, or in on_change mode if it changed or a
+        heartbeat is due"""
+        last = self._last_sent.get(topic)
+        if (not self.on_change or last is None or last[0] != snapshot
+                or now - last[1] >= self.heartbeat_period):
+            self._last_sent[topic] = (snapshot, now)
+            self.sent += 1
+            return True
+        self.skipped += 1
+        return False
+
     async def send_messages(self, writer):
         """sends controller inputs to bottomside."""
-        last_send_time = time.time()
-        while True:
+        async for _ in self.scheduler.ticks():
+            estop = drive_controller.get_emergency_stop()
+            if estop is not None:
+                # sent ahead of everything else, on every iteration the button is held
+                writer.write(codec.encode(codec.ESTOP, estop))
+                await writer.drain()
+                logger.warning("emergency stop %s", "engaged" if estop else "released",
+                               extra=log.every(0.5))
             velocity_vec = drive_controller.get_velocity_vector()
             claw_vec = claw_controller.get_claw_vector()
             status_flags = drive_controller.get_status_flags()
-            msg = { 
-                "target_velocity": json.dumps(velocity_vec.to_dict()),
-                "claw_movement": json.dumps(claw_vec),
-                "status_flags": json.dumps(status_flags),
-            }
-            writer.write(str.encode(json.dumps(msg) + "~"))
-            await writer.drain()
-            print(f"sent: {msg}")
-
-            if time.time() - last_send_time < 1 / WRITE_LOOP_FREQ:
-                await asyncio.sleep(1 / WRITE_LOOP_FREQ - (time.time() - last_send_time))
+            now = time.time()
+            # the controllers reuse the same objects, so compare copies
+            send_velocity = self._should_send(codec.TARGET_VELOCITY, velocity_vec.to_dict(), now)
+            send_claw = self._should_send(codec.CLAW_MOVEMENT, dict(claw_vec), now)
+            send_flags = self._should_send(codec.STATUS_FLAGS, dict(status_flags), now)
+            msg = b""
+            if self.udp_transport is not None:
+                if send_velocity:
+                    self.udp_transport.sendto(codec.encode_datagram(
+                        codec.TARGET_VELOCITY, velocity_vec, self.seq, now))
+                if send_claw:
+                    self.udp_transport.sendto(codec.encode_datagram(
+                        codec.CLAW_MOVEMENT, claw_vec, self.seq, now))
+                self.seq += 1
             else:
-                print("Warning: write loop took too long")
-            last_send_time = time.time()
+                if send_velocity:
+                    msg += codec.encode(codec.TARGET_VELOCITY, velocity_vec)
+                if send_claw:
+                    msg += codec.encode(codec.CLAW_MOVEMENT, claw_vec)
+            if send_flags:
+                msg += codec.encode(codec.STATUS_FLAGS, status_flags)
+            if msg:
+                writer.write(msg)
+                await writer.drain()
+            if send_velocity or send_claw or send_flags:
+                logger.debug("sent: %s %s %s", velocity_vec.to_dict(), claw_vec, status_flags,
+                             extra=log.sample(10))
 
 if __name__ == "__main__":
-    surface_client = SurfaceClient()
+    parser = argparse.ArgumentParser(description="Sends controller inputs to the ROV.")
+    parser.add_argument("--udp", action="store_true",
+                        help="send pilot commands over udp instead of tcp")
+    parser.add_argument("--on-change", action="store_true",
+                        help="only send commands when they change, plus a heartbeat")
+    args = parser.parse_args()
+    log.setup()
+    surface_client = SurfaceClient(use_udp=args.udp, on_change=args.on_change)
     asyncio.run(surface_client.run())
 
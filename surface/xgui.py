@@ -12,9 +12,9 @@ import os
 import sys
 import threading
 import asyncio
-import json
-from common import utils
-import time
+from common import codec, log, utils
+from common.delta import DeltaDecoder
+from common.scheduler import SKIP, PeriodicScheduler
 from PyQt5.QtWidgets import QApplication, QWidget
 from PyQt5.QtCore import QtMsgType, QUrl, qInstallMessageHandler
 from surface.gui.widgets.surface_central import SurfaceCentralWidget
@@ -23,9 +23,9 @@ from surface.gui.surface_window import SurfaceWindow
 HOST = "192.168.0.102"  # The server's hostname or IP address
 PORT = 2049  # The port used by the server
 READ_LOOP_FREQ = 5
+TELEMETRY_FREQ = 10  # Hz, rate at which the server sends each subscribed topic
 
-logger = logging.getLogger(__name__)
-logging.basicConfig(format='%(levelname)s:%(message)s')
+logger = logging.getLogger("surface.xgui")
 
 RPATH_TO_SURPRESSED_MESSAGES_FILE = './surpressed_qt_messages.txt'
 PATH_TO_SURPRESSED_MESSAGES_FILE = os.path.join(os.path.dirname(__file__),
@@ -213,7 +213,9 @@ class XguiApplication():
         self.scw = None
         self.loop = asyncio.get_event_loop()
         self.lock = asyncio.Lock()
-        self.last_msg = ""
+        self.last_msg = {}  # topic: newest message that changed since the last GUI refresh
+        self.decoder = DeltaDecoder()
+        self.scheduler = PeriodicScheduler(READ_LOOP_FREQ, policy=SKIP, name="gui refresh")
         self.last_update = utils.time_ms()
         if os.environ.get("SIM"):
             print(f"{'='*10} SIMULATION MODE. Type YES to continue {'='*10}")
@@ -222,7 +224,8 @@ class XguiApplication():
             HOST = "127.0.0.1"
 
         self.depth = 0
-        self.imu_data = ""
+        self.depth_rate = 0
+        self.imu_data = {}
         self.status_flags = {}
     
     def __del__(self):
@@ -230,69 +233,81 @@ class XguiApplication():
 
     async def receive_messages(self, reader):
         """receives sensor information from bottomside."""
-        msg = (await reader.read(1024)).decode("utf-8")
-        print(f"received first message: {msg}")
-        while msg:
+        while True:
+            try:
+                topic, msg = await codec.read_frame(reader)
+            except asyncio.IncompleteReadError:
+                break
+            except codec.CodecError as e:
+                logger.warning("error decoding frame: %s", e, extra=log.every(1.0))
+                continue
+            update = self.decoder.apply(topic, msg)
+            if update is None:
+                continue  # delta before the first keyframe
+            topic, msg, changed = update
             async with self.lock:
-                self.last_msg = msg
+                if changed:
+                    self.last_msg[topic] = msg
                 self.last_update = utils.time_ms()
-            msg = (await reader.read(1024)).decode("utf-8")
-        print("client disconnected, closing parser")
+        logger.info("client disconnected, closing parser")
 
     async def _parse(self):
         """parses received messages."""
-        last_parse_time = time.time()
-        while True:
-            await asyncio.sleep(0.01)
+        async for _ in self.scheduler.ticks():
             async with self.lock:
-                msg = self.last_msg
+                msgs, self.last_msg = self.last_msg, {}
 
-            if msg is None:  # no message received yet
-                await asyncio.sleep(0.01)
+            if not msgs:  # nothing changed since the last refresh
                 continue
 
-            try:
-                json_msg = json.loads(msg)
-            except json.JSONDecodeError as e:
-                print(f"error decoding json: {e} | received: {msg}")
-                await asyncio.sleep(0.01)
-                continue
-
-            if "imu_data" in json_msg:
-                self.imu_data = json_msg["imu_data"]
+            if codec.IMU_DATA in msgs:
+                self.imu_data = msgs[codec.IMU_DATA]
                 if self.scw != None:
                     if hasattr(self.scw, 'update_imu'):
-                        self.scw.update_imu(dict(json.loads(json_msg["imu_data"])))
-                        print(self.imu_data)
+                        self.scw.update_imu(self.imu_data)
+                        logger.debug("imu: %s", self.imu_data, extra=log.sample(10))
                     else:
-                        print("Warning: GUI not fully initialized, skipping update.")
+                        logger.warning("GUI not fully initialized, skipping update.",
+                                       extra=log.every(1.0))
             
-            if "depth" in json_msg:
-                self.depth = float(json.loads(json_msg["depth"]))
+            if codec.DEPTH in msgs:
+                self.depth = msgs[codec.DEPTH]["depth"]
+                self.depth_rate = msgs[codec.DEPTH]["rate"]
                 if self.scw != None:
                     if hasattr(self.scw, 'update_depth'):
-                        self.scw.update_depth(self.depth)
-                        print(self.depth)
+                        self.scw.update_depth(self.depth, self.depth_rate)
+                        logger.debug("depth: %s", self.depth, extra=log.sample(10))
                     else:
-                        print("Warning: GUI not fully initialized, skipping update.")
-            if "status_flags" in json_msg:
-                self.status_flags = dict(json.loads(json_msg["status_flags"]))
+                        logger.warning("GUI not fully initialized, skipping update.",
+                                       extra=log.every(1.0))
+            if codec.STATUS_FLAGS in msgs:
+                self.status_flags = msgs[codec.STATUS_FLAGS]
                 if self.scw != None:
                     if hasattr(self.scw, 'update_status_flags'):
                         self.scw.update_status_flags(self.status_flags)
-                        print(str(self.status_flags))
+                        logger.debug("status flags: %s", self.status_flags)
                     else:
-                        print("Warning: GUI not fully initialized, skipping update.")
-            
-            if time.time() - last_parse_time < 1 / READ_LOOP_FREQ:
-                await asyncio.sleep(1 / READ_LOOP_FREQ - (time.time() - last_parse_time))
-            else:
-                print("Warning: read loop took too long")
-            last_parse_time = time.time()
+                        logger.warning("GUI not fully initialized, skipping update.",
+                                       extra=log.every(1.0))
     
     async def run_asyncio(self):
         """start reader, writer, and parser"""
         reader, writer = await asyncio.open_connection(HOST, PORT)
+        topic, welcome = await codec.read_frame(reader)
+        if topic != codec.WELCOME or welcome["version"] != codec.PROTOCOL_VERSION:
+            raise RuntimeError(f"unexpected handshake from server: {topic} {welcome}")
+        logger.info("negotiated: server control loop %g Hz, telemetry at %g Hz",
+                    welcome["control_loop_freq"], TELEMETRY_FREQ)
+        writer.write(codec.encode(codec.HELLO, {
+            "publish_rate": 0.0,
+            "publishes": [],
+            "subscribes": {
+                codec.IMU_DATA: TELEMETRY_FREQ,
+                codec.DEPTH: TELEMETRY_FREQ,
+                codec.STATUS_FLAGS: TELEMETRY_FREQ,
+            },
+            "delta": [codec.IMU_DATA, codec.DEPTH, codec.STATUS_FLAGS],
+        }))
 
         receive_task = asyncio.create_task(self.receive_messages(reader))
         parse_task = asyncio.create_task(self._parse())
@@ -323,6 +338,7 @@ class XguiApplication():
 
 if __name__ == '__main__':
     args = get_cmdline_args()
+    log.setup()
     gui = XguiApplication(args)
     asyncio_thread = threading.Thread(target=lambda: asyncio.run(gui.run_asyncio()))
     asyncio_thread.start()